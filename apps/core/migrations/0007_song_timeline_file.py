@@ -0,0 +1,18 @@
+# Generated by Django 4.2.25 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_extractionjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='song',
+            name='timeline_file',
+            field=models.FileField(blank=True, upload_to='Timelines/'),
+        ),
+    ]
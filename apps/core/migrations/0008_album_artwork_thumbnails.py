@@ -0,0 +1,18 @@
+# Generated by Django 4.2.25 on 2026-10-19 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_song_timeline_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='artwork_thumbnails',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.25 on 2026-10-19 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_album_artwork_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='song',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
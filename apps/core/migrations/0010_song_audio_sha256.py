@@ -0,0 +1,35 @@
+# Generated by Django 4.2.25 on 2026-10-19 18:00
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def hash_audio_files(apps, schema_editor):
+    Song = apps.get_model("core", "Song")
+    for song in Song.objects.exclude(audio_file="").only("id", "audio_file"):
+        sha = hashlib.sha256()
+        try:
+            with song.audio_file.open("rb") as file:
+                for chunk in iter(lambda: file.read(2**20), b""):
+                    sha.update(chunk)
+        except (OSError, ValueError):
+            # missing file, the song just cannot be matched by its content
+            continue
+        Song.objects.filter(id=song.id).update(audio_sha256=sha.hexdigest())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_song_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='song',
+            name='audio_sha256',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.RunPython(hash_audio_files, migrations.RunPython.noop),
+    ]
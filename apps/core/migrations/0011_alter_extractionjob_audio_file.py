@@ -0,0 +1,18 @@
+# Generated by Django 4.2.25 on 2026-10-19 20:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_song_audio_sha256'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='extractionjob',
+            name='audio_file',
+            field=models.FileField(upload_to='Uploads/'),
+        ),
+    ]
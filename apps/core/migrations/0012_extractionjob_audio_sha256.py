@@ -0,0 +1,18 @@
+# Generated by Django 4.2.25 on 2026-10-19 21:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_alter_extractionjob_audio_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionjob',
+            name='audio_sha256',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+    ]
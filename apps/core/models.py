@@ -49,6 +49,8 @@ class Album(models.Model):
     artwork_file = models.FileField(upload_to="Album_Art/")
     album_name = models.CharField(max_length=255, null=True, blank=True)
     artist = models.CharField(max_length=255, null=True, blank=True)
+    # format -> size -> storage name of the thumbnails, see apps/songs/artwork.py
+    artwork_thumbnails = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return f"Artwork {self.id}"
@@ -59,6 +61,14 @@ class Album(models.Model):
             return self.artwork_file.url
         return None
 
+    @property
+    def artwork_thumbnail_urls(self):
+        storage = self.artwork_file.storage
+        return {
+            image_format: {size: storage.url(name) for size, name in sizes.items()}
+            for image_format, sizes in self.artwork_thumbnails.items()
+        }
+
 
 class Song(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -75,6 +85,12 @@ class Song(models.Model):
         blank=True,
     )
     audio_file = models.FileField(upload_to="Audio/")
+    # SHA-256 of the audio file, an upload of the same file resolves to this song instead of creating another one
+    audio_sha256 = models.CharField(max_length=64, blank=True, default="", db_index=True)
+    # frame level features and structure for the timeline endpoint, see apps/songs/timeline.py
+    timeline_file = models.FileField(upload_to="Timelines/", blank=True)
+    # rendition name -> storage name of the low bitrate streaming versions, see apps/songs/renditions.py
+    renditions = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return f"{self.title} by {self.artist}" + (f" from {self.album_name}" if self.album_name else "")
@@ -91,8 +107,55 @@ class Song(models.Model):
             return self.audio_file.url
         return None
 
+    @property
+    def rendition_urls(self):
+        return {rendition: self.audio_file.storage.url(name) for rendition, name in self.renditions.items()}
+
     @property
     def artwork_url(self):
         if self.album:
             return self.album.artwork_file.url
         return None
+
+    @property
+    def artwork_thumbnail_urls(self):
+        if self.album:
+            return self.album.artwork_thumbnail_urls
+        return {}
+
+
+class ExtractionJob(models.Model):
+    """
+    Feature extraction of an uploaded song running in the background.
+    The song is only created (and visible to the recommender) once its features are complete.
+    """
+
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    title = models.CharField(max_length=255)
+    artist = models.CharField(max_length=255)
+    album = models.ForeignKey(Album, on_delete=models.SET_NULL, related_name="+", null=True, blank=True)
+    # not served as media until the song is created, the file then moves to the Audio/ directory of the songs
+    audio_file = models.FileField(upload_to="Uploads/")
+    # SHA-256 of the upload, a second upload of the same file while this job is queued or running resolves to it
+    audio_sha256 = models.CharField(max_length=64, blank=True, default="", db_index=True)
+    # stage name -> {"status": ..., "time_s": ..., "cached": ...}
+    stages = models.JSONField(default=dict)
+    error = models.TextField(blank=True, default="")
+    song = models.ForeignKey(Song, on_delete=models.SET_NULL, related_name="+", null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Extraction of {self.title} by {self.artist} ({self.status})"
@@ -0,0 +1,28 @@
+import resource
+import sys
+from typing import Dict
+
+
+def get_memory_usage() -> Dict[str, int]:
+    """
+    Memory usage of the current process in bytes.
+    rss_anon is private memory, rss_file is memory backed by (shareable) files such as memory mapped models.
+    pss splits shared pages between the processes that map them, which makes it the fair per worker number.
+    :return: Dictionary with rss, rss_anon, rss_file, pss and peak_rss (entries the OS does not report are missing)
+    """
+    usage = {}
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    usage["peak_rss"] = peak if sys.platform == "darwin" else peak * 1024
+
+    fields = {"VmRSS": "rss", "RssAnon": "rss_anon", "RssFile": "rss_file", "Pss": "pss"}
+    for proc_file in ("/proc/self/status", "/proc/self/smaps_rollup"):
+        try:
+            with open(proc_file) as f:
+                for line in f:
+                    key, _, value = line.partition(":")
+                    if key in fields and value.strip().endswith("kB"):
+                        usage[fields[key]] = int(value.split()[0]) * 1024
+        except OSError:
+            pass
+    return usage
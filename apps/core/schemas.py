@@ -21,6 +21,8 @@ class AlbumSchema(Schema):
     album_name: str
     artist: str
     artwork_url: str
+    # format (webp, jpeg) -> edge length -> URL
+    artwork_thumbnail_urls: Dict[str, Dict[str, str]] = {}
 
 
 class SongFeaturesSchema(Schema):
@@ -49,7 +51,10 @@ class SongSchema(Schema):
     features: SongFeaturesSchema
     genres: SongGenresSchema
     song_url: Optional[str]
+    # rendition name (codec and kbit/s, e.g. opus_64) -> URL, the original is song_url
+    rendition_urls: Dict[str, str] = {}
     artwork_url: Optional[str]
+    artwork_thumbnail_urls: Dict[str, Dict[str, str]] = {}
 
 
 Playlist = List[SongSchema]
@@ -0,0 +1,137 @@
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+# single byte range, "bytes=start-end", "bytes=start-" or "bytes=-suffix_length"
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class _FileRange:
+    """
+    The bytes start..end of a file for FileResponse. Keeps fileno, so a WSGI server with sendfile (gunicorn) sends the
+    range (from the file position, Content-Length bytes) without copying it through Python.
+    """
+
+    def __init__(self, file, start: int, end: int):
+        self.file = file
+        self.name = file.name
+        self.remaining = end - start + 1
+        file.seek(start)
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self) -> int:
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def _etag(stat: os.stat_result) -> str:
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match uses the weak comparison, proxies that compress responses turn the ETag into W/"..." """
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+
+
+def _byte_range(header: str, size: int):
+    """
+    :return: Tuple of the first and last byte of a Range header, None to send the whole file, False if unsatisfiable
+    """
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        # multiple ranges or another unit, the whole file is a valid answer
+        return None
+    start, end = match.groups()
+    if start == "":
+        # the last bytes
+        start, end = max(0, size - int(end)), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+@require_safe
+def serve_media(request, path: str):
+    """
+    Serve a file of the MEDIA_PUBLIC_PREFIXES directories with Range (206), ETag/If-None-Match and long cache headers.
+    With MEDIA_FRONT_PROXY the front proxy sends the file (X-Accel-Redirect or X-Sendfile), otherwise FileResponse.
+    """
+    path = posixpath.normpath(path).lstrip("/")
+    if not path.startswith(tuple(settings.MEDIA_PUBLIC_PREFIXES)):
+        raise Http404("Not found")
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except ValueError:
+        raise Http404("Not found")
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404("Not found")
+    if not os.path.isfile(full_path):
+        raise Http404("Not found")
+
+    etag = _etag(stat)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(stat.st_mtime),
+        "Cache-Control": f"public, max-age={settings.MEDIA_CACHE_MAX_AGE}",
+        "Accept-Ranges": "bytes",
+    }
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        response = HttpResponseNotModified()
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    if settings.MEDIA_FRONT_PROXY:
+        # the proxy handles the ranges and streams the file, the worker is free right away
+        response = HttpResponse()
+        del response["Content-Type"]
+        if settings.MEDIA_FRONT_PROXY == "x-accel-redirect":
+            response["X-Accel-Redirect"] = settings.MEDIA_X_ACCEL_PREFIX.rstrip("/") + "/" + quote(path)
+        else:
+            response["X-Sendfile"] = full_path
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    byte_range = None
+    range_header = request.headers.get("Range")
+    # If-Range: only send the range if the client still has this version of the file
+    if range_header and request.headers.get("If-Range", etag) == etag:
+        byte_range = _byte_range(range_header, stat.st_size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{stat.st_size}"
+        return response
+
+    file = open(full_path, "rb")
+    if byte_range is None:
+        response = FileResponse(file)
+    else:
+        start, end = byte_range
+        response = FileResponse(_FileRange(file, start, end), status=206)
+        response["Content-Length"] = str(end - start + 1)
+        response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+    for header, value in headers.items():
+        response[header] = value
+    return response
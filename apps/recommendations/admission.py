@@ -0,0 +1,192 @@
+import math
+import select
+import socket
+import ssl
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+
+class ServiceOverloaded(Exception):
+    """Raised when a request is not admitted, because it would wait longer than the deadline."""
+
+    def __init__(self, retry_after_s: float):
+        super().__init__("The server is busy, please try again later.")
+        self.retry_after_s = max(1, math.ceil(retry_after_s))
+
+
+class ClientDisconnected(Exception):
+    """Raised when the client went away while its request was waiting for an inference slot."""
+
+
+def _client_socket(request) -> Tuple[Optional[socket.socket], bool]:
+    """
+    The client socket of a request, found below wsgi.input for runserver (rfile/_sock) and gunicorn's sync and gthread
+    workers (reader/unreader/sock), or through uWSGI's connection_fd.
+    :return: Tuple of the socket (None for other servers and ASGI) and whether it is a duplicate the caller closes
+    """
+    try:
+        import uwsgi
+
+        # a duplicate of the descriptor, closing it does not close the connection
+        return socket.fromfd(uwsgi.connection_fd(), socket.AF_INET, socket.SOCK_STREAM), True
+    except (ImportError, AttributeError, OSError):
+        pass
+
+    stream = request.META.get("wsgi.input")
+    for _ in range(8):
+        if stream is None or isinstance(stream, socket.socket):
+            break
+        stream = next(
+            (
+                getattr(stream, a)
+                for a in ("stream", "_stream", "reader", "unreader", "rfile", "raw", "_sock", "sock")
+                if hasattr(stream, a)
+            ),
+            None,
+        )
+    # MSG_PEEK is not possible through TLS
+    if not isinstance(stream, socket.socket) or isinstance(stream, ssl.SSLSocket):
+        return None, False
+    return stream, False
+
+
+def client_disconnected(request) -> bool:
+    """
+    Best effort check whether the client of a request closed its connection.
+    Works with runserver, gunicorn (sync and gthread workers, without TLS termination in gunicorn) and uWSGI,
+    otherwise (e.g. ASGI servers) always False.
+    :param request: Django request
+    :return: True if the connection is known to be closed
+    """
+    client, duplicate = _client_socket(request)
+    if client is None:
+        return False
+    try:
+        readable, _, _ = select.select([client], [], [], 0)
+        # a readable socket without any data is closed by the peer
+        return bool(readable) and client.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b""
+    except (OSError, ValueError):
+        return True
+    finally:
+        if duplicate:
+            client.close()
+
+
+class InferenceGate:
+    """
+    Bounded queue in front of the CPU heavy speech inference.
+    At most max_concurrency requests run at once, at most max_queue_size wait for a slot. Requests that would wait
+    longer than max_wait_s are rejected immediately instead of piling up until every request times out.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue_size: int, max_wait_s: float):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue_size = max(0, max_queue_size)
+        self.max_wait_s = max_wait_s
+
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._running = 0
+        # exponentially weighted moving average of the inference time, used to estimate the wait of new requests
+        self._service_time_s = None
+        self._wait_times_s = deque(maxlen=1024)
+        self._counters = {
+            "admitted": 0,
+            "completed": 0,
+            "rejected_queue_full": 0,
+            "rejected_estimated_wait": 0,
+            "rejected_timeout": 0,
+            "cancelled": 0,
+        }
+
+    def _estimated_wait_s(self) -> float:
+        if self._service_time_s is None:
+            return 0.0
+        ahead = self._waiting + self._running - self.max_concurrency + 1
+        return max(0, ahead) / self.max_concurrency * self._service_time_s
+
+    @contextmanager
+    def admit(self, is_cancelled: Optional[Callable[[], bool]] = None):
+        """
+        Wait for an inference slot.
+        :param is_cancelled: Polled while waiting; the request is dropped once it returns True
+        :raises ServiceOverloaded: If the queue is full or the request waited longer than max_wait_s
+        :raises ClientDisconnected: If is_cancelled returned True while waiting
+        """
+        with self._lock:
+            estimated_wait_s = self._estimated_wait_s()
+            if self._waiting >= self.max_queue_size and self._running >= self.max_concurrency:
+                self._counters["rejected_queue_full"] += 1
+                raise ServiceOverloaded(estimated_wait_s)
+            if estimated_wait_s > self.max_wait_s:
+                self._counters["rejected_estimated_wait"] += 1
+                raise ServiceOverloaded(estimated_wait_s)
+            self._waiting += 1
+
+        start = time.monotonic()
+        deadline = start + self.max_wait_s
+        try:
+            while not self._slots.acquire(timeout=min(0.05, max(0.0, deadline - time.monotonic()))):
+                if is_cancelled is not None and is_cancelled():
+                    with self._lock:
+                        self._counters["cancelled"] += 1
+                    raise ClientDisconnected()
+                if time.monotonic() >= deadline:
+                    with self._lock:
+                        self._counters["rejected_timeout"] += 1
+                        retry_after_s = self._estimated_wait_s()
+                    raise ServiceOverloaded(retry_after_s)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+        # the client may have left while this request was queued, skip the inference in that case
+        if is_cancelled is not None and is_cancelled():
+            self._slots.release()
+            with self._lock:
+                self._counters["cancelled"] += 1
+            raise ClientDisconnected()
+
+        started = time.monotonic()
+        with self._lock:
+            self._running += 1
+            self._counters["admitted"] += 1
+            self._wait_times_s.append(started - start)
+        try:
+            yield
+        finally:
+            service_time_s = time.monotonic() - started
+            with self._lock:
+                self._running -= 1
+                self._counters["completed"] += 1
+                if self._service_time_s is None:
+                    self._service_time_s = service_time_s
+                else:
+                    self._service_time_s = 0.8 * self._service_time_s + 0.2 * service_time_s
+            self._slots.release()
+
+    def metrics(self) -> dict:
+        """
+        :return: Current queue depth, wait time statistics of the last requests and counters
+        """
+        with self._lock:
+            wait_times = np.array(self._wait_times_s) if self._wait_times_s else np.zeros(1)
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue_size": self.max_queue_size,
+                "max_wait_s": self.max_wait_s,
+                "queue_depth": self._waiting,
+                "running": self._running,
+                "estimated_wait_s": self._estimated_wait_s(),
+                "service_time_s": self._service_time_s or 0.0,
+                "wait_time_p50_s": float(np.percentile(wait_times, 50)),
+                "wait_time_p99_s": float(np.percentile(wait_times, 99)),
+                "wait_time_max_s": float(np.max(wait_times)),
+                **self._counters,
+            }
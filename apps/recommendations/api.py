@@ -5,17 +5,19 @@ from ninja.errors import HttpError
 from ninja.files import UploadedFile
 
 from apps.core.schemas import SongFeaturesSchema
-from apps.session.schemas import SessionData
+from apps.session.store import emotion_state_store, get_session_key
 
+from .admission import client_disconnected
 from .methods import (
     calculate_array_switch_probability,
     get_emotion_features_from_speech,
     get_song_recommendation,
+    inference_gate,
     update_session_data,
 )
 from .recommender.consts import GENRE_DATA_BASE
-from .recommender.methods import generate_playlist
-from .schemas import RecommendFromSpeechResponseSchema
+from .recommender.methods import generate_playlist, generate_segment_playlist
+from .schemas import InferenceQueueMetricsSchema, RecommendFromSpeechResponseSchema
 
 router = Router(tags=["recommendations"])
 
@@ -36,10 +38,11 @@ def recommend_from_speech(
     valence_weight: Optional[float] = 0.5,
     invert_arousal: Optional[bool] = False,
     invert_valence: Optional[bool] = False,
+    segments: Optional[bool] = False,
 ):
-    session_data = request.session.get("data", SessionData().model_dump())
+    session_key = get_session_key(request)
 
-    emotion_features = get_emotion_features_from_speech(file)
+    emotion_features = get_emotion_features_from_speech(file, is_cancelled=lambda: client_disconnected(request))
 
     valence = emotion_features.valence
     arousal = emotion_features.arousal
@@ -61,7 +64,14 @@ def recommend_from_speech(
         bpm=bpm,
     )
 
-    playlist = generate_playlist(genre=genre, features=features)
+    # with segments, songs start at their segment closest to the features (if the segment index was built)
+    segment_starts = {}
+    if segments:
+        segment_playlist = generate_segment_playlist(genre=genre, features=features)
+        segment_starts = {song.id: start_s for song, start_s in segment_playlist}
+        playlist = [song for song, _ in segment_playlist]
+    if not segment_starts:
+        playlist = generate_playlist(genre=genre, features=features)
 
     if len(playlist) == 0:
         raise HttpError(
@@ -69,19 +79,24 @@ def recommend_from_speech(
             "No recommendation could be generated. This is probably because the song library is empty or you have set filters for which no song could be found within the library.",
         )
 
-    session_data = update_session_data(valence, arousal, session_data)
+    # the updated session data is saved at the end of the block, requests of the session run it one at a time
+    with emotion_state_store.session(session_key) as session_data:
+        update_session_data(valence, arousal, session_data)
 
-    session_data["old_mean"], switch_probability = calculate_array_switch_probability(
-        session_data, arousal_weight, valence_weight
-    )
-
-    song = get_song_recommendation(playlist, session_data["songs_played"])
+        session_data.old_mean, switch_probability = calculate_array_switch_probability(
+            session_data, arousal_weight, valence_weight
+        )
 
-    # save updated session data
-    request.session["data"] = session_data
+        song = get_song_recommendation(playlist, session_data.songs_played)
 
     return RecommendFromSpeechResponseSchema(
         song=song,
         speech_features=emotion_features,
-        switch_probability=switch_probability
+        switch_probability=switch_probability,
+        start_s=segment_starts.get(song.id),
     )
+
+
+@router.get("/metrics", response=InferenceQueueMetricsSchema)
+def inference_queue_metrics(request):
+    return inference_gate.metrics()
@@ -0,0 +1,137 @@
+import csv
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .processor import SERProcessor
+
+AUDIO_EXTENSIONS = (".wav", ".flac", ".mp3", ".ogg", ".opus", ".m4a", ".aac", ".webm")
+
+RESULT_COLUMNS = ["path", "duration_s", "valence", "arousal", "dominance", "error"]
+
+
+def collect_audio_files(source: str) -> List[str]:
+    """
+    Collect the audio files of a corpus.
+    :param source: Directory that is searched recursively or a manifest file (one path per line, first CSV column)
+    :return: Sorted list of audio file paths
+    """
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            paths.extend(os.path.join(root, f) for f in files if f.lower().endswith(AUDIO_EXTENSIONS))
+        return sorted(paths)
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    paths = []
+    with open(source, "r", encoding="utf-8", newline="") as manifest:
+        for row in csv.reader(manifest):
+            if not row or not row[0].strip() or row[0].startswith("#"):
+                continue
+            path = row[0].strip()
+            if not path.lower().endswith(AUDIO_EXTENSIONS):
+                # header line or a non audio entry
+                continue
+            paths.append(path if os.path.isabs(path) else os.path.join(base_dir, path))
+    return paths
+
+
+def read_checkpoint(path: str) -> Set[str]:
+    """
+    Read the paths that were already processed by an earlier (interrupted) run.
+    :param path: Path of the result CSV file
+    :return: Set of processed audio file paths
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        return {row["path"] for row in csv.DictReader(file)}
+
+
+def decode_files(
+    serprocessor: SERProcessor, paths: Iterable[str], workers: int = 4
+) -> Iterator[Tuple[str, Optional[np.ndarray], Optional[str]]]:
+    """
+    Decode audio files in a thread pool. librosa releases the GIL while decoding and resampling.
+    :param serprocessor: SERProcessor used to decode the files
+    :param paths: Audio file paths
+    :param workers: Number of decoding threads
+    :return: Iterator of (path, samples, error message) in the order of paths
+    """
+
+    def _decode(path):
+        try:
+            return path, serprocessor.load_audio(path), None
+        except Exception as e:
+            return path, None, str(getattr(e, "message", e))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(_decode, paths)
+
+
+def length_buckets(items: List[Tuple[str, np.ndarray]], batch_size: int) -> List[List[Tuple[str, np.ndarray]]]:
+    """
+    Sort decoded clips by length and split them into batches, so clips in one batch need as little padding as possible.
+    :param items: List of (path, samples)
+    :param batch_size: Maximum number of clips per batch
+    :return: List of batches
+    """
+    items = sorted(items, key=lambda item: len(item[1]))
+    return [items[i : i + batch_size] for i in range(0, len(items), batch_size)]
+
+
+class ResultWriter:
+    """
+    Appends results to a CSV file and flushes after every chunk, which makes the file double as the checkpoint.
+    """
+
+    def __init__(self, path: str, embedding_size: int = 0):
+        self.path = path
+        self.columns = RESULT_COLUMNS + [f"embedding_{i}" for i in range(embedding_size)]
+        write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not write_header:
+            # a resumed run appends, its rows have to match the columns of the existing file
+            with open(path, "r", encoding="utf-8", newline="") as file:
+                header = next(csv.reader(file), [])
+            if header != self.columns:
+                raise ValueError(
+                    f"{path} has {len(header)} columns, this run writes {len(self.columns)} "
+                    "(was it started with a different --embeddings setting?)"
+                )
+        self._file = open(path, "a", encoding="utf-8", newline="")
+        self._writer = csv.writer(self._file)
+        if write_header:
+            self._writer.writerow(self.columns)
+
+    def write_result(self, path: str, duration_s: float, result: SERProcessor.SpeechEmotionResult):
+        row = [path, round(duration_s, 3), float(result.valence), float(result.arousal), float(result.dominance), ""]
+        if len(self.columns) > len(RESULT_COLUMNS):
+            row.extend(np.asarray(result.embedding, dtype=np.float32).tolist())
+        self._writer.writerow(row)
+
+    def write_error(self, path: str, error: str):
+        self._writer.writerow([path, "", "", "", "", error] + [""] * (len(self.columns) - len(RESULT_COLUMNS)))
+
+    def flush(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def convert_to_parquet(csv_path: str, parquet_path: str):
+    """
+    Convert the result CSV to Parquet. Requires pyarrow or fastparquet.
+    :param csv_path: Path of the result CSV file
+    :param parquet_path: Path of the Parquet file
+    """
+    import pandas as pd
+
+    df = pd.read_csv(csv_path, keep_default_na=True)
+    df["error"] = df["error"].fillna("").astype(str)
+    embedding_columns = [c for c in df.columns if c.startswith("embedding_")]
+    df[embedding_columns] = df[embedding_columns].astype(np.float32)
+    df.to_parquet(parquet_path, index=False)
@@ -44,11 +44,19 @@ class EmotionModel(Wav2Vec2PreTrainedModel):
         self.classifier = RegressionHead(config)
         self.init_weights()
 
-    def forward(self, input_values):
+    def forward(self, input_values, attention_mask=None):
 
-        outputs = self.wav2vec2(input_values)
+        outputs = self.wav2vec2(input_values, attention_mask=attention_mask)
         hidden_states = outputs[0]
-        hidden_states = torch.mean(hidden_states, dim=1)
+
+        if attention_mask is None:
+            hidden_states = torch.mean(hidden_states, dim=1)
+        else:
+            # Only pool over the frames of the actual signal, so zero padding of a batch does not shift the result
+            frame_mask = self._get_feature_vector_attention_mask(hidden_states.shape[1], attention_mask)
+            frame_mask = frame_mask.unsqueeze(-1).to(hidden_states.dtype)
+            hidden_states = (hidden_states * frame_mask).sum(dim=1) / frame_mask.sum(dim=1).clamp(min=1)
+
         logits = self.classifier(hidden_states)
 
         return hidden_states, logits
@@ -0,0 +1,28 @@
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SER_MODEL_NAME = "audeering/wav2vec2-large-robust-12-ft-emotion-msp-dim"
+
+# Local copy of the SER model created by the download_ser_model command. When set, the model is memory mapped from
+# this directory without any Hub access, so forked workers share the weight pages.
+SER_MODEL_DIR = os.getenv("SER_MODEL_DIR", "")
+
+# Clip lengths (seconds) that speech inputs are padded up to. A fixed set of input shapes lets every bucket be
+# compiled once during warm-up instead of paying eager dispatch (or recompilation) for every new input length.
+SER_LENGTH_BUCKETS_S = [float(s) for s in os.getenv("SER_LENGTH_BUCKETS_S", "2,4,8,15,30,60").split(",") if s.strip()]
+
+# How the bucketed inference path is optimized: "none" (eager), "compile" (torch.compile) or "trace" (TorchScript)
+SER_COMPILE_MODE = os.getenv("SER_COMPILE_MODE", "none")
+
+# Intra-op threads of every worker process. 0 keeps the torch default (all cores), which oversubscribes the CPU as
+# soon as more than one worker runs inference.
+SER_NUM_THREADS = int(os.getenv("SER_NUM_THREADS", "0"))
+
+# Admission control of the speech endpoint: concurrent inferences per worker process, the number of requests that may
+# wait for a slot and the longest (estimated) wait before a request is rejected with 503 instead of being queued.
+SER_MAX_CONCURRENCY = int(os.getenv("SER_MAX_CONCURRENCY", "1"))
+SER_MAX_QUEUE_SIZE = int(os.getenv("SER_MAX_QUEUE_SIZE", "8"))
+SER_MAX_QUEUE_WAIT_S = float(os.getenv("SER_MAX_QUEUE_WAIT_S", "5"))
@@ -0,0 +1,97 @@
+import json
+import mmap
+import os
+import struct
+from typing import Dict
+
+import torch
+from transformers import Wav2Vec2Config, Wav2Vec2Processor
+
+from .classifier import EmotionModel
+
+WEIGHTS_NAME = "model.safetensors"
+
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+def is_model_cached(model_dir: str) -> bool:
+    return bool(model_dir) and os.path.isfile(os.path.join(model_dir, WEIGHTS_NAME))
+
+
+def save_model_to_cache(model_name: str, model_dir: str):
+    """
+    Download the processor and model from the Hub once and store them as safetensors in a local directory.
+    :param model_name: Hub model id
+    :param model_dir: Target directory
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    Wav2Vec2Processor.from_pretrained(model_name).save_pretrained(model_dir)
+    model = EmotionModel.from_pretrained(model_name)
+    # one unsharded file, so the whole model is a single mapping
+    model.save_pretrained(model_dir, safe_serialization=True, max_shard_size="100GB")
+
+
+def mmap_safetensors(path: str) -> Dict[str, torch.Tensor]:
+    """
+    Map a safetensors file into memory and create tensors that point directly into the mapping.
+    The mapping is private copy-on-write: pages stay shared with the page cache (and between forked workers)
+    as long as the weights are not modified, which inference never does.
+    :param path: Path of the safetensors file
+    :return: State dict of tensors backed by the mapping
+    """
+    with open(path, "rb") as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    header_size = struct.unpack("<Q", buffer[:8])[0]
+    header = json.loads(buffer[8 : 8 + header_size])
+    header.pop("__metadata__", None)
+    data_start = 8 + header_size
+
+    state_dict = {}
+    for name, info in header.items():
+        dtype = SAFETENSORS_DTYPES[info["dtype"]]
+        start, end = info["data_offsets"]
+        if start == end:
+            state_dict[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        count = (end - start) // torch.empty((), dtype=dtype).element_size()
+        tensor = torch.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + start)
+        state_dict[name] = tensor.reshape(info["shape"])
+    return state_dict
+
+
+def load_model_from_cache(model_dir: str):
+    """
+    Load processor and model from a local directory without any Hub access.
+    The weights are memory mapped and assigned to the model without copying them into private memory.
+    :param model_dir: Directory created by save_model_to_cache
+    :return: Tuple of the processor and the model
+    """
+    processor = Wav2Vec2Processor.from_pretrained(model_dir, local_files_only=True)
+    config = Wav2Vec2Config.from_pretrained(model_dir, local_files_only=True)
+
+    # build the model without allocating (and randomly initializing) weights that are replaced right away
+    with torch.device("meta"):
+        model = EmotionModel(config)
+
+    try:
+        model.load_state_dict(mmap_safetensors(os.path.join(model_dir, WEIGHTS_NAME)), strict=True, assign=True)
+        if any(t.is_meta for t in list(model.parameters()) + list(model.buffers())):
+            raise RuntimeError("not all weights were found in the safetensors file")
+    except RuntimeError as e:
+        # e.g. a cache written by a transformers version with different parameter names
+        print(f"Could not memory map the SER model ({e}), loading it regularly.", flush=True)
+        model = EmotionModel.from_pretrained(model_dir, local_files_only=True)
+
+    return processor, model
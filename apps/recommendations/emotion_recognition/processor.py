@@ -1,4 +1,6 @@
+import time
 from dataclasses import dataclass
+from typing import Dict, List, Optional
 
 import librosa
 import numpy as np
@@ -9,6 +11,14 @@ from transformers import Wav2Vec2Processor
 from typing_extensions import Final
 
 from .classifier import EmotionModel
+from .consts import (
+    SER_COMPILE_MODE,
+    SER_LENGTH_BUCKETS_S,
+    SER_MODEL_DIR,
+    SER_MODEL_NAME,
+    SER_NUM_THREADS,
+)
+from .model_cache import is_model_cached, load_model_from_cache
 
 # based on: https://huggingface.co/audeering/wav2vec2-large-robust-12-ft-emotion-msp-dim
 
@@ -21,20 +31,118 @@ class SERProcessor:
         arousal: np.float32
         dominance: np.float32
         valence: np.float32
+        embedding: Optional[np.ndarray] = None
 
-    def __init__(self, max_length: int = 60):
+    def __init__(
+        self,
+        max_length: int = 60,
+        length_buckets: List[float] = SER_LENGTH_BUCKETS_S,
+        compile_mode: str = SER_COMPILE_MODE,
+        num_threads: int = SER_NUM_THREADS,
+        model_dir: str = SER_MODEL_DIR,
+    ):
+        if compile_mode not in ("none", "compile", "trace"):
+            raise ValueError(f"Unknown compile mode '{compile_mode}', use 'none', 'compile' or 'trace'")
+        if num_threads > 0:
+            torch.set_num_threads(num_threads)
+
+        start = time.perf_counter()
         self._device = "cuda:0" if torch.cuda.is_available() else "cpu"
-        model_name = "audeering/wav2vec2-large-robust-12-ft-emotion-msp-dim"
-        self._processor = Wav2Vec2Processor.from_pretrained(model_name)
-        self._model = EmotionModel.from_pretrained(model_name).to(self._device)
+        if is_model_cached(model_dir):
+            self._processor, model = load_model_from_cache(model_dir)
+        else:
+            if model_dir:
+                print(f"No SER model in {model_dir}, run 'manage.py download_ser_model'. Using the Hub.", flush=True)
+            self._processor = Wav2Vec2Processor.from_pretrained(SER_MODEL_NAME)
+            model = EmotionModel.from_pretrained(SER_MODEL_NAME)
+        self._model = model.to(self._device)
+        self._model.eval()
+        self.load_time_s = time.perf_counter() - start
         self._max_length = max_length
         self._max_length_samples = max_length * self.SAMPLE_RATE
 
-    def process_audio_file(self, file) -> SpeechEmotionResult:
+        # bucket sizes in samples, the maximum length always being the last bucket
+        self._buckets = sorted(
+            {int(s * self.SAMPLE_RATE) for s in length_buckets if s < max_length} | {self._max_length_samples}
+        )
+        self._compile_mode = compile_mode
+        self._bucket_models: Dict[int, torch.nn.Module] = {}
+        if compile_mode != "none":
+            self.warm_up()
+
+    @property
+    def embedding_size(self) -> int:
+        return self._model.config.hidden_size
+
+    @property
+    def buckets(self) -> List[int]:
+        return list(self._buckets)
+
+    def bucket_length(self, num_samples: int) -> int:
         """
-        Process audio file
+        Get the length an input is padded to
+        :param num_samples: Length of the input in samples
+        :return: Length of the smallest bucket that fits the input
+        """
+        for bucket in self._buckets:
+            if num_samples <= bucket:
+                return bucket
+        return self._buckets[-1]
+
+    def warm_up(self) -> Dict[int, float]:
+        """
+        Run one forward pass per bucket, which compiles (or traces) the model for every bucket shape.
+        :return: Seconds spent per bucket
+        """
+        timings = {}
+        for bucket in self._buckets:
+            start = time.perf_counter()
+            self._bucketed_forward(np.zeros(self.SAMPLE_RATE // 10, dtype=np.float32), bucket)
+            timings[bucket] = time.perf_counter() - start
+        return timings
+
+    def _get_bucket_model(self, bucket: int, example_inputs) -> torch.nn.Module:
+        model = self._bucket_models.get(bucket)
+        if model is not None:
+            return model
+
+        if self._compile_mode == "compile":
+            # a single compiled module specializes on every bucket shape it sees, one graph per bucket
+            model = next(iter(self._bucket_models.values()), None)
+            if model is None:
+                model = torch.compile(self._model, dynamic=False)
+        elif self._compile_mode == "trace":
+            with torch.no_grad():
+                model = torch.jit.trace(self._model, example_inputs, check_trace=False, strict=False)
+                model = torch.jit.optimize_for_inference(torch.jit.freeze(model))
+        else:
+            model = self._model
+
+        self._bucket_models[bucket] = model
+        return model
+
+    def _bucketed_forward(self, input_values: np.ndarray, bucket: int):
+        """
+        Zero pad a normalized input to the bucket length and run the model for that bucket
+        :param input_values: Normalized input values of a single clip
+        :param bucket: Bucket length in samples
+        :return: Tuple of the pooled hidden states and the logits
+        """
+        padded = np.zeros((1, bucket), dtype=np.float32)
+        padded[0, : len(input_values)] = input_values[:bucket]
+        attention_mask = np.zeros((1, bucket), dtype=np.int64)
+        attention_mask[0, : len(input_values)] = 1
+
+        inputs = (torch.from_numpy(padded).to(self._device), torch.from_numpy(attention_mask).to(self._device))
+        model = self._get_bucket_model(bucket, inputs)
+        with torch.inference_mode():
+            return model(*inputs)
+
+    def load_audio(self, file) -> np.ndarray:
+        """
+        Decode an audio file to mono samples at the model sample rate
         :param file: Path to the audio file or a file-like object
-        :return: SpeechEmotionResult or list of SpeechEmotionResults
+        :return: Audio samples as a numpy array
         """
         try:
             samples = librosa.load(file, sr=self.SAMPLE_RATE, mono=True)[0]
@@ -49,7 +157,40 @@ class SERProcessor:
         if len(samples) > self._max_length_samples:
             raise HttpError(400, f"Audio file is longer than the maximum specified length ({self._max_length} seconds)")
 
-        return self._audio_to_speech_emotion(samples)
+        return samples
+
+    def process_audio_file(self, file) -> SpeechEmotionResult:
+        """
+        Process audio file
+        :param file: Path to the audio file or a file-like object
+        :return: SpeechEmotionResult or list of SpeechEmotionResults
+        """
+        return self._audio_to_speech_emotion(self.load_audio(file))
+
+    def process_batch(self, batch: List[np.ndarray], embeddings: bool = False) -> List[SpeechEmotionResult]:
+        """
+        Process several audio snippets in a single forward pass.
+        The snippets are zero padded to the longest one, so batches of similar length waste the least compute.
+        :param batch: List of audio samples as numpy arrays
+        :param embeddings: Also return the pooled wav2vec2 hidden states of every snippet
+        :return: List of SpeechEmotionResults in the order of the batch
+        """
+        processed_signal = self._processor(
+            batch, sampling_rate=self.SAMPLE_RATE, padding=True, return_attention_mask=True, return_tensors="pt"
+        )
+        input_values = processed_signal["input_values"].to(self._device)
+        attention_mask = processed_signal["attention_mask"].to(self._device)
+
+        with torch.inference_mode():
+            hidden_states, result = self._model(input_values, attention_mask=attention_mask)
+
+        result = result.detach().cpu().numpy()
+        hidden_states = hidden_states.detach().cpu().numpy() if embeddings else [None] * len(batch)
+
+        return [
+            self.SpeechEmotionResult(arousal=r[0], dominance=r[1], valence=r[2], embedding=e)
+            for r, e in zip(result, hidden_states)
+        ]
 
     def _audio_to_speech_emotion(self, samples: np.ndarray) -> SpeechEmotionResult:
         """
@@ -60,11 +201,13 @@ class SERProcessor:
 
         processed_signal = self._processor(samples, sampling_rate=self.SAMPLE_RATE)
         processed_signal = processed_signal["input_values"][0]
-        processed_signal = processed_signal.reshape(1, -1)
-        processed_signal = torch.from_numpy(processed_signal).to(self._device)
 
-        with torch.no_grad():
-            result = self._model(processed_signal)[1]
+        if self._compile_mode == "none":
+            # the eager model handles any length, padding to a bucket would only add compute
+            with torch.inference_mode():
+                result = self._model(torch.from_numpy(processed_signal.reshape(1, -1)).to(self._device))[1]
+        else:
+            result = self._bucketed_forward(processed_signal, self.bucket_length(len(processed_signal)))[1]
 
         # convert to numpy
         result = result.detach().cpu().numpy()[0]
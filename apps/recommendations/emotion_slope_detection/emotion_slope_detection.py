@@ -37,11 +37,50 @@ def update_samples(
     return samples_valence, samples_arousal
 
 
+def update_window_mean(
+    mean: Tuple[float, float], outgoing: Tuple[float, float], incoming: Tuple[float, float], window_size: int
+) -> Tuple[float, float]:
+    """
+    Update the mean of a sliding window in O(1) from the sample that leaves and the sample that enters the window.
+    :param mean: Tuple of the current window mean for valence and arousal
+    :param outgoing: Tuple of the valence and arousal sample that is dropped from the window
+    :param incoming: Tuple of the valence and arousal sample that is added to the window
+    :param window_size: Number of samples in the window
+    :return: Tuple of the updated mean values
+    """
+    return (
+        mean[0] + (incoming[0] - outgoing[0]) / window_size,
+        mean[1] + (incoming[1] - outgoing[1]) / window_size,
+    )
+
+
+def get_mean_slope_probability(
+    mean: Tuple[float, float], old_mean: Tuple[float, float], arousal_weight: float = 0.5, valence_weight: float = 0.5
+) -> float:
+    """
+    Get the slope probability from the current and the previous window mean.
+    :param mean: Tuple of the current mean values for valence and arousal
+    :param old_mean: Tuple of old mean values for valence and arousal
+    :param arousal_weight: Weight for arousal value (default: 0.5)
+    :param valence_weight: Weight for valence value (default: 0.5)
+    :return: The slope probability
+    """
+    if arousal_weight != 0.5 or valence_weight != 0.5:
+        arousal_weight = arousal_weight / (arousal_weight + valence_weight)
+        valence_weight = 1 - arousal_weight
+
+    delta = valence_weight * abs(mean[0] - old_mean[0]) + arousal_weight * abs(mean[1] - old_mean[1])
+
+    slope_probability = math.tanh((delta - SLOPE_DETECTOR_THRESHOLD) * SLOPE_DETECTOR_GAIN)
+    return min(max(slope_probability, 0), 1.0)
+
+
 def get_slope_probability(
     samples: Tuple[List[float], List[float]], old_mean: Tuple[float, float], arousal_weight: float = 0.5, valence_weight: float = 0.5
 ) -> Tuple[Tuple[float, float], float]:
     """
     Get the slope probability based on the valence and arousal values.
+    Recomputes the window mean from all samples, update_window_mean() is the O(1) alternative for streams.
     :param samples: Tuple of lists containing valence and arousal values
     :param old_mean: Tuple of old mean values for valence and arousal
     :param arousal_weight: Weight for arousal value (default: 0.5)
@@ -53,13 +92,6 @@ def get_slope_probability(
 
     mean: np.ndarray = _get_welford_values(samples_array)[0]
 
-    if arousal_weight != 0.5 or valence_weight != 0.5:
-        arousal_weight = arousal_weight / (arousal_weight + valence_weight)
-        valence_weight = 1 - arousal_weight
-
-    delta = valence_weight * abs(mean[0] - old_mean[0]) + arousal_weight * abs(mean[1] - old_mean[1])
-
-    slope_probability = math.tanh((delta - SLOPE_DETECTOR_THRESHOLD) * SLOPE_DETECTOR_GAIN)
-    slope_probability = min(max(slope_probability, 0), 1.0)
+    slope_probability = get_mean_slope_probability(mean, old_mean, arousal_weight, valence_weight)
 
     return tuple(mean.tolist()), slope_probability
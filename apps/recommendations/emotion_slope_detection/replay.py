@@ -0,0 +1,73 @@
+from typing import Sequence, Tuple
+
+import numpy as np
+
+from apps.core.consts import EMOTION_VALUES_WINDOW_SIZE
+
+
+def window_means(traces: np.ndarray, window_size: int = EMOTION_VALUES_WINDOW_SIZE, initial_value: float = 0.5) -> np.ndarray:
+    """
+    Sliding window means of many traces at once, computed with a cumulative sum.
+    Like a new session, the window starts filled with initial_value.
+    :param traces: Array of shape (sessions, steps). Shorter sessions are padded with NaN at the end
+    :param window_size: Number of samples in the window
+    :param initial_value: Value the window is filled with before the first sample
+    :return: Array of shape (sessions, steps) with the window mean after every step
+    """
+    traces = np.asarray(traces, dtype=np.float64)
+    sessions, steps = traces.shape
+    padded = np.concatenate([np.full((sessions, window_size), initial_value), traces], axis=1)
+    cumsum = np.concatenate([np.zeros((sessions, 1)), np.cumsum(padded, axis=1)], axis=1)
+    return (cumsum[:, window_size + 1 :] - cumsum[:, 1 : steps + 1]) / window_size
+
+
+def replay_switch_probabilities(
+    valence: np.ndarray,
+    arousal: np.ndarray,
+    thresholds: Sequence[float],
+    gains: Sequence[float],
+    arousal_weights: Sequence[float] = (0.5,),
+    window_size: int = EMOTION_VALUES_WINDOW_SIZE,
+    initial_value: float = 0.5,
+    initial_mean: Tuple[float, float] = (0.0, 0.0),
+) -> np.ndarray:
+    """
+    Replay logged valence/arousal traces through the slope detector for a whole grid of parameters in one pass.
+    Gives the same probabilities as feeding every sample through update_window_mean() and get_mean_slope_probability().
+    :param valence: Valence traces of shape (sessions, steps), NaN padded at the end
+    :param arousal: Arousal traces of shape (sessions, steps), NaN padded at the end
+    :param thresholds: Values for SLOPE_DETECTOR_THRESHOLD
+    :param gains: Values for SLOPE_DETECTOR_GAIN
+    :param arousal_weights: Normalized arousal weights (0-1), the valence weight is 1 - arousal weight
+    :param window_size: Number of samples in the window (EMOTION_VALUES_WINDOW_SIZE)
+    :param initial_value: Value the sample window of a new session is filled with
+    :param initial_mean: Old mean of a new session
+    :return: float32 array of shape (thresholds, gains, arousal_weights, sessions, steps) of switch probabilities
+    """
+    means_valence = window_means(valence, window_size, initial_value)
+    means_arousal = window_means(arousal, window_size, initial_value)
+
+    delta_valence = np.abs(np.diff(means_valence, axis=1, prepend=initial_mean[0]))
+    delta_arousal = np.abs(np.diff(means_arousal, axis=1, prepend=initial_mean[1]))
+
+    arousal_weights = np.asarray(arousal_weights, dtype=np.float64)[:, None, None]
+    delta = ((1 - arousal_weights) * delta_valence + arousal_weights * delta_arousal).astype(np.float32)
+
+    thresholds = np.asarray(thresholds, dtype=np.float32)[:, None, None, None, None]
+    gains = np.asarray(gains, dtype=np.float32)[None, :, None, None, None]
+    probabilities = np.tanh((delta[None, None] - thresholds) * gains)
+    return np.clip(probabilities, 0, 1, out=probabilities)
+
+
+def summarize_switches(probabilities: np.ndarray, probability_threshold: float = 0.5) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reduce the result of replay_switch_probabilities() to one number per parameter combination.
+    :param probabilities: Array of shape (thresholds, gains, arousal_weights, sessions, steps)
+    :param probability_threshold: Probability above which a step counts as a song switch
+    :return: Tuple of the mean switch probability and the switch rate, both of shape (thresholds, gains, arousal_weights)
+    """
+    valid = ~np.isnan(probabilities)
+    counts = np.maximum(valid.sum(axis=(-2, -1)), 1)
+    mean_probability = np.nansum(probabilities, axis=(-2, -1)) / counts
+    switch_rate = (np.nan_to_num(probabilities) > probability_threshold).sum(axis=(-2, -1)) / counts
+    return mean_probability, switch_rate
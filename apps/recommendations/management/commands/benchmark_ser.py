@@ -0,0 +1,96 @@
+import time
+
+import numpy as np
+import torch
+from django.core.management.base import BaseCommand
+
+from ...methods import serprocessor
+
+
+def eager_speech_emotion(samples: np.ndarray) -> np.ndarray:
+    """
+    Reference implementation: the unpadded eager path the bucketed inference replaces.
+    :param samples: Audio samples as a numpy array
+    :return: Model output (arousal, dominance, valence)
+    """
+    processed_signal = serprocessor._processor(samples, sampling_rate=serprocessor.SAMPLE_RATE)
+    processed_signal = processed_signal["input_values"][0].reshape(1, -1)
+    processed_signal = torch.from_numpy(processed_signal).to(serprocessor._device)
+
+    with torch.no_grad():
+        result = serprocessor._model(processed_signal)[1]
+
+    return result.detach().cpu().numpy()[0]
+
+
+def bucketed_speech_emotion(samples: np.ndarray) -> np.ndarray:
+    result = serprocessor._audio_to_speech_emotion(samples)
+    return np.array([result.arousal, result.dominance, result.valence])
+
+
+def time_runs(fn, samples: np.ndarray, repeat: int):
+    timings = []
+    output = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = fn(samples)
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.array(timings), output
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the per bucket latency of the length-bucketed SER inference path against the unpadded eager path. "
+        "Set SER_COMPILE_MODE and SER_NUM_THREADS to compare configurations. With SER_COMPILE_MODE=none clips are "
+        "not padded, both paths run the same eager model."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=10, help="Timed runs per bucket and path.")
+        parser.add_argument(
+            "--fill",
+            type=float,
+            nargs="+",
+            default=[0.3, 0.55, 0.8, 1.0],
+            help="Clip lengths as fractions of the bucket length (0-1]. Short fills show the cost of the padding.",
+        )
+        parser.add_argument("--audio", help="Speech file to cut the clips from instead of synthetic noise.")
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        if options["audio"]:
+            source = serprocessor.load_audio(options["audio"])
+            source = np.tile(source, int(np.ceil(serprocessor.buckets[-1] / len(source))))
+        else:
+            source = rng.normal(0, 0.1, serprocessor.buckets[-1]).astype(np.float32)
+
+        self.stdout.write(
+            f"compile mode: {serprocessor._compile_mode}, threads: {torch.get_num_threads()}, repeat: {options['repeat']}"
+        )
+        warm_up = serprocessor.warm_up()
+        self.stdout.write(
+            "{:>9} {:>9} {:>14} {:>14} {:>14} {:>14} {:>10}".format(
+                "bucket_s", "clip_s", "warmup_ms", "eager_p50_ms", "bucket_p50_ms", "bucket_p95_ms", "max_diff"
+            )
+        )
+
+        for bucket, fill in ((bucket, fill) for bucket in serprocessor.buckets for fill in options["fill"]):
+            clip = source[: max(1, int(bucket * fill))]
+            # one untimed run per path, so lazy initialization does not end up in the numbers
+            eager_speech_emotion(clip)
+            bucketed_speech_emotion(clip)
+
+            eager_ms, eager_out = time_runs(eager_speech_emotion, clip, options["repeat"])
+            bucket_ms, bucket_out = time_runs(bucketed_speech_emotion, clip, options["repeat"])
+
+            self.stdout.write(
+                "{:>9.1f} {:>9.1f} {:>14.1f} {:>14.1f} {:>14.1f} {:>14.1f} {:>10.5f}".format(
+                    bucket / serprocessor.SAMPLE_RATE,
+                    len(clip) / serprocessor.SAMPLE_RATE,
+                    warm_up[bucket] * 1000,
+                    np.percentile(eager_ms, 50),
+                    np.percentile(bucket_ms, 50),
+                    np.percentile(bucket_ms, 95),
+                    float(np.max(np.abs(eager_out - bucket_out))),
+                )
+            )
@@ -0,0 +1,113 @@
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.profiling import get_memory_usage
+
+_serprocessor = None
+
+
+def _worker_memory(_):
+    # runs in a forked worker that inherited the loaded model
+    _serprocessor._audio_to_speech_emotion(np.zeros(2 * _serprocessor.SAMPLE_RATE, dtype=np.float32))
+    return get_memory_usage()
+
+
+def probe(workers: int) -> dict:
+    """
+    Load the SER model in this (fresh) process, then fork workers that each run one inference.
+    :param workers: Number of forked workers
+    :return: Load time and memory usage of the parent and every worker
+    """
+    global _serprocessor
+    start = time.perf_counter()
+    from apps.recommendations.emotion_recognition.processor import SERProcessor
+
+    _serprocessor = SERProcessor()
+    result = {"startup_s": time.perf_counter() - start, "load_s": _serprocessor.load_time_s}
+    result["parent"] = get_memory_usage()
+
+    if workers > 0:
+        with multiprocessing.get_context("fork").Pool(workers) as pool:
+            result["workers"] = pool.map(_worker_memory, range(workers))
+    return result
+
+
+def _mb(value) -> str:
+    return f"{value / 2**20:.0f}" if value is not None else "-"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures SER cold start time and per worker memory, loading the model from the Hub and from the local "
+        "safetensors cache (SER_MODEL_DIR). Every measurement runs in a fresh process."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2, help="Forked workers per measurement.")
+        parser.add_argument("--probe", choices=["hub", "local"], help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options["probe"]:
+            self.stdout.write(json.dumps(probe(options["workers"])))
+            return
+
+        from apps.recommendations.emotion_recognition.consts import SER_MODEL_DIR
+        from apps.recommendations.emotion_recognition.model_cache import is_model_cached
+
+        sources = {"hub": ""}
+        if is_model_cached(SER_MODEL_DIR):
+            sources["local"] = SER_MODEL_DIR
+        else:
+            self.stdout.write("SER_MODEL_DIR is not populated, run download_ser_model to compare with the local cache.")
+
+        self.stdout.write(
+            "{:>6} {:>10} {:>10} {:>9} {:>8} {:>10} {:>10} {:>8}".format(
+                "source", "process", "startup_s", "load_s", "rss_mb", "anon_mb", "file_mb", "pss_mb"
+            )
+        )
+        for source, model_dir in sources.items():
+            env = dict(os.environ, SER_MODEL_DIR=model_dir)
+            completed = subprocess.run(
+                [
+                    sys.executable,
+                    os.path.join(settings.BASE_DIR, "manage.py"),
+                    "benchmark_ser_startup",
+                    "--probe",
+                    source,
+                    "--workers",
+                    str(options["workers"]),
+                ],
+                env=env,
+                capture_output=True,
+                text=True,
+            )
+            if completed.returncode != 0:
+                raise CommandError(f"Measurement for {source} failed:\n{completed.stderr}")
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+
+            rows = [("parent", result["parent"])] + [
+                (f"worker{i}", usage) for i, usage in enumerate(result.get("workers", []))
+            ]
+            for name, usage in rows:
+                self.stdout.write(
+                    "{:>6} {:>10} {:>10} {:>9} {:>8} {:>10} {:>10} {:>8}".format(
+                        source,
+                        name,
+                        f"{result['startup_s']:.2f}" if name == "parent" else "",
+                        f"{result['load_s']:.2f}" if name == "parent" else "",
+                        _mb(usage.get("rss")),
+                        _mb(usage.get("rss_anon")),
+                        _mb(usage.get("rss_file")),
+                        _mb(usage.get("pss")),
+                    )
+                )
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...recommender.consts import SEGMENT_INDEX_PATH
+from ...recommender.segment_index import build_segment_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds the segment index of the recommender from the stored frame timelines: one feature vector per "
+        "MSA segment of every song (the means of its frames). Rebuild it after adding songs, running servers pick "
+        "up the new file on the next request."
+    )
+    # reads the database and the timelines only, no need to load the SER model for the system checks
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=SEGMENT_INDEX_PATH, help="Index file (.npz).")
+
+    def handle(self, *args, **options):
+        if not options["output"]:
+            raise CommandError("Set SEGMENT_INDEX_PATH or pass --output")
+
+        start = time.perf_counter()
+        songs, segments = build_segment_index(options["output"])
+        self.stdout.write(
+            f"Indexed {segments} segments of {songs} songs in {time.perf_counter() - start:.1f}s to {options['output']}"
+        )
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...emotion_recognition.consts import SER_MODEL_DIR, SER_MODEL_NAME
+from ...emotion_recognition.model_cache import save_model_to_cache
+
+
+class Command(BaseCommand):
+    help = "Downloads the speech emotion model once and stores it as safetensors in SER_MODEL_DIR."
+    # The system checks import the URLs, which would load the model that is about to be downloaded
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model-dir", default=SER_MODEL_DIR, help="Target directory (default: SER_MODEL_DIR).")
+
+    def handle(self, *args, **options):
+        if not options["model_dir"]:
+            raise CommandError("Set SER_MODEL_DIR or pass --model-dir.")
+        save_model_to_cache(SER_MODEL_NAME, options["model_dir"])
+        self.stdout.write(f"{SER_MODEL_NAME} has been stored in {options['model_dir']}.")
@@ -0,0 +1,100 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...emotion_recognition.batch import (
+    ResultWriter,
+    collect_audio_files,
+    convert_to_parquet,
+    decode_files,
+    length_buckets,
+    read_checkpoint,
+)
+from ...methods import serprocessor
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs speech emotion recognition on a directory or manifest of audio files and writes valence, arousal and "
+        "dominance (and optionally the pooled embeddings) to CSV or Parquet. Interrupted runs resume where they stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="Directory with audio files or a manifest file with one path per line.")
+        parser.add_argument("output", help="Result file, either .csv or .parquet.")
+        parser.add_argument("--batch-size", type=int, default=8, help="Clips per forward pass.")
+        parser.add_argument("--workers", type=int, default=4, help="Threads used for decoding.")
+        parser.add_argument(
+            "--chunk-size", type=int, default=256, help="Clips decoded, sorted and written per checkpoint."
+        )
+        parser.add_argument("--embeddings", action="store_true", help="Also store the pooled wav2vec2 embeddings.")
+
+    def handle(self, *args, **options):
+        output = options["output"]
+        if output.endswith(".parquet"):
+            checkpoint_path = output + ".partial.csv"
+        elif output.endswith(".csv"):
+            checkpoint_path = output
+        else:
+            raise CommandError("The output file has to end with .csv or .parquet")
+
+        try:
+            paths = collect_audio_files(options["source"])
+        except FileNotFoundError as e:
+            raise CommandError(f"Source not found: {e}")
+
+        done = read_checkpoint(checkpoint_path)
+        todo = [path for path in paths if path not in done]
+        self.stdout.write(f"{len(paths)} files found, {len(done)} already processed, {len(todo)} to go.")
+
+        embedding_size = serprocessor.embedding_size if options["embeddings"] else 0
+        try:
+            writer = ResultWriter(checkpoint_path, embedding_size=embedding_size)
+        except ValueError as e:
+            raise CommandError(f"Cannot resume: {e}")
+
+        processed = 0
+        audio_s = 0.0
+        start = time.perf_counter()
+        try:
+            for chunk_start in range(0, len(todo), options["chunk_size"]):
+                chunk = todo[chunk_start : chunk_start + options["chunk_size"]]
+
+                decoded = []
+                for path, samples, error in decode_files(serprocessor, chunk, workers=options["workers"]):
+                    if error is not None:
+                        writer.write_error(path, error)
+                    else:
+                        decoded.append((path, samples))
+
+                for batch in length_buckets(decoded, options["batch_size"]):
+                    results = serprocessor.process_batch(
+                        [samples for _, samples in batch], embeddings=options["embeddings"]
+                    )
+                    for (path, samples), result in zip(batch, results):
+                        duration_s = len(samples) / serprocessor.SAMPLE_RATE
+                        writer.write_result(path, duration_s, result)
+                        audio_s += duration_s
+
+                writer.flush()
+                processed += len(chunk)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f"{processed}/{len(todo)} clips, {processed / elapsed:.2f} clips/s, "
+                    f"{audio_s / elapsed:.1f}x real time"
+                )
+        finally:
+            writer.close()
+
+        if output.endswith(".parquet"):
+            try:
+                convert_to_parquet(checkpoint_path, output)
+            except ImportError as e:
+                raise CommandError(f"Writing Parquet requires pyarrow or fastparquet ({e}). Results: {checkpoint_path}")
+            os.remove(checkpoint_path)
+
+        elapsed = time.perf_counter() - start
+        if processed:
+            self.stdout.write(f"Processed {processed} clips in {elapsed:.1f}s ({processed / elapsed:.2f} clips/s).")
+        self.stdout.write(f"Results written to {output}")
@@ -0,0 +1,76 @@
+import csv
+import itertools
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.consts import EMOTION_VALUES_WINDOW_SIZE, SLOPE_DETECTOR_GAIN, SLOPE_DETECTOR_THRESHOLD
+
+from ...emotion_slope_detection.replay import replay_switch_probabilities, summarize_switches
+
+
+def _floats(value: str):
+    return [float(v) for v in value.split(",") if v.strip()]
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays logged valence/arousal traces through the emotion slope detector for a grid of thresholds, gains and "
+        "arousal weights and reports the mean switch probability and switch rate of every combination."
+    )
+    # pure NumPy, no need to import the URLs (and load the SER model) for the system checks
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("traces", help=".npz file with 'valence' and 'arousal' arrays of shape (sessions, steps).")
+        parser.add_argument("--thresholds", type=_floats, default=[SLOPE_DETECTOR_THRESHOLD])
+        parser.add_argument("--gains", type=_floats, default=[SLOPE_DETECTOR_GAIN])
+        parser.add_argument("--arousal-weights", type=_floats, default=[0.5])
+        parser.add_argument("--window-size", type=int, default=EMOTION_VALUES_WINDOW_SIZE)
+        parser.add_argument(
+            "--probability-threshold", type=float, default=0.5, help="Probability that counts as a switch."
+        )
+        parser.add_argument("--output", help="Write all combinations to this CSV file.")
+
+    def handle(self, *args, **options):
+        try:
+            traces = np.load(options["traces"])
+            valence, arousal = np.atleast_2d(traces["valence"]), np.atleast_2d(traces["arousal"])
+        except (OSError, KeyError) as e:
+            raise CommandError(f"Could not read the traces: {e}")
+        if valence.shape != arousal.shape:
+            raise CommandError("valence and arousal need to have the same shape")
+
+        start = time.perf_counter()
+        probabilities = replay_switch_probabilities(
+            valence,
+            arousal,
+            options["thresholds"],
+            options["gains"],
+            options["arousal_weights"],
+            window_size=options["window_size"],
+        )
+        mean_probability, switch_rate = summarize_switches(probabilities, options["probability_threshold"])
+        elapsed = time.perf_counter() - start
+
+        rows = []
+        for (i, threshold), (j, gain), (k, weight) in itertools.product(
+            enumerate(options["thresholds"]), enumerate(options["gains"]), enumerate(options["arousal_weights"])
+        ):
+            rows.append([threshold, gain, weight, float(mean_probability[i, j, k]), float(switch_rate[i, j, k])])
+
+        header = ["threshold", "gain", "arousal_weight", "mean_probability", "switch_rate"]
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8", newline="") as file:
+                writer = csv.writer(file)
+                writer.writerow(header)
+                writer.writerows(rows)
+        else:
+            self.stdout.write("{:>10} {:>8} {:>15} {:>17} {:>12}".format(*header))
+            for row in rows:
+                self.stdout.write("{:>10.4f} {:>8.2f} {:>15.2f} {:>17.4f} {:>12.4f}".format(*row))
+
+        self.stdout.write(
+            f"{len(rows)} combinations over {valence.shape[0]} sessions x {valence.shape[1]} steps in {elapsed:.2f}s"
+        )
@@ -1,26 +1,32 @@
-from typing import List, Tuple
+from typing import Callable, List, Optional, Tuple, Union
 
 from ninja.files import UploadedFile
 
 from apps.core.schemas import Playlist, SongSchema
-from apps.session.schemas import SessionData
+from apps.session.store import EmotionState, PlayedSongs
 
+from .admission import InferenceGate
+from .emotion_recognition.consts import SER_MAX_CONCURRENCY, SER_MAX_QUEUE_SIZE, SER_MAX_QUEUE_WAIT_S
 from .emotion_recognition.processor import SERProcessor
-from .emotion_slope_detection.emotion_slope_detection import get_slope_probability, update_samples
+from .emotion_slope_detection.emotion_slope_detection import get_mean_slope_probability, update_window_mean
 from .schemas import EmotionFeaturesSchema
 
 serprocessor = SERProcessor()
+inference_gate = InferenceGate(SER_MAX_CONCURRENCY, SER_MAX_QUEUE_SIZE, SER_MAX_QUEUE_WAIT_S)
 
 
 def get_emotion_features_from_speech(
-    file: UploadedFile
+    file: UploadedFile, is_cancelled: Optional[Callable[[], bool]] = None
 ) -> EmotionFeaturesSchema:
     """
     Extract emotion features from a speech audio file.
+    Decoding and inference only start once the inference gate admits the request.
     :param file: Uploaded audio file
+    :param is_cancelled: Returns True if the client is gone and the request should be dropped
     :return: EmotionFeatures dataclass containing valence, arousal, dominance, authenticity, timeliness, and complexity
     """
-    speech_emotion_result = serprocessor.process_audio_file(file)
+    with inference_gate.admit(is_cancelled):
+        speech_emotion_result = serprocessor.process_audio_file(file)
 
     valence = speech_emotion_result.valence * 2 - 1
     arousal = speech_emotion_result.arousal * 2 - 1
@@ -28,40 +34,44 @@ def get_emotion_features_from_speech(
     return EmotionFeaturesSchema(valence=valence, arousal=arousal)
 
 
-def update_session_data(valence: float, arousal: float, session_data: SessionData) -> SessionData:
+def update_session_data(valence: float, arousal: float, session_data: EmotionState) -> EmotionState:
     """
     Update the session data with new valence and arousal values.
     :param valence: Valence value
     :param arousal: Arousal value
-    :param session_data: Current session data
-    :return: Updated session data
+    :param session_data: Current emotion state of the session
+    :return: Updated emotion state
     """
-    session_data["samples"] = update_samples(valence, arousal, session_data["samples"])
+    outgoing, incoming = session_data.add_sample(valence, arousal)
+    session_data.mean = update_window_mean(session_data.mean, outgoing, incoming, session_data.window_size)
     return session_data
 
 
 def calculate_array_switch_probability(
-    session_data: SessionData, arousal_weight: float = 0.5, valence_weight: float = 0.5
-) -> Tuple[float, float]:
+    session_data: EmotionState, arousal_weight: float = 0.5, valence_weight: float = 0.5
+) -> Tuple[Tuple[float, float], float]:
     """
     Calculate the probability that a song should switch for a single array.
-    :param session_data: Current session data
+    :param session_data: Current emotion state of the session
     :param arousal_weight: Weight for arousal value (default: 0.5)
     :param valence_weight: Weight for valence value (default: 0.5)
-    :return: The calculated welford mean value and the switch probability as a float (0-1)
+    :return: The current window mean and the switch probability as a float (0-1)
     """
 
-    return get_slope_probability(session_data["samples"], session_data["old_mean"], arousal_weight, valence_weight)
+    switch_probability = get_mean_slope_probability(
+        session_data.mean, session_data.old_mean, arousal_weight, valence_weight
+    )
+    return session_data.mean, switch_probability
 
 
 def get_song_recommendation(
     playlist: Playlist,
-    songs_played: List[str],
+    songs_played: Union[List[str], PlayedSongs],
 ) -> SongSchema:
     """
     Return either a song that was not played yet or the first song from the playlist.
     :param playlist: Playlist containing SongSchema objects.
-    :param songs_played: List of song IDs that have already been played.
+    :param songs_played: Song IDs that have already been played.
     :return: A SongSchema object representing the recommended song.
     """
     for song in playlist:
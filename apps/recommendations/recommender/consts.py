@@ -1,3 +1,4 @@
+import os
 from typing import Dict, Literal
 
 from dotenv import load_dotenv
@@ -6,6 +7,9 @@ load_dotenv()
 
 PLAYLIST_LENGTH = 16
 
+# Segment index written by the build_segment_index command, recommendations of song segments are off without it
+SEGMENT_INDEX_PATH = os.getenv("SEGMENT_INDEX_PATH", "")
+
 GENRE_DATA_BASE = Literal[
   "Rock",
   "Pop",
@@ -7,7 +7,10 @@ from sklearn.neighbors import KDTree
 from apps.core.models import Song
 from apps.core.schemas import Playlist, SongFeaturesSchema
 
-from .consts import GENRE_DATA_BASE, PLAYLIST_LENGTH
+from .consts import GENRE_DATA_BASE, PLAYLIST_LENGTH, SEGMENT_INDEX_PATH
+from .segment_index import SegmentIndex
+
+segment_index = SegmentIndex(SEGMENT_INDEX_PATH)
 
 
 def get_song_id() -> List[str]:
@@ -92,6 +95,38 @@ def generate_playlist(
     return playlist
 
 
+def get_song_ids_by_genre(genre: GENRE_DATA_BASE) -> frozenset:
+    """
+    :param genre: Genre of the songs (e.g., rock, pop).
+    :return: IDs (strings) of the songs with the genre in their top3_genres.
+    """
+    # SQLite can not filter the JSONField by key, see get_song_id_and_dimensions
+    return frozenset(
+        str(song.id) for song in Song.objects.select_related("genres") if genre in song.genres.top3_genres
+    )
+
+
+def generate_segment_playlist(
+    features: SongFeaturesSchema,
+    genre: Optional[GENRE_DATA_BASE] = None,
+) -> List[Tuple[Song, float]]:
+    """
+    Generate a playlist of song segments from the segment index, the songs start at the segment closest to the
+    input vector instead of the song whose average is closest.
+    :param features: Input vector of different kinds of features.
+    :param genre: Genre of the songs (e.g., Rock, Pop, None).
+    :return: List of Song objects and the start of their segment in seconds, empty without a segment index.
+    """
+    if not segment_index.enabled:
+        return []
+
+    song_ids = get_song_ids_by_genre(genre) if genre else None
+    top_segments = segment_index.query(features.model_dump(exclude_none=True), PLAYLIST_LENGTH, song_ids)
+
+    songs = {str(song.id): song for song in get_song_information(top_IDs=[song_id for song_id, _ in top_segments])}
+    return [(songs[song_id], start_s) for song_id, start_s in top_segments if song_id in songs]
+
+
 def k_d_tree(
     data: Tuple[List[str], List[List[float]]],
     features: SongFeaturesSchema,
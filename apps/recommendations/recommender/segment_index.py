@@ -0,0 +1,160 @@
+import math
+import os
+import tempfile
+import threading
+from functools import lru_cache, partial
+from typing import List, Optional, Tuple
+
+import numpy as np
+from sklearn.neighbors import KDTree
+
+from apps.core.models import Song
+from apps.songs.timeline import read_timeline
+
+# song level features with frame timelines, bpm only exists per song and is the same for all of its segments
+SEGMENT_FRAME_FEATURES = [
+    "valence",
+    "arousal",
+    "authenticity",
+    "timeliness",
+    "complexity",
+    "danceability",
+    "tonal",
+    "voice",
+]
+SEGMENT_FEATURES = SEGMENT_FRAME_FEATURES + ["bpm"]
+
+
+def segment_vectors(song: Song) -> Tuple[List[float], List[float], List[List[float]]]:
+    """
+    Feature vectors of the segments of a song: the means of the frames of the timeline within the MSA boundaries
+    :param song: Song with a timeline_file
+    :return: Tuple of the start and end seconds of the segments and their vectors (SEGMENT_FEATURES)
+    """
+    timeline = read_timeline(song.timeline_file.path)
+    song_features = song.features.to_dict(include=SEGMENT_FEATURES)
+    structure = timeline["structure"] or {}
+    boundaries = structure.get("boundaries") or [0.0, timeline["duration_s"]]
+
+    starts, ends, vectors = [], [], []
+    for start_s, end_s in zip(boundaries[:-1], boundaries[1:]):
+        if end_s <= start_s:
+            continue
+        vector = []
+        for feature in SEGMENT_FEATURES:
+            column = timeline["columns"].get(feature)
+            value = song_features[feature]
+            if column is not None and column["frame_s"] > 0:
+                # frames overlapping the segment
+                first = math.floor(start_s / column["frame_s"])
+                last = math.ceil(end_s / column["frame_s"])
+                frames = column["values"][first:last]
+                if frames:
+                    value = float(np.mean(frames))
+            vector.append(np.nan if value is None else value)
+        starts.append(start_s)
+        ends.append(end_s)
+        vectors.append(vector)
+    return starts, ends, vectors
+
+
+def build_segment_index(path: str) -> Tuple[int, int]:
+    """
+    Write the segment vectors of all songs with a timeline to an index file, read by SegmentIndex
+    :param path: .npz file
+    :return: Tuple of the number of songs and segments in the index
+    """
+    song_ids, starts, ends, vectors = [], [], [], []
+    for song in Song.objects.exclude(timeline_file="").select_related("features"):
+        song_starts, song_ends, song_vectors = segment_vectors(song)
+        song_ids.extend([str(song.id)] * len(song_starts))
+        starts.extend(song_starts)
+        ends.extend(song_ends)
+        vectors.extend(song_vectors)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".npz")
+    with os.fdopen(fd, "wb") as file:
+        np.savez(
+            file,
+            song_ids=np.array(song_ids, dtype=str),
+            start_s=np.array(starts, dtype=np.float32),
+            end_s=np.array(ends, dtype=np.float32),
+            vectors=np.array(vectors, dtype=np.float32).reshape(len(vectors), len(SEGMENT_FEATURES)),
+            features=np.array(SEGMENT_FEATURES),
+        )
+    os.replace(tmp_path, path)
+    return len(set(song_ids)), len(song_ids)
+
+
+def _segment_tree(data: dict, features: Tuple[str, ...], song_ids: Optional[frozenset]):
+    """
+    :return: Tuple of the KD tree over the segments with all features (of the songs) and the index rows in the tree
+    """
+    columns = [list(data["features"]).index(feature) for feature in features]
+    rows = np.all(np.isfinite(data["vectors"][:, columns]), axis=1)
+    if song_ids is not None:
+        rows &= np.isin(data["song_ids"], list(song_ids))
+    rows = np.flatnonzero(rows)
+    if len(rows) == 0:
+        return None, rows
+    return KDTree(data["vectors"][np.ix_(rows, columns)], leaf_size=3), rows
+
+
+class SegmentIndex:
+    """
+    Nearest neighbour index over the segments of all songs, built offline by the build_segment_index command.
+    The file is loaded on first use and again when it was rebuilt, the KD trees are cached per feature subset.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._data = None
+        self._trees = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path) and os.path.exists(self.path)
+
+    def _load(self):
+        mtime = os.path.getmtime(self.path)
+        with self._lock:
+            if self._mtime != mtime:
+                with np.load(self.path) as data:
+                    self._data = {key: data[key] for key in data.files}
+                self._trees = lru_cache(maxsize=32)(partial(_segment_tree, self._data))
+                self._mtime = mtime
+            return self._data, self._trees
+
+    def query(
+        self, features: dict, numClosestSongs: int, song_ids: Optional[frozenset] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        :param features: Feature name -> value of the query, names in SEGMENT_FEATURES
+        :param numClosestSongs: Number of songs to return
+        :param song_ids: Only return these songs, None for all
+        :return: Song IDs and the start (seconds) of their closest segment, closest first, every song once
+        """
+        data, trees = self._load()
+        names = tuple(feature for feature in SEGMENT_FEATURES if feature in features)
+        tree, rows = trees(names, song_ids)
+        if tree is None:
+            return []
+
+        query = [[features[name] for name in names]]
+        # a song can have many close segments, look further until enough different songs are found
+        k = min(len(rows), numClosestSongs * 4)
+        while True:
+            _, ind = tree.query(query, k=k)
+            playlist, seen = [], set()
+            for row in rows[ind[0]]:
+                song_id = str(data["song_ids"][row])
+                if song_id not in seen:
+                    seen.add(song_id)
+                    playlist.append((song_id, float(data["start_s"][row])))
+            if len(playlist) >= numClosestSongs or k == len(rows):
+                return playlist[:numClosestSongs]
+            k = min(len(rows), k * 4)
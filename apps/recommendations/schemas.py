@@ -1,3 +1,5 @@
+from typing import Optional
+
 from ninja import Schema
 
 from apps.core.schemas import SongFeaturesSchema, SongSchema
@@ -12,3 +14,25 @@ class RecommendFromSpeechResponseSchema(Schema):
     song: SongSchema
     speech_features: EmotionFeaturesSchema
     switch_probability: float
+    # seconds into the song where the recommended segment starts, only with segments=true
+    start_s: Optional[float] = None
+
+
+class InferenceQueueMetricsSchema(Schema):
+    max_concurrency: int
+    max_queue_size: int
+    max_wait_s: float
+    queue_depth: int
+    running: int
+    estimated_wait_s: float
+    service_time_s: float
+    wait_time_p50_s: float
+    wait_time_p99_s: float
+    wait_time_max_s: float
+    admitted: int
+    completed: int
+    rejected_queue_full: int
+    # the queue had room, but the estimated wait was longer than max_wait_s
+    rejected_estimated_wait: int
+    rejected_timeout: int
+    cancelled: int
@@ -1,31 +1,32 @@
 from ninja import Router
 
-from .schemas import SessionData
+from .store import EmotionState, emotion_state_store, get_session_key
 
 router = Router(tags=["sessions"])
 
 
 @router.post("/start")
 def start_session(request):
-    request.session["data"] = SessionData().model_dump()
+    emotion_state_store.put(get_session_key(request), EmotionState())
     return {"message": "Session started"}
 
 
 @router.post("/add-played-song")
 def add_played_song(request, song_id: str):
-    session_data = request.session.get("data", SessionData().model_dump())
-    session_data["songs_played"].append(song_id)
-    request.session["data"] = session_data
+    with emotion_state_store.session(get_session_key(request)) as state:
+        state.songs_played.add(song_id)
     return {"message": "Song added to played list", "song_id": song_id}
 
 
 @router.post("/end")
 def end_session(request):
+    if request.session.session_key:
+        emotion_state_store.delete(request.session.session_key)
     request.session.flush()
     return {"message": "Session ended"}
 
 
 @router.post("/clear")
 def clear_session(request):
-    request.session["data"] = SessionData().model_dump()
+    emotion_state_store.put(get_session_key(request), EmotionState())
     return {"message": "Session cleared"}
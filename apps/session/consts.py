@@ -0,0 +1,16 @@
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Directory the emotion state of the sessions is persisted to. Without it the state only lives in memory.
+# Either way the states are cached per process: the server must run a single worker process, a request landing on
+# another worker would continue from a different (or empty) state of its session.
+EMOTION_STATE_PATH = os.getenv("EMOTION_STATE_PATH", "")
+
+# Seconds between two background flushes of changed session states to EMOTION_STATE_PATH
+EMOTION_STATE_FLUSH_INTERVAL_S = float(os.getenv("EMOTION_STATE_FLUSH_INTERVAL_S", "5"))
+
+# Number of session states kept in memory, the least recently used ones are evicted (after being persisted)
+EMOTION_STATE_MAX_SESSIONS = int(os.getenv("EMOTION_STATE_MAX_SESSIONS", "10000"))
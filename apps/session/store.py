@@ -0,0 +1,284 @@
+import atexit
+import os
+import re
+import struct
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from apps.core.consts import EMOTION_VALUES_WINDOW_SIZE
+
+from .consts import EMOTION_STATE_FLUSH_INTERVAL_S, EMOTION_STATE_MAX_SESSIONS, EMOTION_STATE_PATH
+
+# magic, window size, ring buffer head, old mean (valence, arousal), number of played songs
+_HEADER = struct.Struct("<4sHHddI")
+_MAGIC = b"EMS1"
+_SONG_ID_NAMESPACE = uuid.UUID("6f1c4e0a-3b8e-4d59-9c1b-2a7d5e8f4b13")
+
+
+def _song_id_to_bytes(song_id: Union[str, uuid.UUID]) -> bytes:
+    if isinstance(song_id, uuid.UUID):
+        return song_id.bytes
+    try:
+        return uuid.UUID(str(song_id)).bytes
+    except ValueError:
+        # not a song UUID, still store it as 16 bytes
+        return uuid.uuid5(_SONG_ID_NAMESPACE, str(song_id)).bytes
+
+
+class PlayedSongs:
+    """Set of played song ids stored as 16 byte UUIDs. Supports `str(song.id) in played_songs`."""
+
+    def __init__(self, song_ids: Iterable[bytes] = ()):
+        self._ids = set(song_ids)
+
+    def add(self, song_id: Union[str, uuid.UUID]):
+        self._ids.add(_song_id_to_bytes(song_id))
+
+    def __contains__(self, song_id) -> bool:
+        return _song_id_to_bytes(song_id) in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def copy(self) -> "PlayedSongs":
+        return PlayedSongs(self._ids)
+
+    def to_bytes(self) -> bytes:
+        return b"".join(sorted(self._ids))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "PlayedSongs":
+        return cls(data[i : i + 16] for i in range(0, len(data), 16))
+
+
+class EmotionState:
+    """
+    Emotion state of a single session: the last valence and arousal samples in fixed size float32 ring buffers,
+    the mean of the previous request and the songs that were played.
+    """
+
+    def __init__(self, window_size: int = EMOTION_VALUES_WINDOW_SIZE):
+        self.valence = np.full(window_size, 0.5, dtype=np.float32)
+        self.arousal = np.full(window_size, 0.5, dtype=np.float32)
+        # index of the oldest sample, which is overwritten next
+        self.head = 0
+        # mean of the current window, updated from the outgoing and incoming sample instead of being recomputed
+        self.mean: Tuple[float, float] = (0.5, 0.5)
+        self.old_mean: Tuple[float, float] = (0.0, 0.0)
+        self.songs_played = PlayedSongs()
+
+    @property
+    def window_size(self) -> int:
+        return len(self.valence)
+
+    def copy(self) -> "EmotionState":
+        state = EmotionState.__new__(EmotionState)
+        state.valence = self.valence.copy()
+        state.arousal = self.arousal.copy()
+        state.head = self.head
+        state.mean = self.mean
+        state.old_mean = self.old_mean
+        state.songs_played = self.songs_played.copy()
+        return state
+
+    def add_sample(self, valence: float, arousal: float) -> Tuple[Tuple[float, float], Tuple[float, float]]:
+        """
+        Replace the oldest sample with a new one
+        :param valence: Valence value
+        :param arousal: Arousal value
+        :return: Tuple of the replaced and the new (valence, arousal) sample, as stored in the buffers
+        """
+        outgoing = float(self.valence[self.head]), float(self.arousal[self.head])
+        self.valence[self.head] = valence
+        self.arousal[self.head] = arousal
+        incoming = float(self.valence[self.head]), float(self.arousal[self.head])
+        self.head = (self.head + 1) % self.window_size
+        return outgoing, incoming
+
+    @property
+    def samples(self) -> Tuple[List[float], List[float]]:
+        """Valence and arousal samples from the oldest to the newest one"""
+        order = np.roll(np.arange(self.window_size), -self.head)
+        return self.valence[order].tolist(), self.arousal[order].tolist()
+
+    def to_bytes(self) -> bytes:
+        played = self.songs_played.to_bytes()
+        header = _HEADER.pack(_MAGIC, self.window_size, self.head, *self.old_mean, len(played) // 16)
+        return header + self.valence.tobytes() + self.arousal.tobytes() + played
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "EmotionState":
+        magic, window_size, head, mean_valence, mean_arousal, num_played = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError("Not an emotion state")
+        state = cls(window_size)
+        offset = _HEADER.size
+        state.valence = np.frombuffer(data, dtype=np.float32, count=window_size, offset=offset).copy()
+        offset += 4 * window_size
+        state.arousal = np.frombuffer(data, dtype=np.float32, count=window_size, offset=offset).copy()
+        offset += 4 * window_size
+        state.songs_played = PlayedSongs.from_bytes(data[offset : offset + 16 * num_played])
+        state.head = head
+        state.mean = (float(np.mean(state.valence, dtype=np.float64)), float(np.mean(state.arousal, dtype=np.float64)))
+        state.old_mean = (mean_valence, mean_arousal)
+        return state
+
+
+class EmotionStateStore:
+    """
+    Keeps the emotion state of all sessions in memory, so the recommendation hot path never touches the database.
+    If a directory is given, changed states are written to one small binary file per session by a background thread
+    (write-behind), and states that are not in memory are read from there.
+    The states are per process, the server has to run a single worker process (see the README).
+    """
+
+    # requests of one session are serialized by one of these locks, bounded memory for any number of sessions
+    SESSION_LOCK_STRIPES = 64
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        flush_interval_s: float = 5.0,
+        max_sessions: int = 10000,
+    ):
+        self.path = path or None
+        self.flush_interval_s = flush_interval_s
+        self.max_sessions = max_sessions
+        self._states: "OrderedDict[str, EmotionState]" = OrderedDict()
+        self._dirty = set()
+        self._deleted = set()
+        self._lock = threading.RLock()
+        self._session_locks = [threading.Lock() for _ in range(self.SESSION_LOCK_STRIPES)]
+        self._flush_thread = None
+
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+            atexit.register(self.flush)
+
+    def _file_path(self, session_key: str) -> str:
+        # session keys are alphanumeric, never let them escape the directory
+        return os.path.join(self.path, re.sub(r"[^0-9A-Za-z_-]", "_", session_key) + ".bin")
+
+    def _load(self, session_key: str) -> Optional[EmotionState]:
+        if not self.path:
+            return None
+        try:
+            with open(self._file_path(session_key), "rb") as file:
+                return EmotionState.from_bytes(file.read())
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def get(self, session_key: str) -> EmotionState:
+        """
+        Get a copy of the state of a session, a new one if the session has none yet.
+        Call put() to store changes, or change it within session() so concurrent requests of the session do not
+        overwrite each other's changes.
+        """
+        with self._lock:
+            state = self._states.get(session_key)
+            if state is None:
+                state = self._load(session_key) or EmotionState()
+                self._states[session_key] = state
+                self._evict()
+            else:
+                self._states.move_to_end(session_key)
+            return state.copy()
+
+    @contextmanager
+    def session(self, session_key: str) -> Iterator[EmotionState]:
+        """
+        Read, change and store the state of a session: the state is put back at the end of the block, other requests
+        of the session wait until then. Nothing is stored if the block raises.
+        """
+        with self._session_locks[hash(session_key) % self.SESSION_LOCK_STRIPES]:
+            state = self.get(session_key)
+            yield state
+            self.put(session_key, state)
+
+    def put(self, session_key: str, state: EmotionState):
+        # the store owns the object from now on, callers keep changing their copy at most
+        state = state.copy()
+        with self._lock:
+            self._states[session_key] = state
+            self._states.move_to_end(session_key)
+            self._deleted.discard(session_key)
+            if self.path:
+                self._dirty.add(session_key)
+                self._start_flush_thread()
+            self._evict()
+
+    def delete(self, session_key: str):
+        with self._lock:
+            self._states.pop(session_key, None)
+            self._dirty.discard(session_key)
+            if self.path:
+                self._deleted.add(session_key)
+                self._start_flush_thread()
+
+    def _evict(self):
+        while len(self._states) > self.max_sessions:
+            session_key, state = self._states.popitem(last=False)
+            if session_key in self._dirty:
+                self._dirty.discard(session_key)
+                self._write(session_key, state.to_bytes())
+
+    def _write(self, session_key: str, data: bytes):
+        # write to a temporary file and rename it, so a crash never leaves a half written state behind
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, self._file_path(session_key))
+
+    def flush(self):
+        """Persist all changed states and remove the files of deleted sessions."""
+        if not self.path:
+            return
+        with self._lock:
+            pending = [(key, self._states[key].to_bytes()) for key in self._dirty if key in self._states]
+            deleted = list(self._deleted)
+            self._dirty.clear()
+            self._deleted.clear()
+
+        for session_key, data in pending:
+            self._write(session_key, data)
+        for session_key in deleted:
+            try:
+                os.remove(self._file_path(session_key))
+            except FileNotFoundError:
+                pass
+
+    def _start_flush_thread(self):
+        if self._flush_thread is not None:
+            return
+
+        def _flush_loop():
+            event = threading.Event()
+            while True:
+                event.wait(self.flush_interval_s)
+                try:
+                    self.flush()
+                except OSError as e:
+                    print(f"Could not persist session states: {e}", flush=True)
+
+        self._flush_thread = threading.Thread(target=_flush_loop, name="emotion-state-flush", daemon=True)
+        self._flush_thread.start()
+
+
+emotion_state_store = EmotionStateStore(EMOTION_STATE_PATH, EMOTION_STATE_FLUSH_INTERVAL_S, EMOTION_STATE_MAX_SESSIONS)
+
+
+def get_session_key(request) -> str:
+    """
+    Get the key of the Django session of a request, creating the session (one database write) if needed.
+    :param request: Django request
+    :return: Session key
+    """
+    if not request.session.session_key:
+        request.session.create()
+    return request.session.session_key
@@ -1,17 +1,22 @@
 from typing import List
 from uuid import UUID
 
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from ninja import File, Form, Router
 from ninja.errors import ValidationError
 from ninja.files import UploadedFile
 from ninja.pagination import PageNumberPagination, paginate
 
-from apps.core.models import Album, Song, SongFeatures, SongGenres
+from apps.core.models import Album, ExtractionJob, Song, SongFeatures, SongGenres
 from apps.core.schemas import AlbumSchema, SongCreateSchema, SongSchema
 
-from .methods import calculate_genres_and_features
-from .schemas import AlbumDetailSchema
+from .artwork import add_artwork_thumbnails
+from .jobs import enqueue_extraction
+from .methods import store_upload_and_calculate_genres_and_features, upload_sha256
+from .renditions import enqueue_renditions
+from .schemas import AlbumDetailSchema, ExtractionJobSchema, JobAcceptedSchema, SongTimelineSchema, SongUploadSchema
+from .timeline import read_timeline, timeline_file
 
 songs_router = Router(tags=["songs"])
 albums_router = Router(tags=["albums"])
@@ -35,6 +40,7 @@ def upload_album(
         return {"id": existing_artwork_file.id}
 
     album = Album.objects.create(album_name=album_name, artwork_file=artwork_file, artist=artist)
+    add_artwork_thumbnails(album)
     return {"id": album.id}
 
 
@@ -77,31 +83,59 @@ def delete_album(request, album_id: UUID, delete_songs: bool = True):
     return {"deleted": True}
 
 
-@songs_router.post("/")
+@songs_router.post("/", response={200: SongUploadSchema, 201: SongUploadSchema, 202: JobAcceptedSchema})
 def create_and_upload_song(
     request,
     song: SongCreateSchema = Form(...),
     audio_file: UploadedFile = File(...),
+    background: bool = False,
 ):
+    # the same file was uploaded before (e.g. a retried request) or is being extracted: 200 or 202 with existing set
+    audio_sha256 = upload_sha256(audio_file)
+    existing_song = Song.objects.filter(audio_sha256=audio_sha256).first()
+    if existing_song:
+        existing_song.existing = True
+        return 200, existing_song
+    existing_job = ExtractionJob.objects.filter(
+        audio_sha256=audio_sha256, status__in=[ExtractionJob.STATUS_QUEUED, ExtractionJob.STATUS_RUNNING]
+    ).first()
+    if existing_job:
+        existing_job.existing = True
+        return 202, existing_job
+
     if song.album_id:
         album = Album.objects.get(id=song.album_id)
     else:
         album = None
 
-    # calculate features if not present:
+    # store the upload and extract its features in the background, the song is created when they are complete
+    if background and (not song.features or not song.genres):
+        job = ExtractionJob.objects.create(
+            title=song.title, artist=song.artist, album=album, audio_file=audio_file, audio_sha256=audio_sha256
+        )
+        enqueue_extraction(job)
+        return 202, job
+
+    # calculate features if not present, from the file already saved to the media storage
+    stored_audio_file, stored_timeline_file = audio_file, ""
     if not song.features or not song.genres:
-        # ToDo: Move to methods
-        song.genres, song.features, song.duration_s = calculate_genres_and_features(audio_file)
+        stored_audio_file, song.genres, song.features, song.duration_s, timeline = (
+            store_upload_and_calculate_genres_and_features(audio_file)
+        )
+        stored_timeline_file = timeline_file(timeline)
 
     song = Song.objects.create(
         **song.model_dump(exclude={"audio_file_id", "artwork_id", "features", "genres"}),
         features=SongFeatures.objects.create(**song.features.model_dump()),
         genres=SongGenres.objects.create(**song.genres.model_dump()),
-        audio_file=audio_file,
+        audio_file=stored_audio_file,
+        audio_sha256=audio_sha256,
         album=album,
+        timeline_file=stored_timeline_file,
     )
+    enqueue_renditions(song)
 
-    return SongSchema.from_orm(song)
+    return 201, song
 
 
 @songs_router.get("/", response=List[SongSchema])
@@ -114,6 +148,28 @@ def list_songs(request, title: str = None):
     return qs
 
 
+@songs_router.get("/{song_id}/timeline", response=SongTimelineSchema)
+def get_song_timeline(request, song_id: UUID, start_s: float = 0.0, end_s: float = None, columns: str = None):
+    """
+    Frame level features of a song between start_s and end_s (seconds) and its structure.
+    columns: Comma separated column names (valence, arousal, ..., genre:<name>), all by default
+    """
+    song = get_object_or_404(Song, id=song_id)
+    if not song.timeline_file:
+        raise Http404("No timeline stored for this song.")
+
+    names = [name.strip() for name in columns.split(",") if name.strip()] if columns else None
+    try:
+        return read_timeline(song.timeline_file.path, names, start_s, end_s)
+    except KeyError as e:
+        raise ValidationError(str(e.args[0]))
+
+
+@songs_router.get("/jobs/{job_id}", response=ExtractionJobSchema)
+def get_extraction_job(request, job_id: UUID):
+    return get_object_or_404(ExtractionJob, id=job_id)
+
+
 @songs_router.delete("/{song_id}")
 def delete_song(request, song_id: UUID):
     song = get_object_or_404(Song, id=song_id)
@@ -0,0 +1,62 @@
+import hashlib
+import io
+from typing import Dict
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from apps.core.models import Album
+
+from .consts import ARTWORK_THUMBNAIL_SIZES
+
+ARTWORK_THUMBNAIL_DIR = "Album_Art/thumbnails/"
+# Pillow format -> file extension and save options
+ARTWORK_THUMBNAIL_FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 85, "optimize": True, "progressive": True}),
+}
+
+
+def generate_artwork_thumbnails(artwork_file) -> Dict[str, Dict[str, str]]:
+    """
+    Square thumbnails of an artwork in ARTWORK_THUMBNAIL_SIZES as WebP and JPEG, named by the hash of the image, so
+    albums with the same artwork share them and existing ones are not generated again
+    :param artwork_file: FieldFile of the artwork
+    :return: Format -> size -> storage name
+    """
+    storage = artwork_file.storage
+    with artwork_file.open("rb") as file:
+        data = file.read()
+    digest = hashlib.sha256(data).hexdigest()[:32]
+
+    image = None
+    thumbnails = {}
+    for extension, (image_format, options) in ARTWORK_THUMBNAIL_FORMATS.items():
+        thumbnails[extension] = {}
+        for size in ARTWORK_THUMBNAIL_SIZES:
+            name = f"{ARTWORK_THUMBNAIL_DIR}{digest}_{size}.{extension}"
+            if not storage.exists(name):
+                if image is None:
+                    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data))).convert("RGB")
+                # never upscale, a small artwork stays small under the name of the larger size
+                edge = min(size, *image.size)
+                thumbnail = ImageOps.fit(image, (edge, edge), Image.Resampling.LANCZOS)
+                buffer = io.BytesIO()
+                thumbnail.save(buffer, image_format, **options)
+                name = storage.save(name, ContentFile(buffer.getvalue()))
+            thumbnails[extension][str(size)] = name
+    return thumbnails
+
+
+def add_artwork_thumbnails(album: Album) -> Album:
+    """
+    Generate the thumbnails of an album and store their names in artwork_thumbnails.
+    An unreadable artwork is only logged, the album keeps using the full size image then.
+    """
+    try:
+        album.artwork_thumbnails = generate_artwork_thumbnails(album.artwork_file)
+    except (OSError, ValueError) as e:
+        print(f"Could not generate the artwork thumbnails of album {album.id}: {e}", flush=True)
+        return album
+    album.save(update_fields=["artwork_thumbnails"])
+    return album
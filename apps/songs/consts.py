@@ -0,0 +1,25 @@
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Background threads extracting the features of uploads made with ?background=true, each one uses several cores
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "1"))
+
+# Edge lengths (pixels) of the square album artwork thumbnails, generated as WebP and JPEG
+ARTWORK_THUMBNAIL_SIZES = [int(size) for size in os.getenv("ARTWORK_THUMBNAIL_SIZES", "96,256,512").split(",") if size]
+
+# Streaming renditions of every song, generated with ffmpeg after it is added: name -> encoder, bitrate and extension.
+# AUDIO_RENDITIONS selects the ones to generate, empty generates none.
+RENDITION_PRESETS = {
+    "opus_64": {"codec": "libopus", "bitrate": "64k", "extension": "opus"},
+    "aac_96": {"codec": "aac", "bitrate": "96k", "extension": "m4a"},
+    "mp3_128": {"codec": "libmp3lame", "bitrate": "128k", "extension": "mp3"},
+}
+AUDIO_RENDITIONS = [name.strip() for name in os.getenv("AUDIO_RENDITIONS", "opus_64,aac_96").split(",") if name.strip()]
+if set(AUDIO_RENDITIONS) - set(RENDITION_PRESETS):
+    raise RuntimeError(f"AUDIO_RENDITIONS can only contain {', '.join(RENDITION_PRESETS)}.")
+# Background threads running ffmpeg, each transcode is one ffmpeg process
+RENDITION_WORKERS = int(os.getenv("RENDITION_WORKERS", "2"))
+FFMPEG_PATH = os.getenv("FFMPEG_PATH", "ffmpeg")
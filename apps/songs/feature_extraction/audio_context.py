@@ -0,0 +1,86 @@
+import threading
+import time
+
+import librosa
+import numpy as np
+from essentia.standard import MonoLoader
+
+
+class AudioContext:
+    """
+    Decodes a song once and lazily memoizes every sample rate a feature extraction stage asks for.
+    Shared by SongInfoExtractor and MusicStructureAnalysis, so a song is decoded exactly once per upload,
+    and not at all if every stage comes from the stage cache.
+    """
+
+    def __init__(self, file_path: str, sr: int = 44100):
+        self.file_path = file_path
+        self.sr = sr
+        self.decode_time_s = 0.0
+
+        self._audio = {}
+        self._compute_time_s = {}
+        self._requests = {sr: 0}
+        self._lock = threading.Lock()
+        self._rate_locks = {sr: threading.Lock()}
+
+    def _decoded(self) -> np.ndarray:
+        with self._rate_locks[self.sr]:
+            if self.sr not in self._audio:
+                start = time.perf_counter()
+                audio = MonoLoader(filename=self.file_path, sampleRate=self.sr)()
+                self.decode_time_s = time.perf_counter() - start
+                with self._lock:
+                    self._compute_time_s[self.sr] = self.decode_time_s
+                    self._audio[self.sr] = audio
+        return self._audio[self.sr]
+
+    @property
+    def duration(self) -> float:
+        return len(self._decoded()) / float(self.sr)
+
+    def get(self, sr: int) -> np.ndarray:
+        """
+        Get the audio at a sample rate, resampling it from the decoded audio on first use
+        :param sr: Sample rate
+        :return: Mono audio samples (float32). Shared between stages, do not modify in place
+        """
+        with self._lock:
+            self._requests[sr] = self._requests.get(sr, 0) + 1
+            if sr in self._audio:
+                return self._audio[sr]
+            rate_lock = self._rate_locks.setdefault(sr, threading.Lock())
+
+        if sr == self.sr:
+            return self._decoded()
+        # stages running in parallel must not resample the same rate twice
+        with rate_lock:
+            if sr not in self._audio:
+                source = self._decoded()
+                start = time.perf_counter()
+                resampled = librosa.resample(source, orig_sr=self.sr, target_sr=sr)
+                with self._lock:
+                    self._compute_time_s[sr] = time.perf_counter() - start
+                    self._audio[sr] = resampled
+        return self._audio[sr]
+
+    def report(self) -> dict:
+        """
+        Time spent on decoding and resampling and the time saved by reusing the results.
+        Every request after the first one of a sample rate would have decoded or resampled the song again.
+        :return: Dictionary with the decode time and per sample rate the compute time, requests and saved time
+        """
+        with self._lock:
+            rates = {
+                sr: {
+                    "compute_time_s": self._compute_time_s.get(sr, 0.0),
+                    "requests": self._requests[sr],
+                    "saved_s": max(0, self._requests[sr] - 1) * self._compute_time_s.get(sr, 0.0),
+                }
+                for sr in sorted(self._requests)
+            }
+        return {
+            "decode_time_s": self.decode_time_s,
+            "rates": rates,
+            "saved_s": sum(rate["saved_s"] for rate in rates.values()),
+        }
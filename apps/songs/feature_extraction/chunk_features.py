@@ -0,0 +1,72 @@
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+from essentia.standard import Extractor, PoolAggregator
+
+# Kept free of the TensorFlow and random forest imports of song_info_extractor, so worker processes start fast.
+
+
+def _pool_value_to_python(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (np.floating, np.integer)):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return [_pool_value_to_python(v) for v in value]
+    return value
+
+
+def pool_to_dict(pool):
+    """
+    Convert an Essentia pool to the nested dictionary YamlOutput(format="json") would write, without a file round trip.
+    Descriptor names like "lowLevel.spectral_centroid.mean" become nested keys.
+    """
+    features = {}
+    for name in pool.descriptorNames():
+        *path, leaf = name.split(".")
+        node = features
+        for key in path:
+            node = node.setdefault(key, {})
+        node[leaf] = _pool_value_to_python(pool[name])
+    return features
+
+
+def compute_chunk_descriptors(audio_chunk: np.ndarray) -> dict:
+    """
+    Essentia descriptors of one GMBI frame, aggregated to min, max, median, mean and stdev
+    :param audio_chunk: Audio samples of the frame
+    :return: Nested descriptor dictionary, see pool_to_dict
+    """
+    features = Extractor()(audio_chunk)
+    return pool_to_dict(PoolAggregator(defaultStats=["min", "max", "median", "mean", "stdev"])(features))
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn instead of fork, the parent process already runs TensorFlow threads
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(_executor.shutdown, wait=False)
+        return _executor
+
+
+def compute_chunks_descriptors(audio_chunks: List[np.ndarray], workers: int) -> List[dict]:
+    """
+    Compute the descriptors of all GMBI frames of a song, spread over a process pool that lives as long as the process
+    :param audio_chunks: Audio samples of every frame
+    :param workers: Worker processes, 0 or 1 computes the descriptors in the calling process
+    :return: One descriptor dictionary per frame, in order
+    """
+    if workers <= 1 or len(audio_chunks) <= 1:
+        return [compute_chunk_descriptors(chunk) for chunk in audio_chunks]
+    chunksize = max(1, len(audio_chunks) // (workers * 4))
+    return list(_get_executor(workers).map(compute_chunk_descriptors, audio_chunks, chunksize=chunksize))
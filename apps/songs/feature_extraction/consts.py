@@ -38,6 +38,18 @@ GENRES = [
 
 MODEL_PATH = os.getenv("MODEL_PATH", "/run/media/chr1s/chr1sdrive1/MuInf/Models/")
 
+# worker processes computing the Essentia descriptors of the GMBI frames, 0 or 1 computes them in the calling process
+GMBI_FRAME_WORKERS = int(os.getenv("GMBI_FRAME_WORKERS", os.cpu_count() or 1))
+# directory of the stage result cache, caching is off without it
+FEATURE_CACHE_PATH = os.getenv("FEATURE_CACHE_PATH", "")
+# structure analysis of tracks longer than this (seconds) keeps only repetitions up to MSA_MAX_LAG_S apart (banded SSM),
+# which bounds its memory for DJ mixes and live recordings, 0 always computes the full SSM
+MSA_BANDED_MIN_DURATION_S = float(os.getenv("MSA_BANDED_MIN_DURATION_S", 1200))
+MSA_MAX_LAG_S = float(os.getenv("MSA_MAX_LAG_S", 300))
+# k-means restarts of the MSA segment labelling and the seed of their initializations, so labels are reproducible
+MSA_KMEANS_N_INIT = int(os.getenv("MSA_KMEANS_N_INIT", 200))
+MSA_KMEANS_SEED = int(os.getenv("MSA_KMEANS_SEED", 0))
+
 ML_MODELS = {
     "bpm": f"{MODEL_PATH}deeptemp-k16-3.pb",
     "voice": f"{MODEL_PATH}voice_instrumental-musicnn-msd-2.pb",  # voice[1]
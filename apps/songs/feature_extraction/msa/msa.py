@@ -5,14 +5,24 @@ from apps.songs.feature_extraction.msa.ssm import *
 from scipy import ndimage
 from essentia.standard import MonoLoader
 
+from apps.songs.feature_extraction.consts import MSA_KMEANS_N_INIT, MSA_KMEANS_SEED
+
 class MusicStructureAnalysis():
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, audio_context=None, max_lag_s=None):
+        """
+        max_lag_s: With a maximum lag (seconds) the SSM and the time-lag representation only keep repetitions
+        up to this distance (banded, float32), memory and time grow linearly instead of quadratically with the length
+        """
         self.file_path = file_path
+        self.max_lag_s = max_lag_s
         self.sr = 22050
         self.hop_length = 2205
         self.n_fft = 4410
-        self.audio = MonoLoader(filename=self.file_path, sampleRate=self.sr)()
+        if audio_context is not None:
+            self.audio = audio_context.get(self.sr)
+        else:
+            self.audio = MonoLoader(filename=self.file_path, sampleRate=self.sr)()
         self.duration = len(self.audio) / float(self.sr)
         self.chroma = None
         self.s_thresh = None
@@ -22,18 +32,19 @@ class MusicStructureAnalysis():
     
     def compute_ssm(self, L=40, H=10, L_smooth=4, tempo_rel_set=np.array([1]),
                              shift_set=np.array([0]), strategy='relative', scale=True, thresh=0.15,
-                             penalty=0.0, binarize=False):
-
-        # Chroma Feature Sequence and SSM (10 Hz)
-        Chroma = librosa.feature.chroma_stft(y=self.audio, sr=self.sr, tuning=0, norm=2, hop_length=self.hop_length, n_fft=self.n_fft)
-        Fs_C = self.sr / 2205
+                             penalty=0.0, binarize=False, dtype=np.float64):
+        """dtype: float32 halves the memory of the N x N matrices, the results differ in the order of 1e-5"""
+        if self.max_lag_s is not None:
+            if not np.array_equal(tempo_rel_set, [1]):
+                raise ValueError('The banded SSM only supports the relative tempo 1')
+            return self.compute_ssm_banded(L=L, H=H, L_smooth=L_smooth, shift_set=shift_set, strategy=strategy,
+                                           scale=scale, thresh=thresh, penalty=penalty, binarize=binarize)
 
-        # Chroma Feature Sequence and SSM
-        X, Fs_feature = smooth_downsample_feature_sequence(Chroma, Fs_C, filt_len=L, down_sampling=H)
-        X = normalize_feature_sequence(X, norm='2', threshold=0.001)
+        X, Fs_feature, Chroma = self.compute_features(L=L, H=H, dtype=dtype)
 
         # Compute SSM
-        S, I = compute_sm_ti(X, X, L=L_smooth, tempo_rel_set=tempo_rel_set, shift_set=shift_set, direction=2)
+        S, I = compute_sm_ti(X, X, L=L_smooth, tempo_rel_set=tempo_rel_set, shift_set=shift_set, direction=2,
+                             dtype=dtype)
         S_thresh = threshold_matrix(S, thresh=thresh, strategy=strategy,
                                             scale=scale, penalty=penalty, binarize=binarize)
         
@@ -44,8 +55,42 @@ class MusicStructureAnalysis():
         # plt.show()
 
         return X, Fs_feature, S_thresh, I, Chroma
+
+    def compute_features(self, L=40, H=10, dtype=np.float64):
+        # Chroma Feature Sequence and SSM (10 Hz)
+        Chroma = librosa.feature.chroma_stft(y=self.audio, sr=self.sr, tuning=0, norm=2, hop_length=self.hop_length, n_fft=self.n_fft)
+        Fs_C = self.sr / 2205
+
+        # Chroma Feature Sequence and SSM
+        X, Fs_feature = smooth_downsample_feature_sequence(Chroma, Fs_C, filt_len=L, down_sampling=H)
+        X = normalize_feature_sequence(X, norm='2', threshold=0.001, dtype=dtype)
+        return X, Fs_feature, Chroma
+
+    def compute_ssm_banded(self, L=40, H=10, L_smooth=4, shift_set=np.array([0]), strategy='relative', scale=True,
+                           thresh=0.15, penalty=0.0, binarize=False, tile=512):
+        """
+        compute_ssm keeping only the lags up to max_lag_s: self.s_thresh is the banded SSM of shape
+        (2 * max_lag + 1, N), see ssm.compute_sm_band. Only relative tempo 1 and the strategies 'relative'
+        (fraction of the cells in the band) and 'absolute' are supported.
+        """
+        X, Fs_feature, Chroma = self.compute_features(L=L, H=H, dtype=np.float32)
+        max_lag = int(min(X.shape[1] - 1, round(self.max_lag_s * Fs_feature)))
+
+        S, I = compute_sm_ti_band(X, X, max_lag, L=L_smooth, shift_set=shift_set, direction=2, tile=tile,
+                                  dtype=np.float32)
+        S_thresh = threshold_band(S, thresh=thresh, strategy=strategy, scale=scale, penalty=penalty, binarize=binarize)
+
+        self.chroma = Chroma
+        self.s_thresh = S_thresh
+        return X, Fs_feature, S_thresh, I, Chroma
     
     def compute_time_lag_representation(self, circular=True):
+        if self.max_lag_s is not None:
+            # the band is the non-circular representation restricted to the lags up to max_lag
+            self.timeLagRepresentation = (
+                compute_time_lag_representation_band(self.s_thresh) if circular else self.s_thresh
+            )
+            return self.timeLagRepresentation
         self.timeLagRepresentation = compute_time_lag_representation(self.s_thresh, circular=circular)
 
         # plt.imshow(self.timeLagRepresentation, origin='lower', interpolation='none')
@@ -95,7 +140,9 @@ class MusicStructureAnalysis():
         novPeaks_scaled_to_chroma = np.rint(self.noveltyPeaks_scaled(chroma_features.shape[0])).astype(int)
 
         est_labels, segments_labels, dist_to_KMean_centroid = compute_similarity(chroma_features, novPeaks_scaled_to_chroma, 
-                                                                              dirichlet=False,xmeans=True, k=5, offset=4)
+                                                                              dirichlet=False,xmeans=True, k=5, offset=4,
+                                                                              n_init=MSA_KMEANS_N_INIT,
+                                                                              seed=MSA_KMEANS_SEED)
         
         dist_to_KMean_centroid = self.scale_distances_to_KMeanCentroid(segments_labels, dist_to_KMean_centroid)
         
@@ -2,6 +2,11 @@ import numpy as np
 from scipy import signal
 from matplotlib import pyplot as plt
 from scipy.ndimage import filters
+from numpy.lib.stride_tricks import as_strided
+
+# zero rows between the positive and negative lags of the banded time-lag representation, at least twice the rows
+# the filters of MusicStructureAnalysis.compute_novelty_function reach (median 1 + gaussian 8)
+TIME_LAG_BAND_PADDING = 20
 
 def compute_kernel_checkerboard_gaussian(L, var=0.5, normalize=True):
     taper = np.sqrt(1/2) / (L * var)
@@ -27,13 +32,12 @@ def compute_novelty_ssm(S, kernel=None, L=5, var=0.5, exclude=False):
         kernel = compute_kernel_checkerboard_gaussian(L=L, var=var)
     N = S.shape[0]
     M = 2*L + 1
-    nov = np.zeros(N)
-    # np.pad does not work with numba/jit
     S_padded = np.pad(S, L, mode='constant')
 
-    for n in range(N):
-        # Does not work with numba/jit
-        nov[n] = np.sum(S_padded[n:n+M, n:n+M] * kernel)
+    # the M x M blocks along the diagonal as a strided view, weighted with the kernel in one einsum
+    s0, s1 = S_padded.strides
+    blocks = as_strided(S_padded, shape=(N, M, M), strides=(s0 + s1, s0, s1), writeable=False)
+    nov = np.einsum('nij,ij->n', blocks, kernel)
     if exclude:
         right = np.min([L, N])
         left = np.max([0, N-L])
@@ -52,8 +56,12 @@ def compute_nc(X, kernel=None):
     M = G.shape[0]
     nc = np.zeros(N)
 
-    for i in range(M // 2, N - M // 2 + 1):
-        nc[i] = np.sum(X[i - M // 2:i + M // 2, i - M // 2:i + M // 2] * G)
+    # the blocks X[i - M // 2:i + M // 2, i - M // 2:i + M // 2] for all i as a strided view
+    W = 2 * (M // 2)
+    if N - W + 1 > 0:
+        s0, s1 = X.strides
+        blocks = as_strided(X, shape=(N - W + 1, W, W), strides=(s0 + s1, s0, s1), writeable=False)
+        nc[M // 2:N - M // 2 + 1] = np.einsum('nij,ij->n', blocks, G)
 
     # Normalize
     nc += nc.min()
@@ -69,13 +77,10 @@ def pick_peaks(nc, L=16, mean=8, name_of_png=None):
     th = filters.median_filter(nc, size=L) + offset
     #th = filters.gaussian_filter(nc, sigma=L/2., mode="nearest") + offset
 
-    peaks = []
-    for i in range(1, nc.shape[0] - 1):
-        # is it a peak?
-        if nc[i - 1] < nc[i] and nc[i] > nc[i + 1]:
-            # is it above the threshold?
-            if nc[i] > th[i]:
-                peaks.append(i)
+    # local maxima above the threshold
+    center = nc[1:-1]
+    is_peak = (nc[:-2] < center) & (center > nc[2:]) & (center > th[1:-1])
+    peaks = (np.flatnonzero(is_peak) + 1).tolist()
     
     if name_of_png is not None:
         plt.plot(nc)
@@ -105,15 +110,17 @@ def compute_time_lag_representation(S, circular=True):
         L (np.ndarray): (Circular) time-lag representation of S
     """
     N = S.shape[0]
+    # L[m, n] = S_stacked[m + n, n]: a view with the row stride plus the column stride along the columns,
+    # S_stacked is S twice (circular) or S between N - 1 zero rows
     if circular:
-        L = np.zeros((N, N))
-        for n in range(N):
-            L[:, n] = np.roll(S[:, n], -n)
+        S_stacked = np.concatenate([S, S], axis=0)
+        rows = N
     else:
-        L = np.zeros((2*N-1, N))
-        for n in range(N):
-            L[((N-1)-n):((2*N)-1-n), n] = S[:, n]
-    return L
+        S_stacked = np.zeros((3*N-2, N), dtype=S.dtype)
+        S_stacked[N-1:2*N-1] = S
+        rows = 2*N-1
+    s0, s1 = S_stacked.strides
+    return as_strided(S_stacked, shape=(rows, N), strides=(s0, s0 + s1), writeable=False).copy()
 
 def novelty_structure_feature(L, padding=True):
     """Computation of the novelty function from a circular time-lag representation
@@ -121,17 +128,40 @@ def novelty_structure_feature(L, padding=True):
     Notebook: C4/C4S4_StructureFeature.ipynb
 
     Args:
-        L (np.ndarray): Circular time-lag representation
+        L (np.ndarray): Circular time-lag representation (dense or banded)
         padding (bool): Padding the result with the value zero (Default value = True)
 
     Returns:
         nov (np.ndarray): Novelty function
     """
-    N = L.shape[0]
+    # columns, the banded time-lag representation has fewer rows than columns
+    N = L.shape[1]
     if padding:
         nov = np.zeros(N)
     else:
         nov = np.zeros(N-1)
-    for n in range(N-1):
-        nov[n] = np.linalg.norm(L[:, n+1] - L[:, n])
-    return nov
\ No newline at end of file
+    nov[:N-1] = np.sqrt(np.sum(np.diff(L, axis=1) ** 2, axis=0))
+    return nov
+
+def compute_time_lag_representation_band(B, padding=TIME_LAG_BAND_PADDING):
+    """Circular time-lag representation of a banded SM (see ssm.compute_sm_band), without the rows of the lags
+    outside of the band, which are 0: lags 0..max_lag, padding zero rows, lags -max_lag..-1.
+    Filters reaching at most padding / 2 rows see the same neighbourhood as in the dense representation, so their
+    results equal the dense ones on the kept rows. With 2 * max_lag + 1 + padding >= N the result is the dense
+    representation of the band.
+
+    Args:
+        B (np.ndarray): Banded SM
+        padding (int): Zero rows between the positive and the negative lags (Default value = TIME_LAG_BAND_PADDING)
+
+    Returns:
+        L (np.ndarray): Banded circular time-lag representation of shape (min(N, 2 * max_lag + 1 + padding), N)
+    """
+    max_lag = (B.shape[0] - 1) // 2
+    N = B.shape[1]
+    R = min(N, 2 * max_lag + 1 + padding)
+    L = np.zeros((R, N), dtype=B.dtype)
+    L[:max_lag + 1] = B[max_lag:]
+    # with R = N the negative lags share rows with the positive ones, in the cells those leave at 0
+    L[R - max_lag:] += B[:max_lag]
+    return L
@@ -81,20 +81,24 @@ def feat_segments_to_2dfmc_max(feat_segments, offset=4):
     return np.asarray(fmcs)
 
 
-def compute_labels_kmeans(fmcs, k):
+def labelling_features(fmcs):
+    """The 2D-FMCs as the segments are clustered: log of the lower frequencies, whitened."""
     # Removing the higher frequencies seem to yield better results
     fmcs = fmcs[:, fmcs.shape[1] // 2:]
 
     # Pre-process
     fmcs = np.log1p(fmcs)
-    wfmcs = vq.whiten(fmcs)
+    return vq.whiten(fmcs)
+
+def compute_labels_kmeans(fmcs, k, n_init=200, seed=None):
+    wfmcs = labelling_features(fmcs)
 
     # Make sure we are not using more clusters than existing segments
-    if k > fmcs.shape[0]:
-        k = fmcs.shape[0]
+    if k > wfmcs.shape[0]:
+        k = wfmcs.shape[0]
 
     # K-means
-    kmeans = KMeans(n_clusters=k, n_init=200)
+    kmeans = KMeans(n_clusters=k, n_init=n_init, random_state=seed)
     kmeans.fit(wfmcs)
 
     # store labels and indices
@@ -104,8 +108,17 @@ def compute_labels_kmeans(fmcs, k):
     
     return kmeans.labels_, idxs_labels, dist_to_centroid
 
+def compute_labels_xmeans(fmcs, th=0.01, maxK=8, n_init=200, seed=None):
+    """Estimates K with the X-means BIC sweep on the 2D-FMCs and labels the segments with k-means for that K."""
+    xm = XMeans(fmcs, plot=False, seed=seed)
+    k = xm.estimate_K_knee(th=th, maxK=maxK)
+    return compute_labels_kmeans(fmcs, k=k, n_init=n_init, seed=seed)
+
 def compute_similarity(F, bound_idxs, dirichlet=False, xmeans=False, k=5,
-                       offset=4):
+                       offset=4, n_init=200, seed=None):
+    """
+    n_init: k-means restarts, seed: seed of the k-means initializations (None is not deterministic)
+    """
     # Get the feature segments
     feat_segments = get_feat_segments(F, bound_idxs)
 
@@ -128,11 +141,10 @@ def compute_similarity(F, bound_idxs, dirichlet=False, xmeans=False, k=5,
             est_labels = dpgmm.predict(fmcs)
             #print("Estimated with Dirichlet Process:", k)
     if xmeans:
-        xm = XMeans(fmcs, plot=False)
-        k = xm.estimate_K_knee(th=0.01, maxK=8)
-        est_labels, idxs_labels, dist_to_centroid = compute_labels_kmeans(fmcs, k=k)
+        est_labels, idxs_labels, dist_to_centroid = compute_labels_xmeans(fmcs, th=0.01, maxK=8, n_init=n_init,
+                                                                          seed=seed)
         #print("Estimated with Xmeans:", k)
     else:
-        est_labels, idxs_labels, dist_to_centroid = compute_labels_kmeans(fmcs, k=k)
+        est_labels, idxs_labels, dist_to_centroid = compute_labels_kmeans(fmcs, k=k, n_init=n_init, seed=seed)
 
     return est_labels, idxs_labels, dist_to_centroid
\ No newline at end of file
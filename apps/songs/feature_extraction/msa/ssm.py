@@ -1,6 +1,7 @@
 import librosa
 from scipy import signal
 import numpy as np
+from numpy.lib.stride_tricks import as_strided
 
 def smooth_downsample_feature_sequence(X, Fs, filt_len=41, down_sampling=10, w_type='boxcar'):
     """Smoothes and downsamples a feature sequence. Smoothing is achieved by convolution with a filter kernel
@@ -24,7 +25,7 @@ def smooth_downsample_feature_sequence(X, Fs, filt_len=41, down_sampling=10, w_t
     Fs_feature = Fs / down_sampling
     return X_smooth, Fs_feature
 
-def normalize_feature_sequence(X, norm='2', threshold=0.0001, v=None):
+def normalize_feature_sequence(X, norm='2', threshold=0.0001, v=None, dtype=np.float64):
     """Normalizes the columns of a feature sequence
 
     Notebook: C3/C3S1_FeatureNormalization.ipynb
@@ -36,6 +37,7 @@ def normalize_feature_sequence(X, norm='2', threshold=0.0001, v=None):
             (Default value = 0.0001)
         v (float): Used instead of normalization below ``threshold``. If None, uses unit vector for given norm
             (Default value = None)
+        dtype (np.dtype): Data type of the result (Default value = np.float64)
 
     Returns:
         X_norm (np.ndarray): Normalized feature sequence
@@ -43,49 +45,32 @@ def normalize_feature_sequence(X, norm='2', threshold=0.0001, v=None):
     assert norm in ['1', '2', 'max', 'z']
 
     K, N = X.shape
-    X_norm = np.zeros((K, N))
+    X = np.asarray(X, dtype=np.float64)
 
+    # norms of all columns at once instead of one column per loop iteration
     if norm == '1':
         if v is None:
             v = np.ones(K, dtype=np.float64) / K
-        for n in range(N):
-            s = np.sum(np.abs(X[:, n]))
-            if s > threshold:
-                X_norm[:, n] = X[:, n] / s
-            else:
-                X_norm[:, n] = v
-
+        s = np.sum(np.abs(X), axis=0)
     if norm == '2':
         if v is None:
             v = np.ones(K, dtype=np.float64) / np.sqrt(K)
-        for n in range(N):
-            s = np.sqrt(np.sum(X[:, n] ** 2))
-            if s > threshold:
-                X_norm[:, n] = X[:, n] / s
-            else:
-                X_norm[:, n] = v
-
+        s = np.sqrt(np.sum(X ** 2, axis=0))
     if norm == 'max':
         if v is None:
             v = np.ones(K, dtype=np.float64)
-        for n in range(N):
-            s = np.max(np.abs(X[:, n]))
-            if s > threshold:
-                X_norm[:, n] = X[:, n] / s
-            else:
-                X_norm[:, n] = v
-
+        s = np.max(np.abs(X), axis=0)
     if norm == 'z':
         if v is None:
             v = np.zeros(K, dtype=np.float64)
-        for n in range(N):
-            mu = np.sum(X[:, n]) / K
-            sigma = np.sqrt(np.sum((X[:, n] - mu) ** 2) / (K - 1))
-            if sigma > threshold:
-                X_norm[:, n] = (X[:, n] - mu) / sigma
-            else:
-                X_norm[:, n] = v
-
+        mu = np.sum(X, axis=0) / K
+        X = X - mu
+        s = np.sqrt(np.sum(X ** 2, axis=0) / (K - 1))
+
+    valid = s > threshold
+    X_norm = np.empty((K, N), dtype=dtype)
+    X_norm[:, valid] = X[:, valid] / s[valid]
+    X_norm[:, ~valid] = np.reshape(v, (K, 1))
     return X_norm
 
 def compute_sm_dot(X, Y):
@@ -103,7 +88,54 @@ def compute_sm_dot(X, Y):
     S = np.dot(np.transpose(X), Y)
     return S
 
-def filter_diag_mult_sm(S, L=1, tempo_rel_set=np.asarray([1]), direction=0):
+# from this filter length on the cumulative sums are faster than adding L shifted copies
+DIAG_CUMSUM_MIN_LENGTH = 8
+
+def _diag_cumsum_window_sum(S, L):
+    """Backward diagonal sums as differences of diagonal cumulative sums, see _diag_window_sum"""
+    N, M = S.shape
+    # row i of S is placed at column offset N of a zero padded buffer, read with a row stride of N + M + 1
+    # every diagonal of S becomes a column of the skewed view, cells outside of S read the zero padding
+    buffer = np.zeros(N * (N + M + 1), dtype=S.dtype)
+    padded = buffer[:N * (N + M)].reshape(N, N + M)
+    padded[:, N:] = S
+    skewed = as_strided(buffer, shape=(N, N + M), strides=(buffer.itemsize * (N + M + 1), buffer.itemsize))
+    np.cumsum(skewed, axis=0, out=skewed)
+    S_L = padded[:, N:].copy()
+    if L < N:
+        # the cumulative sum L cells up the diagonal, zero where the diagonal starts less than L cells before
+        S_L[L:, :] -= padded[:-L, N-L:N+M-L]
+    return S_L
+
+def _diag_window_sum(S, L, direction):
+    """Sums of L cells along the diagonals, cells outside of S count as 0
+
+    Args:
+        S (np.ndarray): Matrix
+        L (int): Length of the sums
+        direction (int): 0: S_L[i, j] = S[i, j] + ... + S[i+L-1, j+L-1];
+            1: S_L[i, j] = S[i, j] + ... + S[i-L+1, j-L+1]
+
+    Returns:
+        S_L (np.ndarray): Diagonal sums
+    """
+    if L >= DIAG_CUMSUM_MIN_LENGTH:
+        if direction == 0:
+            # forward: the backward sums of the matrix flipped along both axes
+            return _diag_cumsum_window_sum(S[::-1, ::-1], L)[::-1, ::-1]
+        return _diag_cumsum_window_sum(S, L)
+
+    # in place on views, without the padded copy, summed in the same order as before (bit-for-bit equal)
+    N, M = S.shape
+    S_L = S.copy()
+    for pos in range(1, min(L, N, M)):
+        if direction == 0:
+            S_L[:N-pos, :M-pos] += S[pos:, pos:]
+        else:
+            S_L[pos:, pos:] += S[:N-pos, :M-pos]
+    return S_L
+
+def filter_diag_mult_sm(S, L=1, tempo_rel_set=np.asarray([1]), direction=0, dtype=np.float64):
     """Path smoothing of similarity matrix by filtering in forward or backward direction
     along various directions around main diagonal.
     Note: Directions are simulated by resampling one axis using relative tempo values
@@ -115,6 +147,7 @@ def filter_diag_mult_sm(S, L=1, tempo_rel_set=np.asarray([1]), direction=0):
         L (int): Length of filter (Default value = 1)
         tempo_rel_set (np.ndarray): Set of relative tempo values (Default value = np.asarray([1]))
         direction (int): Direction of smoothing (0: forward; 1: backward) (Default value = 0)
+        dtype (np.dtype): Data type of the computation and the result (Default value = np.float64)
 
     Returns:
         S_L_final (np.ndarray): Smoothed SM
@@ -122,7 +155,7 @@ def filter_diag_mult_sm(S, L=1, tempo_rel_set=np.asarray([1]), direction=0):
     N = S.shape[0]
     M = S.shape[1]
     num = len(tempo_rel_set)
-    S_L_final = np.zeros((N, M))
+    S_L_final = np.zeros((N, M), dtype=dtype)
 
     for s in range(0, num):
         M_ceil = int(np.ceil(M / tempo_rel_set[s]))
@@ -130,31 +163,22 @@ def filter_diag_mult_sm(S, L=1, tempo_rel_set=np.asarray([1]), direction=0):
         np.around(resample, 0, resample)
         resample = resample - 1
         index_resample = np.maximum(resample, np.zeros(len(resample))).astype(np.int64)
-        S_resample = S[:, index_resample]
-
-        S_L = np.zeros((N, M_ceil))
-        S_extend_L = np.zeros((N + L, M_ceil + L))
-
-        # Forward direction
-        if direction == 0:
-            S_extend_L[0:N, 0:M_ceil] = S_resample
-            for pos in range(0, L):
-                S_L = S_L + S_extend_L[pos:(N + pos), pos:(M_ceil + pos)]
-
-        # Backward direction
-        if direction == 1:
-            S_extend_L[L:(N+L), L:(M_ceil+L)] = S_resample
-            for pos in range(0, L):
-                S_L = S_L + S_extend_L[(L-pos):(N + L - pos), (L-pos):(M_ceil + L - pos)]
+        if M_ceil == M:
+            # relative tempo 1, the resampling is the identity
+            S_resample = np.asarray(S, dtype=dtype)
+        else:
+            S_resample = np.asarray(S[:, index_resample], dtype=dtype)
 
-        S_L = S_L / L
-        resample = np.multiply(np.divide(np.arange(1, M+1), M), M_ceil)
-        np.around(resample, 0, resample)
-        resample = resample - 1
-        index_resample = np.maximum(resample, np.zeros(len(resample))).astype(np.int64)
+        S_L = _diag_window_sum(S_resample, L, direction)
+        S_L /= L
+        if M_ceil != M:
+            resample = np.multiply(np.divide(np.arange(1, M+1), M), M_ceil)
+            np.around(resample, 0, resample)
+            resample = resample - 1
+            index_resample = np.maximum(resample, np.zeros(len(resample))).astype(np.int64)
+            S_L = S_L[:, index_resample]
 
-        S_resample_inv = S_L[:, index_resample]
-        S_L_final = np.maximum(S_L_final, S_resample_inv)
+        np.maximum(S_L_final, S_L, out=S_L_final)
 
     return S_L_final
 
@@ -189,8 +213,8 @@ def threshold_matrix(S, thresh, strategy='absolute', scale=False, penalty=0.0, b
         thresh_rel = thresh
         num_cells_below_thresh = int(np.round(S_thresh.size*(1-thresh_rel)))
         if num_cells_below_thresh < num_cells:
-            values_sorted = np.sort(S_thresh.flatten('F'))
-            thresh_abs = values_sorted[num_cells_below_thresh]
+            # the k-th smallest value, a partial sort is enough
+            thresh_abs = np.partition(S_thresh, num_cells_below_thresh, axis=None)[num_cells_below_thresh]
             S_thresh[S_thresh < thresh_abs] = 0
         else:
             S_thresh = np.zeros([N, M])
@@ -198,23 +222,18 @@ def threshold_matrix(S, thresh, strategy='absolute', scale=False, penalty=0.0, b
     if strategy == 'local':
         thresh_rel_row = thresh[0]
         thresh_rel_col = thresh[1]
-        S_binary_row = np.zeros([N, M])
+        # per row and per column k-th smallest values with one partial sort per axis
+        S_binary_row = np.zeros([N, M], dtype=bool)
         num_cells_row_below_thresh = int(np.round(M * (1-thresh_rel_row)))
-        for n in range(N):
-            row = S[n, :]
-            values_sorted = np.sort(row)
-            if num_cells_row_below_thresh < M:
-                thresh_abs = values_sorted[num_cells_row_below_thresh]
-                S_binary_row[n, :] = (row >= thresh_abs)
-        S_binary_col = np.zeros([N, M])
+        if num_cells_row_below_thresh < M:
+            thresh_abs = np.partition(S, num_cells_row_below_thresh, axis=1)[:, num_cells_row_below_thresh]
+            S_binary_row = S >= thresh_abs[:, None]
+        S_binary_col = np.zeros([N, M], dtype=bool)
         num_cells_col_below_thresh = int(np.round(N * (1-thresh_rel_col)))
-        for m in range(M):
-            col = S[:, m]
-            values_sorted = np.sort(col)
-            if num_cells_col_below_thresh < N:
-                thresh_abs = values_sorted[num_cells_col_below_thresh]
-                S_binary_col[:, m] = (col >= thresh_abs)
-        S_thresh = S * S_binary_row * S_binary_col
+        if num_cells_col_below_thresh < N:
+            thresh_abs = np.partition(S, num_cells_col_below_thresh, axis=0)[num_cells_col_below_thresh, :]
+            S_binary_col = S >= thresh_abs[None, :]
+        S_thresh = S * (S_binary_row & S_binary_col)
 
     if scale:
         cell_val_zero = np.where(S_thresh == 0)
@@ -257,7 +276,8 @@ def shift_cyc_matrix(X, shift=0):
     X_cyc[0:shift, :] = X[K-shift:K, :]
     return X_cyc
 
-def compute_sm_ti(X, Y, L=1, tempo_rel_set=np.asarray([1]), shift_set=np.asarray([0]), direction=2):
+def compute_sm_ti(X, Y, L=1, tempo_rel_set=np.asarray([1]), shift_set=np.asarray([0]), direction=2,
+                  dtype=np.float64):
     """Compute enhanced similaity matrix by applying path smoothing and transpositions
 
     Notebook: C4/C4S2_SSM-TranspositionInvariance.ipynb
@@ -269,6 +289,8 @@ def compute_sm_ti(X, Y, L=1, tempo_rel_set=np.asarray([1]), shift_set=np.asarray
         tempo_rel_set (np.ndarray): Set of relative tempo values (Default value = np.asarray([1]))
         shift_set (np.ndarray): Set of shift indices (Default value = np.asarray([0]))
         direction (int): Direction of smoothing (0: forward; 1: backward; 2: both directions) (Default value = 2)
+        dtype (np.dtype): Data type of the computation and the result, float32 halves the memory of the
+            N x N matrices (Default value = np.float64)
 
     Returns:
         S_TI (np.ndarray): Transposition-invariant SM
@@ -276,15 +298,15 @@ def compute_sm_ti(X, Y, L=1, tempo_rel_set=np.asarray([1]), shift_set=np.asarray
     """
     for shift in shift_set:
         Y_cyc = shift_cyc_matrix(Y, shift)
-        S_cyc = compute_sm_dot(X, Y_cyc)
+        S_cyc = compute_sm_dot(np.asarray(X, dtype=dtype), np.asarray(Y_cyc, dtype=dtype))
 
         if direction == 0:
-            S_cyc = filter_diag_mult_sm(S_cyc, L, tempo_rel_set, direction=0)
+            S_cyc = filter_diag_mult_sm(S_cyc, L, tempo_rel_set, direction=0, dtype=dtype)
         if direction == 1:
-            S_cyc = filter_diag_mult_sm(S_cyc, L, tempo_rel_set, direction=1)
+            S_cyc = filter_diag_mult_sm(S_cyc, L, tempo_rel_set, direction=1, dtype=dtype)
         if direction == 2:
-            S_forward = filter_diag_mult_sm(S_cyc, L, tempo_rel_set=tempo_rel_set, direction=0)
-            S_backward = filter_diag_mult_sm(S_cyc, L, tempo_rel_set=tempo_rel_set, direction=1)
+            S_forward = filter_diag_mult_sm(S_cyc, L, tempo_rel_set=tempo_rel_set, direction=0, dtype=dtype)
+            S_backward = filter_diag_mult_sm(S_cyc, L, tempo_rel_set=tempo_rel_set, direction=1, dtype=dtype)
             S_cyc = np.maximum(S_forward, S_backward)
         if shift == shift_set[0]:
             S_TI = S_cyc
@@ -298,6 +320,167 @@ def compute_sm_ti(X, Y, L=1, tempo_rel_set=np.asarray([1]), shift_set=np.asarray
 
     return S_TI, I_TI
 
+# Banded SSM: only the lags -max_lag..max_lag of an SSM, stored in lag coordinates as a (2 * max_lag + 1) x N matrix
+# B[max_lag + d, n] = S[n + d, n], cells with n + d outside of the sequence are 0. Memory grows linearly with N.
+
+def band_valid_mask(N, max_lag):
+    """Cells of a banded SSM that lie inside of the N x N matrix
+
+    Args:
+        N (int): Length of the feature sequence
+        max_lag (int): Largest lag of the band
+
+    Returns:
+        valid (np.ndarray): Boolean mask of shape (2 * max_lag + 1, N)
+    """
+    lag = np.arange(-max_lag, max_lag + 1)[:, None]
+    target = np.arange(N)[None, :] + lag
+    return (target >= 0) & (target < N)
+
+def compute_sm_band(X, Y, max_lag, tile=512, dtype=np.float32):
+    """Banded similarity matrix B[max_lag + d, n] = <X[:, n + d], Y[:, n]>, computed in tiles of columns
+    so no N x N matrix is allocated
+
+    Args:
+        X (np.ndarray): First feature sequence
+        Y (np.ndarray): Second feature sequence
+        max_lag (int): Largest lag of the band
+        tile (int): Columns per tile, a tile needs (tile + 2 * max_lag) x tile cells (Default value = 512)
+        dtype (np.dtype): Data type of the result (Default value = np.float32)
+
+    Returns:
+        B (np.ndarray): Banded SM of shape (2 * max_lag + 1, N)
+    """
+    K, N = X.shape
+    X_padded = np.zeros((K, N + 2 * max_lag), dtype=dtype)
+    X_padded[:, max_lag:max_lag + N] = X
+    Y = np.asarray(Y, dtype=dtype)
+    B = np.empty((2 * max_lag + 1, N), dtype=dtype)
+    for start in range(0, N, tile):
+        stop = min(start + tile, N)
+        # G[r, c] = <X[:, start + r - max_lag], Y[:, start + c]>, the band is G[c + max_lag + d, c]
+        G = np.ascontiguousarray(np.dot(np.transpose(X_padded[:, start:stop + 2 * max_lag]), Y[:, start:stop]))
+        s0, s1 = G.strides
+        B[:, start:stop] = as_strided(G, shape=(2 * max_lag + 1, stop - start), strides=(s0, s0 + s1))
+    return B
+
+def filter_diag_band(B, L=1, direction=0):
+    """Path smoothing of a banded SM, the diagonals of the SM are the rows of the band
+
+    Args:
+        B (np.ndarray): Banded SM
+        L (int): Length of filter (Default value = 1)
+        direction (int): Direction of smoothing (0: forward; 1: backward) (Default value = 0)
+
+    Returns:
+        B_L (np.ndarray): Smoothed banded SM
+    """
+    if direction == 0:
+        # forward: the backward sums of the reversed rows
+        return filter_diag_band(B[:, ::-1], L, direction=1)[:, ::-1]
+
+    N = B.shape[1]
+    if L >= DIAG_CUMSUM_MIN_LENGTH:
+        C = np.cumsum(B, axis=1)
+        B_L = C.copy()
+        if L < N:
+            B_L[:, L:] -= C[:, :-L]
+    else:
+        B_L = B.copy()
+        for pos in range(1, min(L, N)):
+            B_L[:, pos:] += B[:, :N-pos]
+    B_L /= L
+    return B_L
+
+def compute_sm_ti_band(X, Y, max_lag, L=1, shift_set=np.asarray([0]), direction=2, tile=512, dtype=np.float32):
+    """Banded version of compute_sm_ti with relative tempo 1 (resampling would not keep the band)
+
+    Args:
+        X (np.ndarray): First feature sequence
+        Y (np.ndarray): Second feature sequence
+        max_lag (int): Largest lag of the band
+        L (int): Length of filter (Default value = 1)
+        shift_set (np.ndarray): Set of shift indices (Default value = np.asarray([0]))
+        direction (int): Direction of smoothing (0: forward; 1: backward; 2: both directions) (Default value = 2)
+        tile (int): Columns per tile of compute_sm_band (Default value = 512)
+        dtype (np.dtype): Data type of the computation and the result (Default value = np.float32)
+
+    Returns:
+        B_TI (np.ndarray): Transposition-invariant banded SM
+        I_TI (np.ndarray): Transposition index band
+    """
+    for shift in shift_set:
+        Y_cyc = shift_cyc_matrix(Y, shift)
+        B_cyc = compute_sm_band(X, Y_cyc, max_lag, tile=tile, dtype=dtype)
+
+        if direction == 0:
+            B_cyc = filter_diag_band(B_cyc, L, direction=0)
+        if direction == 1:
+            B_cyc = filter_diag_band(B_cyc, L, direction=1)
+        if direction == 2:
+            B_cyc = np.maximum(filter_diag_band(B_cyc, L, direction=0), filter_diag_band(B_cyc, L, direction=1))
+        if shift == shift_set[0]:
+            B_TI = B_cyc
+            I_TI = np.full(B_cyc.shape, shift, dtype=np.int8)
+        else:
+            I_TI[B_cyc > B_TI] = shift
+            B_TI = np.maximum(B_cyc, B_TI)
+
+    return B_TI, I_TI
+
+def threshold_band(B, thresh, strategy='relative', scale=False, penalty=0.0, binarize=False):
+    """threshold_matrix for a banded SM, the relative threshold and the scaling only consider the cells of the band
+    inside of the SM, the cells outside of it stay 0
+
+    Args:
+        B (np.ndarray): Banded SM
+        thresh (float): Treshold (meaning depends on strategy)
+        strategy (str): Thresholding strategy ('absolute', 'relative') (Default value = 'relative')
+        scale (bool): If scale=True, then scaling of positive values to range [0,1] (Default value = False)
+        penalty (float): Set values below treshold to value specified (Default value = 0.0)
+        binarize (bool): Binarizes final matrix (positive: 1; otherwise: 0) (Default value = False)
+
+    Returns:
+        B_thresh (np.ndarray): Thresholded banded SM
+    """
+    if strategy not in ['absolute', 'relative']:
+        raise ValueError(f'Thresholding strategy {strategy} is not supported for banded matrices')
+    if np.min(B) < 0:
+        raise Exception('All entries of the input matrix must be nonnegative')
+
+    valid = band_valid_mask(B.shape[1], (B.shape[0] - 1) // 2)
+    B_thresh = np.copy(B)
+
+    if strategy == 'absolute':
+        B_thresh[B_thresh < thresh] = 0
+
+    if strategy == 'relative':
+        values = B_thresh[valid]
+        num_cells_below_thresh = int(np.round(values.size * (1 - thresh)))
+        if num_cells_below_thresh < values.size:
+            thresh_abs = np.partition(values, num_cells_below_thresh)[num_cells_below_thresh]
+            B_thresh[B_thresh < thresh_abs] = 0
+        else:
+            B_thresh[...] = 0
+
+    if scale:
+        cell_val_zero = valid & (B_thresh == 0)
+        cell_val_pos = B_thresh > 0
+        min_value = np.min(B_thresh[cell_val_pos]) if np.any(cell_val_pos) else 0
+        max_value = np.max(B_thresh)
+        if max_value > min_value:
+            B_thresh -= min_value
+            B_thresh /= max_value - min_value
+            B_thresh[cell_val_zero] = penalty
+            B_thresh[~valid] = 0
+        else:
+            print('Condition max_value > min_value is voliated: output zero matrix')
+
+    if binarize:
+        B_thresh[B_thresh > 0] = 1
+        B_thresh[B_thresh < 0] = 0
+    return B_thresh
+
 def compute_ssm(fn_wav, L=21, H=5, L_smooth=16, tempo_rel_set=np.array([1]),
                              shift_set=np.array([0]), strategy='relative', scale=True, thresh=0.15,
                              penalty=0.0, binarize=False):
@@ -4,13 +4,18 @@ import numpy as np
 import time
 import pylab as plt
 import scipy.cluster.vq as vq
-from scipy.spatial import distance
 
 class XMeans:
-    def __init__(self, X, init_K=2, plot=False):
+    def __init__(self, X, init_K=2, plot=False, n_init=100, seed=None):
+        """
+        n_init: k-means restarts per K, the one with the lowest distortion is kept
+        seed: Seed of the k-means initializations, None is not deterministic
+        """
         self.X = X
         self.init_K = init_K
         self.plot = plot
+        self.n_init = n_init
+        self.seed = seed
 
     def estimate_K_xmeans(self, th=0.2, maxK = 10):
         """Estimates K running X-means algorithm (Pelleg & Moore, 2000)."""
@@ -88,10 +93,12 @@ class XMeans:
             maxK = 2
         K = np.arange(1, maxK)
         bics = []
+        # whiten once for the whole sweep
+        wX = vq.whiten(self.X)
         for k in K:
-            means, labels = self.run_kmeans(self.X, k)
-            bic = self.compute_bic(self.X, means, labels, K=k,
-                                   R=self.X.shape[0])
+            means, labels = self.run_kmeans(wX, k, whitened=True)
+            bic = self.compute_bic(wX, means, labels, K=k,
+                                   R=self.X.shape[0], whitened=True)
             bics.append(bic)
         diff_bics = np.diff(bics)
         finalK = K[-1]
@@ -133,30 +140,26 @@ class XMeans:
         D = X[np.argwhere(labels == label_index)]
         return D.reshape((D.shape[0], D.shape[-1]))
 
-    def run_kmeans(self, X, K):
+    def run_kmeans(self, X, K, whitened=False):
         """Runs k-means and returns the labels assigned to the data."""
-        wX = vq.whiten(X)
-        means, dist = vq.kmeans(wX, K, iter=100)
+        wX = X if whitened else vq.whiten(X)
+        means, dist = vq.kmeans(wX, K, iter=self.n_init, seed=self.seed)
         labels, dist = vq.vq(wX, means)
         return means, labels
 
-    def compute_bic(self, D, means, labels, K, R):
+    def compute_bic(self, D, means, labels, K, R, whitened=False):
         """Computes the Bayesian Information Criterion."""
-        D = vq.whiten(D)
+        if not whitened:
+            D = vq.whiten(D)
         Rn = D.shape[0]
         M = D.shape[1]
 
         if R == K:
             return 1
 
-        # Maximum likelihood estimate (MLE)
-        mle_var = 0
-        for k in range(len(means)):
-            X = D[np.argwhere(labels == k)]
-            X = X.reshape((X.shape[0], X.shape[-1]))
-            for x in X:
-                mle_var += distance.euclidean(x, means[k])
-                #print x, means[k], mle_var
+        # Maximum likelihood estimate (MLE): sum of the distances of the points to their means
+        labels = np.asarray(labels, dtype=int)
+        mle_var = np.sum(np.sqrt(np.sum((D - np.asarray(means)[labels]) ** 2, axis=1)))
         mle_var /= float(R - K)
 
         # Log-likelihood of the data
@@ -0,0 +1,188 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from apps.core.profiling import get_memory_usage
+
+
+@dataclass
+class Stage:
+    """
+    One step of the extraction. fn gets the declared inputs as keyword arguments and returns a dictionary
+    with (at least) the declared outputs. params and model_files identify the result for the stage cache.
+    """
+
+    name: str
+    fn: Callable[..., dict]
+    inputs: Tuple[str, ...] = ()
+    outputs: Tuple[str, ...] = ()
+    params: Dict[str, Any] = field(default_factory=dict)
+    model_files: Tuple[str, ...] = ()
+
+
+@dataclass
+class StageReport:
+    name: str
+    time_s: float = 0.0
+    # change of the resident memory of the process while the stage ran, stages running in parallel overlap
+    rss_delta: int = 0
+    peak_rss: int = 0
+    thread: str = ""
+    cached: bool = False
+    error: Optional[str] = None
+
+
+@dataclass
+class PipelineReport:
+    time_s: float = 0.0
+    stages: List[StageReport] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        lines = [f"pipeline {self.time_s:.2f}s"]
+        for stage in self.stages:
+            lines.append(
+                f"  {stage.name}: {stage.time_s:.2f}s, rss {stage.rss_delta / 2**20:+.0f} MiB"
+                + (", cached" if stage.cached else "")
+                + (f", failed: {stage.error}" if stage.error else "")
+            )
+        return "\n".join(lines)
+
+
+class Pipeline:
+    """
+    Small DAG scheduler: runs the stages needed for the requested outputs, each at most once, and independent stages
+    in parallel threads. Outputs already in the results dictionary are not computed again.
+    With a cache (get/put/fingerprint, see stage_cache.SongStageCache) stage results are looked up before running.
+    """
+
+    def __init__(
+        self,
+        stages: Iterable[Stage],
+        max_workers: int = 4,
+        on_stage_start: Optional[Callable[[str], None]] = None,
+        on_stage_end: Optional[Callable[[StageReport], None]] = None,
+        cache=None,
+    ):
+        self.stages = {stage.name: stage for stage in stages}
+        self.max_workers = max_workers
+        self.on_stage_start = on_stage_start
+        self.on_stage_end = on_stage_end
+        self.cache = cache
+        self._fingerprints = {}
+        self.producers = {}
+        # outputs that are inputs of other stages, the cache stores them without quantizing
+        self.consumed = {stage_input for stage in self.stages.values() for stage_input in stage.inputs}
+        for stage in self.stages.values():
+            for output in stage.outputs:
+                if output in self.producers:
+                    raise ValueError(f"Output {output} is produced by {self.producers[output]} and {stage.name}")
+                self.producers[output] = stage.name
+
+    def required_stages(self, outputs: Iterable[str], available: Iterable[str] = ()) -> List[str]:
+        """
+        :param outputs: Requested outputs
+        :param available: Outputs that are already computed
+        :return: Names of the stages that need to run, in a valid order
+        """
+        available = set(available)
+        order, visiting = [], set()
+
+        def visit(output):
+            if output in available:
+                return
+            if output not in self.producers:
+                raise KeyError(f"No stage produces {output}")
+            name = self.producers[output]
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError(f"Cycle in the pipeline at stage {name}")
+            visiting.add(name)
+            for stage_input in self.stages[name].inputs:
+                visit(stage_input)
+            visiting.discard(name)
+            order.append(name)
+
+        for output in outputs:
+            visit(output)
+        return order
+
+    def fingerprint(self, name: str) -> str:
+        """Cache fingerprint of a stage, covering the stages its inputs come from"""
+        if name not in self._fingerprints:
+            stage = self.stages[name]
+            inputs = [self.fingerprint(self.producers[stage_input]) for stage_input in stage.inputs]
+            self._fingerprints[name] = self.cache.fingerprint(stage, inputs)
+        return self._fingerprints[name]
+
+    def _run_stage(self, stage: Stage, results: dict) -> Tuple[dict, StageReport]:
+        report = StageReport(stage.name, thread=threading.current_thread().name)
+        if self.on_stage_start is not None:
+            self.on_stage_start(stage.name)
+        memory = get_memory_usage()
+        start = time.perf_counter()
+        try:
+            outputs = None
+            if self.cache is not None:
+                outputs = self.cache.get(stage, self.fingerprint(stage.name))
+                report.cached = outputs is not None
+            if outputs is None:
+                outputs = stage.fn(**{name: results[name] for name in stage.inputs})
+            missing = set(stage.outputs) - set(outputs)
+            if missing:
+                raise KeyError(f"Stage {stage.name} did not return {sorted(missing)}")
+            if self.cache is not None and not report.cached:
+                self.cache.put(
+                    stage,
+                    self.fingerprint(stage.name),
+                    {key: outputs[key] for key in stage.outputs},
+                    lossless=[key for key in stage.outputs if key in self.consumed],
+                )
+            return outputs, report
+        except Exception as e:
+            report.error = str(e)
+            raise
+        finally:
+            report.time_s = time.perf_counter() - start
+            end_memory = get_memory_usage()
+            report.rss_delta = end_memory.get("rss", 0) - memory.get("rss", 0)
+            report.peak_rss = end_memory.get("peak_rss", 0)
+            if self.on_stage_end is not None:
+                self.on_stage_end(report)
+
+    def run(self, outputs: Iterable[str], results: Optional[dict] = None) -> Tuple[dict, PipelineReport]:
+        """
+        Compute the requested outputs
+        :param outputs: Requested outputs
+        :param results: Already computed outputs, updated in place with everything computed by this run
+        :return: Tuple of the results dictionary and the timing and memory report of the stages that ran
+        :raises Exception: The first exception of a stage, stages that did not start yet are skipped
+        """
+        results = {} if results is None else results
+        pending = self.required_stages(outputs, results)
+        pipeline_report = PipelineReport()
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="stage") as executor:
+            running = {}
+            while pending or running:
+                for name in list(pending):
+                    if all(stage_input in results for stage_input in self.stages[name].inputs):
+                        pending.remove(name)
+                        running[executor.submit(self._run_stage, self.stages[name], results)] = name
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+                    try:
+                        stage_outputs, report = future.result()
+                    except Exception:
+                        for other in running:
+                            other.cancel()
+                        raise
+                    results.update(stage_outputs)
+                    pipeline_report.stages.append(report)
+
+        pipeline_report.time_s = time.perf_counter() - start
+        return results, pipeline_report
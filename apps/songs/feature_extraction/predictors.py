@@ -0,0 +1,62 @@
+import threading
+import time
+from typing import Callable, Dict
+
+import tensorflow as tf
+from essentia.standard import TempoCNN, TensorflowPredictMusiCNN
+
+from apps.songs.feature_extraction.consts import GMBI_MODELS, ML_MODELS
+
+
+class PredictorRegistry:
+    """
+    Loads every TensorFlow graph once per process and reuses it for all songs.
+    A predictor is not safe to call from two threads at once, so every predictor has its own lock;
+    different predictors run in parallel.
+    """
+
+    def __init__(self):
+        self._predictors = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.load_time_s: Dict[str, float] = {}
+
+    def _model_lock(self, name: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def _get(self, name: str, factory: Callable):
+        # called with the model lock held, so a graph is never loaded twice
+        predictor = self._predictors.get(name)
+        if predictor is None:
+            start = time.perf_counter()
+            predictor = factory()
+            self.load_time_s[name] = time.perf_counter() - start
+            self._predictors[name] = predictor
+        return predictor
+
+    def predict(self, model: str, audio):
+        """
+        Run one of the ML_MODELS on audio
+        :param model: Name in ML_MODELS
+        :param audio: Audio at 11025 Hz for "bpm", at 16 kHz for the other models
+        :return: Output of the Essentia algorithm
+        """
+        if model == "bpm":
+            factory = lambda: TempoCNN(graphFilename=ML_MODELS[model])
+        else:
+            factory = lambda: TensorflowPredictMusiCNN(graphFilename=ML_MODELS[model])
+        with self._model_lock(model):
+            return self._get(model, factory)(audio)
+
+    def keras_model(self, model: str):
+        """
+        :param model: Name in GMBI_MODELS
+        :return: Loaded Keras model, shared by all threads (Model.predict is thread safe)
+        """
+        name = "keras:" + model
+        with self._model_lock(name):
+            return self._get(name, lambda: tf.keras.models.load_model(GMBI_MODELS[model]))
+
+
+predictor_registry = PredictorRegistry()
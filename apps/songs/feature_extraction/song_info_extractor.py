@@ -1,31 +1,29 @@
-import json
 import math
 import random
 import statistics
+import threading
+import time
 import warnings
 from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
 
 import joblib
 import librosa
 import numpy as np
-import tensorflow as tf
-from essentia.standard import (
-    Extractor,
-    MonoLoader,
-    MusicExtractor,
-    PoolAggregator,
-    TempoCNN,
-    TensorflowPredictMusiCNN,
-    YamlOutput,
-)
+from essentia.standard import MusicExtractor
 from pandas import DataFrame
 
 warnings.simplefilter(action="ignore")
 from essentia import log
 
 log.warningActive = False
+from apps.songs.feature_extraction.audio_context import AudioContext
+from apps.songs.feature_extraction.chunk_features import compute_chunks_descriptors, pool_to_dict
 from apps.songs.feature_extraction.consts import *
 from apps.songs.feature_extraction.msa.msa import MusicStructureAnalysis
+from apps.songs.feature_extraction.pipeline import Pipeline, Stage
+from apps.songs.feature_extraction.predictors import predictor_registry
+from apps.songs.feature_extraction.stage_cache import feature_cache, file_sha256
 
 
 def del_features_from_df(df):
@@ -84,19 +82,124 @@ for key in GMBI_RF_MODELS.keys():
     print("loaded Random Forest Models: ", key)
 
 
+class GmbiFeatureSchema:
+    """
+    Column order the GMBI random forests expect, compiled to a lookup from descriptor path to column index.
+    Flattens the descriptors of a frame straight into a float64 row, giving the same values as create_gmbi_df
+    without building and dropping DataFrame columns. Columns without a value stay NaN.
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.index = {name: i for i, name in enumerate(self.columns)}
+        self._deleted = set(TO_DELETE_FROM_JSON)
+        # (feature, stat, length) -> column indices, -1 for values create_gmbi_df drops
+        self._paths = {}
+
+    @classmethod
+    def from_models(cls, models):
+        """
+        :param models: Random forests by name
+        :return: Schema of the feature names the models were fitted with, None if unknown or not the same for all
+        """
+        names = [getattr(model, "feature_names_in_", None) for model in models.values()]
+        if not names or any(n is None for n in names):
+            return None
+        columns = list(names[0])
+        if any(list(n) != columns for n in names[1:]):
+            return None
+        return cls(columns)
+
+    def _path_indices(self, feature, stat=None, length=None):
+        key = (feature, stat, length)
+        indices = self._paths.get(key)
+        if indices is None:
+            if length is None:
+                names = [feature if stat is None else "_".join([feature, stat])]
+            else:
+                names = ["_".join([feature, stat, str(j)]) for j in range(length)]
+            indices = np.array([self.index.get(name, -1) for name in names])
+            self._paths[key] = indices
+        return indices
+
+    def _write(self, row, indices, values):
+        keep = indices >= 0
+        row[indices[keep]] = values[keep]
+
+    def flatten(self, features_ess, features_ml):
+        """
+        :param features_ess: Essentia descriptors of a frame, see pool_to_dict. Not modified
+        :param features_ml: DL features of the frame
+        :return: Row in the column order of the random forests
+        """
+        row = np.full(len(self.columns), np.nan)
+        for key, value in features_ml.items():
+            index = self.index.get(key)
+            if index is not None:
+                row[index] = value
+
+        # same order as create_gmbi_df, so a repeated column name keeps the last value
+        for key in ["lowLevel", "rhythm", "sfx", "tonal"]:
+            for feature, item in features_ess.get(key, {}).items():
+                if feature in self._deleted:
+                    continue
+                if isinstance(item, (float, int)):
+                    self._write(row, self._path_indices(feature), np.array([item], dtype=float))
+                if isinstance(item, dict):
+                    for stat, value in item.items():
+                        if isinstance(value, (float, int)):
+                            self._write(row, self._path_indices(feature, stat), np.array([value], dtype=float))
+                        if isinstance(value, list):
+                            try:
+                                values = np.asarray(value, dtype=float)
+                            except (TypeError, ValueError):
+                                # not a flat vector, create_gmbi_df would give a column the forests can not use
+                                continue
+                            self._write(row, self._path_indices(feature, stat, len(value)), values)
+        return row
+
+
+# None if the forests were fitted without feature names, the DataFrame path is used then
+gmbi_feature_schema = GmbiFeatureSchema.from_models(random_forest)
+
+
 class SongInfoExtractor:
     sr = 44100
     hopSize = 1024
     frameSize = 2048
     statistic_values = ["mean", "stdev", "min", "max", "median"]  #'dmean', 'dmean2', 'dvar', 'dvar2'
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, audio_context=None, cache=feature_cache):
         self.file_path = file_path
-        self.audio = MonoLoader(filename=self.file_path, sampleRate=self.sr)()
-        self.duration = len(self.audio) / float(self.sr)
+        # decoded once on first use, every stage gets its sample rate from the shared context
+        self.audio_context = audio_context or AudioContext(self.file_path, sr=self.sr)
+        self.cache = cache
+        self._audio_hash = None
+        # raw predictions and inference time of every ML model, each model runs at most once per song
+        self._predictions = {}
+        self._predictions_lock = threading.Lock()
+        self.model_timings = {}
+        # outputs of the pipeline stages that already ran, see run_stages
+        self.stage_results = {}
+        self.stage_reports = []
+
+    @property
+    def audio(self):
+        return self.audio_context.get(self.sr)
+
+    @property
+    def duration(self):
+        return len(self.audio) / float(self.sr)
+
+    @property
+    def audio_hash(self):
+        """sha256 of the audio file, the key of the song in the stage cache"""
+        if self._audio_hash is None:
+            self._audio_hash = file_sha256(self.file_path)
+        return self._audio_hash
 
     def get_duration(self):
-        return len(self.audio) / float(self.sr)
+        return self.run_stages(["duration_s"])["duration_s"]
 
     def scale_gmbi_values(self, A):
         return (A - np.min(A)) / (np.max(A) - np.min(A))
@@ -105,11 +208,138 @@ class SongInfoExtractor:
         return np.mean(librosa.feature.rms(y=self.audio, frame_length=self.frameSize, hop_length=self.hopSize))
 
     def pool_to_json(self, pool):
-        YamlOutput(filename="essentiaFeatures.json", format="json", writeVersion=False)(pool)
-        with open("essentiaFeatures.json") as file:
-            features = json.load(file)
-        os.remove("essentiaFeatures.json")
-        return features
+        return pool_to_dict(pool)
+
+    def _predict_model(self, model):
+        # BPM CNN works with 11khz, other CNNs with 16 khz
+        audio = self.audio_context.get(11025 if model == "bpm" else 16000)
+        start = time.perf_counter()
+        predictions = predictor_registry.predict(model, audio)
+        self.model_timings[model] = time.perf_counter() - start
+        return predictions
+
+    def predict_models(self, models):
+        """
+        Run the given ML models on the song in parallel threads, skipping the ones that already ran
+        :param models: Names in ML_MODELS
+        :return: Dictionary of the predictions of the models
+        """
+        # stages running in parallel may ask for the same model, every model only runs once
+        with self._predictions_lock:
+            missing = [model for model in models if model not in self._predictions]
+            for model in missing:
+                self._predictions[model] = Future()
+
+        def run(model):
+            try:
+                self._predictions[model].set_result(self._predict_model(model))
+            except Exception as e:
+                self._predictions[model].set_exception(e)
+
+        if len(missing) > 1:
+            with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+                list(executor.map(run, missing))
+        else:
+            for model in missing:
+                run(model)
+        return {model: self._predictions[model].result() for model in models}
+
+    def stages(self):
+        """
+        Extraction stages and the outputs they produce:
+        duration_s, dl_features, genres, essentia_features, gmbi_frames (random forest), gmbi_nn and song_structure
+        """
+        dl_models = [model for model in ML_MODELS if model != "genre"]
+        return [
+            Stage("audio", lambda: {"duration_s": self.duration}, (), ("duration_s",), {"sr": self.sr}),
+            Stage(
+                "dl",
+                lambda: {"dl_features": self.extract_essentia_dl_features(gmbi_inference=True)},
+                (),
+                ("dl_features",),
+                {"models": dl_models},
+                tuple(ML_MODELS[model] for model in dl_models),
+            ),
+            Stage(
+                "genre",
+                lambda: {"genres": self.extract_essentia_genre_features()},
+                (),
+                ("genres",),
+                {"genres": GENRES, "deleted_indexes": GENRE_INDEXES_TO_DELETE},
+                (ML_MODELS["genre"],),
+            ),
+            Stage(
+                "essentia",
+                lambda: {"essentia_features": self.extract_essentia_features()},
+                (),
+                ("essentia_features",),
+                {
+                    "sr": self.sr,
+                    "hop_size": self.hopSize,
+                    "frame_size": self.frameSize,
+                    "statistics": self.statistic_values,
+                },
+            ),
+            Stage(
+                "gmbi_rf",
+                lambda dl_features: {
+                    "gmbi_frames": self.extract_gmbi_features_frames(essentia_dl_features=dl_features)
+                },
+                ("dl_features",),
+                ("gmbi_frames",),
+                {"deleted": [TO_DELETE_FROM_JSON, TO_DELETE_FROM_DF, BEAT_LOUDNESS]},
+                tuple(GMBI_RF_MODELS.values()),
+            ),
+            Stage(
+                "gmbi_nn",
+                lambda essentia_features, dl_features: {
+                    "gmbi_nn": self.extract_gmbi_features(essentia_features, essentia_dl_features=dl_features)
+                },
+                ("essentia_features", "dl_features"),
+                ("gmbi_nn",),
+                {"features": FEATURES_MUSIC_EXTRACTOR, "mean": GMBI_TRAIN_MEAN, "stdev": GMBI_TRAIN_STDV},
+                tuple(GMBI_MODELS.values()),
+            ),
+            Stage(
+                "msa",
+                lambda: {"song_structure": self.extract_song_structure()},
+                (),
+                ("song_structure",),
+                {
+                    "sr": 22050,
+                    "hop_length": 2205,
+                    "n_fft": 4410,
+                    "banded_min_duration_s": MSA_BANDED_MIN_DURATION_S,
+                    "max_lag_s": MSA_MAX_LAG_S,
+                    "kmeans_n_init": MSA_KMEANS_N_INIT,
+                    "kmeans_seed": MSA_KMEANS_SEED,
+                },
+            ),
+        ]
+
+    def run_stages(self, outputs, on_stage_start=None, on_stage_end=None, max_workers=4):
+        """
+        Compute the requested outputs (see stages), running independent stages in parallel
+        and every stage at most once per song
+        :param outputs: Names of the outputs
+        :param on_stage_start: Called with the stage name when a stage starts
+        :param on_stage_end: Called with the StageReport when a stage is done
+        :return: Dictionary with the requested outputs
+        """
+        cache = self.cache.bind(self.audio_hash) if self.cache is not None else None
+        pipeline = Pipeline(self.stages(), max_workers, on_stage_start, on_stage_end, cache)
+        _, report = pipeline.run(outputs, self.stage_results)
+        self.stage_reports.extend(report.stages)
+        print(report, flush=True)
+        return {output: self.stage_results[output] for output in outputs}
+
+    def extract_song_structure(self):
+        print("computing MSA...", flush=True)
+        msa = MusicStructureAnalysis(self.file_path, audio_context=self.audio_context)
+        if 0 < MSA_BANDED_MIN_DURATION_S < msa.duration:
+            # the full SSM of long recordings grows quadratically, keep only the nearby repetitions
+            msa.max_lag_s = MSA_MAX_LAG_S
+        return msa.process_boundaries_labels()
 
     def extract_essentia_features(self):
         features = {}
@@ -134,9 +364,7 @@ class SongInfoExtractor:
 
         features = {"mean": {}, "frames": {}, "dl_gmbi_inference_features": []}
 
-        # resample audio. BPM CNN works with 11khz, other CNNs with 16 khz
-        audio_11khz = librosa.resample(self.audio, orig_sr=self.sr, target_sr=11025)
-        audio_16khz = librosa.resample(self.audio, orig_sr=self.sr, target_sr=16000)
+        all_predictions = self.predict_models([model for model in ML_MODELS if model != "genre"])
 
         for model in ML_MODELS:
 
@@ -148,7 +376,7 @@ class SongInfoExtractor:
                 else:
                     get_predicted_class = 0
 
-                predictions = TensorflowPredictMusiCNN(graphFilename=ML_MODELS[model])(audio_16khz)
+                predictions = all_predictions[model]
                 features["mean"][model] = np.around(
                     np.mean(predictions, axis=0)[get_predicted_class], decimals=8
                 ).tolist()
@@ -163,7 +391,7 @@ class SongInfoExtractor:
                     )
 
             else:
-                global_bpm = TempoCNN(graphFilename=ML_MODELS[model])(audio_11khz)[0]
+                global_bpm = all_predictions[model][0]
                 features["mean"][model] = round(float(global_bpm), 2)
 
                 # storing for gmbi inference
@@ -177,8 +405,7 @@ class SongInfoExtractor:
     def extract_essentia_genre_features(self):
 
         features = {"all_genres": {}, "top3_genres": {}, "top3_genres_frames": {}}
-        audio_16khz = librosa.resample(self.audio, orig_sr=self.sr, target_sr=16000)
-        predictions = TensorflowPredictMusiCNN(graphFilename=ML_MODELS["genre"])(audio_16khz)
+        predictions = self.predict_models(["genre"])["genre"]
 
         predictions_mean = np.array(np.around(np.mean(predictions, axis=0).astype(float), decimals=8))
 
@@ -214,33 +441,37 @@ class SongInfoExtractor:
         num_dl_predictions = len(essentia_dl_features["voice"])
         num_samples_pro_prediction = int(math.ceil((len(self.audio) / num_dl_predictions)))
 
-        for i, start in enumerate(range(0, len(self.audio), num_samples_pro_prediction)):
-            audio_chunk = self.audio[start : start + num_samples_pro_prediction]
-            features = Extractor()(audio_chunk)
-            features = self.pool_to_json(
-                PoolAggregator(defaultStats=["min", "max", "median", "mean", "stdev"])(features)
-            )
+        audio_chunks = [
+            self.audio[start : start + num_samples_pro_prediction]
+            for start in range(0, len(self.audio), num_samples_pro_prediction)
+        ]
+        chunks_features = compute_chunks_descriptors(audio_chunks, GMBI_FRAME_WORKERS)
 
+        rows = []
+        for i, features in enumerate(chunks_features):
             dl_dict = {}
             for key in essentia_dl_features.keys():
                 if key == "bpm":
                     continue
                 dl_dict[key] = essentia_dl_features[key][i]
 
-            df = create_gmbi_df(features, dl_dict)
-            data = np.array(df).reshape(1, -1)
-
-            # run inference
-            try:
-                for key in GMBI_RF_MODELS.keys():
-                    prediction = random_forest[key].predict(data)
-                    gmbi_data["frames"][key].append(round(prediction[0], 8))
-            except Exception as e:
-                for key in GMBI_RF_MODELS.keys():
-                    gmbi_data["frames"][key].append(random.uniform(-2, 2))
-                with open(MODEL_PATH + "/gmbi_error.txt", "a") as f:
-                    f.write(self.file_path + "\n")
-                    f.write(str(e) + "\n\n")
+            if gmbi_feature_schema is not None:
+                rows.append(gmbi_feature_schema.flatten(features, dl_dict))
+            else:
+                rows.append(np.array(create_gmbi_df(features, dl_dict)).reshape(-1))
+
+        # run inference, one predict call per model for the whole song
+        try:
+            data = np.vstack(rows)
+            if np.isnan(data).any():
+                raise ValueError("GMBI features are incomplete")
+            predictions = {key: random_forest[key].predict(data) for key in GMBI_RF_MODELS.keys()}
+            for key in GMBI_RF_MODELS.keys():
+                gmbi_data["frames"][key] = [round(prediction, 8) for prediction in predictions[key]]
+        except Exception:
+            # find the rows that fail and handle them one by one
+            for row in rows:
+                self._predict_gmbi_row(row, gmbi_data["frames"])
 
         # create random list of len num_dl_predictions (faster for debugging)
         # for key in config.gmbi_rf_models.keys():
@@ -253,6 +484,21 @@ class SongInfoExtractor:
 
         return gmbi_data
 
+    def _predict_gmbi_row(self, row, frames):
+        try:
+            if np.isnan(row).any():
+                raise ValueError("GMBI features are incomplete")
+            data = row.reshape(1, -1)
+            predictions = {key: random_forest[key].predict(data)[0] for key in GMBI_RF_MODELS.keys()}
+            for key in GMBI_RF_MODELS.keys():
+                frames[key].append(round(predictions[key], 8))
+        except Exception as e:
+            for key in GMBI_RF_MODELS.keys():
+                frames[key].append(random.uniform(-2, 2))
+            with open(MODEL_PATH + "/gmbi_error.txt", "a") as f:
+                f.write(self.file_path + "\n")
+                f.write(str(e) + "\n\n")
+
     def extract_gmbi_features(self, essentia_features=None, essentia_dl_features=None):
 
         gmbi_inference_data = []
@@ -286,7 +532,7 @@ class SongInfoExtractor:
 
         # run inference
         for model in GMBI_MODELS.keys():
-            gmbi = tf.keras.models.load_model(GMBI_MODELS[model])
+            gmbi = predictor_registry.keras_model(model)
             prediction = gmbi.predict(gmbi_inference_data).flatten()
             features["mean"][model] = prediction.astype(float)[0]
 
@@ -295,13 +541,13 @@ class SongInfoExtractor:
     def extract_all_features(self, statistics=True, frames=False):
         all_features = {"statistics": {}, "frames": {}, "songStructure": {}}
 
-        essentia_features = self.extract_essentia_features()
-        essentia_dl_features = self.extract_essentia_dl_features(gmbi_inference=True)
+        results = self.run_stages(["essentia_features", "dl_features", "gmbi_frames", "genres", "song_structure"])
+        essentia_features = results["essentia_features"]
+        essentia_dl_features = results["dl_features"]
         # gmbi_features = self.extractgmbi_features(essentia_features=essentia_features, essentia_dl_features=essentia_dl_features)
-        gmbi_features = self.extract_gmbi_features_frames(essentia_dl_features=essentia_dl_features)
-        genres = self.extract_essentia_genre_features()
-        print("computing MSA...", flush=True)
-        boundaries, labels = MusicStructureAnalysis(self.file_path).process_boundaries_labels()
+        gmbi_features = results["gmbi_frames"]
+        genres = results["genres"]
+        boundaries, labels = results["song_structure"]
 
         if statistics == True:
             all_features["statistics"]["essentiaFeatures_Statistics"] = essentia_features["statistics"]
@@ -329,19 +575,18 @@ class SongInfoExtractor:
 
     def extract_aim_features(self, gmbi_model="rf"):
         aim_features = {"features": {}, "features_frames": {}, "songStructure": {}}
-        essentia_dl_features = self.extract_essentia_dl_features(gmbi_inference=True)
-        if gmbi_model == "rf":
-            gmbi_features = self.extract_gmbi_features_frames(essentia_dl_features=essentia_dl_features)
-        if gmbi_model == "nn":
-            gmbi_features = self.extract_gmbi_features(essentia_dl_features=essentia_dl_features)
-        genres = self.extract_essentia_genre_features()
-        print("computing MSA...", flush=True)
-        boundaries, labels = MusicStructureAnalysis(self.file_path).process_boundaries_labels()
-
-        aim_features["features"] = gmbi_features["mean"]
+        gmbi_output = "gmbi_nn" if gmbi_model == "nn" else "gmbi_frames"
+        results = self.run_stages(["dl_features", gmbi_output, "genres", "song_structure"])
+        essentia_dl_features = results["dl_features"]
+        gmbi_features = results[gmbi_output]
+        genres = results["genres"]
+        boundaries, labels = results["song_structure"]
+
+        # copies, the stage results stay cached on the extractor
+        aim_features["features"] = dict(gmbi_features["mean"])
         aim_features["features"].update(essentia_dl_features["mean"])
         aim_features["features"]["genres"] = {"all_genres": genres["all_genres"], "top3_genres": genres["top3_genres"]}
-        aim_features["features_frames"]["highLevel_graphs"] = gmbi_features["frames"]
+        aim_features["features_frames"]["highLevel_graphs"] = dict(gmbi_features["frames"])
         aim_features["features_frames"]["highLevel_graphs"].update(essentia_dl_features["frames"])
         aim_features["features_frames"]["top3_genre_graphs"] = genres["top3_genres_frames"]
 
@@ -0,0 +1,201 @@
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+from typing import Iterable, Optional
+
+import numpy as np
+
+from apps.songs.feature_extraction.consts import FEATURE_CACHE_PATH
+
+# bump when a stage changes its results without changing its parameters
+CACHE_VERSION = 2
+# numeric lists with at least this many values are stored as arrays, shorter ones stay in the JSON skeleton
+MIN_ARRAY_SIZE = 8
+# values within this range are stored as float16 (absolute error below 0.002), e.g. probabilities and GMBI frames.
+# Only for outputs no other stage consumes, a stage reading a cached input gets exactly what it would have computed.
+FLOAT16_MAX_ABS = 4.0
+
+_model_hashes = {}
+_model_hashes_lock = threading.Lock()
+
+
+def file_sha256(path: str, chunk_size: int = 2**20) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def model_file_hash(path: str) -> str:
+    """
+    Content hash of a model file or directory (SavedModel), memoized per process by path, size and mtime
+    :param path: Model path
+    :return: Hex digest, "missing" if the path does not exist
+    """
+    if not os.path.exists(path):
+        return "missing"
+    if os.path.isdir(path):
+        files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+    else:
+        files = [path]
+    stamp = tuple((f, os.path.getsize(f), os.path.getmtime(f)) for f in files)
+    with _model_hashes_lock:
+        if _model_hashes.get(path, (None,))[0] == stamp:
+            return _model_hashes[path][1]
+    sha = hashlib.sha256()
+    for f in files:
+        sha.update(os.path.relpath(f, path).encode())
+        sha.update(file_sha256(f).encode())
+    with _model_hashes_lock:
+        _model_hashes[path] = (stamp, sha.hexdigest())
+    return sha.hexdigest()
+
+
+def stage_fingerprint(name: str, params: dict, model_files: Iterable[str], input_fingerprints: Iterable[str]) -> str:
+    """
+    Hash of everything a stage result depends on besides the audio: its parameters, its model files
+    and the fingerprints of the stages that produce its inputs
+    """
+    data = {
+        "version": CACHE_VERSION,
+        "name": name,
+        "params": params,
+        "models": [model_file_hash(path) for path in model_files],
+        "inputs": sorted(input_fingerprints),
+    }
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _numeric_array(value) -> Optional[np.ndarray]:
+    try:
+        array = np.asarray(value)
+    except ValueError:
+        # ragged nested lists
+        return None
+    if array.ndim == 0 or array.dtype.kind not in "fiub":
+        return None
+    return array
+
+
+def _compact(array: np.ndarray) -> np.ndarray:
+    if array.dtype.kind != "f":
+        return array
+    if np.all(np.isfinite(array)) and np.max(np.abs(array), initial=0) <= FLOAT16_MAX_ABS:
+        return array.astype(np.float16)
+    # e.g. boundaries in seconds, kept exact
+    return array.astype(np.float64)
+
+
+def _encode(value, arrays: dict, lossless: bool = False):
+    if isinstance(value, dict):
+        return {str(key): _encode(item, arrays, lossless) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        array = _numeric_array(value) if len(value) >= MIN_ARRAY_SIZE or isinstance(value, np.ndarray) else None
+        if array is not None:
+            name = f"a{len(arrays)}"
+            arrays[name] = array if lossless else _compact(array)
+            return {"__array__": name, "ndarray": isinstance(value, np.ndarray)}
+        return [_encode(item, arrays, lossless) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _decode(value, arrays):
+    if isinstance(value, dict):
+        if "__array__" in value:
+            array = arrays[value["__array__"]]
+            if array.dtype == np.float16:
+                array = array.astype(np.float32 if value["ndarray"] else np.float64)
+            return array if value["ndarray"] else array.tolist()
+        return {key: _decode(item, arrays) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item, arrays) for item in value]
+    return value
+
+
+def encode_outputs(outputs: dict, lossless: Iterable[str] = ()) -> bytes:
+    """
+    Stage outputs as npz: a JSON skeleton plus every numeric sequence as a compact array.
+    The outputs in lossless keep their exact values and dtypes.
+    """
+    arrays = {}
+    lossless = set(lossless)
+    skeleton = json.dumps(
+        {str(key): _encode(value, arrays, key in lossless) for key, value in outputs.items()}
+    ).encode()
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, __skeleton__=np.frombuffer(skeleton, dtype=np.uint8), **arrays)
+    return buffer.getvalue()
+
+
+def decode_outputs(data: bytes) -> dict:
+    with np.load(io.BytesIO(data)) as npz:
+        arrays = {name: npz[name] for name in npz.files}
+    skeleton = json.loads(arrays.pop("__skeleton__").tobytes().decode())
+    return _decode(skeleton, arrays)
+
+
+class StageCache:
+    """
+    Content addressed disk cache of extraction stage results.
+    Entries live in <path>/<audio hash[:2]>/<audio hash>/<stage>-<fingerprint>.npz, so re-uploading or re-importing
+    a song reuses every stage whose parameters and models did not change.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(self.path, exist_ok=True)
+
+    def _file_path(self, audio_hash: str, name: str, fingerprint: str) -> str:
+        return os.path.join(self.path, audio_hash[:2], audio_hash, f"{name}-{fingerprint[:32]}.npz")
+
+    def get(self, audio_hash: str, name: str, fingerprint: str) -> Optional[dict]:
+        try:
+            with open(self._file_path(audio_hash, name, fingerprint), "rb") as file:
+                return decode_outputs(file.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable cache entry of stage {name}: {e}", flush=True)
+            return None
+
+    def put(self, audio_hash: str, name: str, fingerprint: str, outputs: dict, lossless: Iterable[str] = ()):
+        file_path = self._file_path(audio_hash, name, fingerprint)
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            data = encode_outputs(outputs, lossless)
+            # write to a temporary file and rename it, so concurrent readers never see half an entry
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            os.replace(tmp_path, file_path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Could not cache stage {name}: {e}", flush=True)
+
+    def bind(self, audio_hash: str) -> "SongStageCache":
+        return SongStageCache(self, audio_hash)
+
+
+class SongStageCache:
+    """The stage cache of one song, as used by Pipeline."""
+
+    def __init__(self, cache: StageCache, audio_hash: str):
+        self.cache = cache
+        self.audio_hash = audio_hash
+
+    def fingerprint(self, stage, input_fingerprints: Iterable[str]) -> str:
+        return stage_fingerprint(stage.name, stage.params, stage.model_files, input_fingerprints)
+
+    def get(self, stage, fingerprint: str) -> Optional[dict]:
+        return self.cache.get(self.audio_hash, stage.name, fingerprint)
+
+    def put(self, stage, fingerprint: str, outputs: dict, lossless: Iterable[str] = ()):
+        self.cache.put(self.audio_hash, stage.name, fingerprint, outputs, lossless)
+
+
+feature_cache = StageCache(FEATURE_CACHE_PATH) if FEATURE_CACHE_PATH else None
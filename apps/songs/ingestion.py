@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import List, Optional, Tuple
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".flac", ".ogg", ".m4a", ".aac", ".aiff", ".opus")
+ARTWORK_NAMES = ("cover", "folder", "front", "album", "artwork")
+ARTWORK_EXTENSIONS = (".jpg", ".jpeg", ".png")
+PLACEHOLDER_ARTWORK = "placeholder.png"
+
+# set by init_worker, one extractor stack per worker process
+_output_path = None
+_artwork_path = None
+
+
+def collect_audio_files(source: str) -> List[str]:
+    """
+    :param source: Audio directory
+    :return: Paths of all audio files below the directory, relative to it and sorted
+    """
+    files = []
+    for root, _, names in os.walk(source):
+        for name in names:
+            if name.lower().endswith(AUDIO_EXTENSIONS):
+                files.append(os.path.relpath(os.path.join(root, name), source))
+    return sorted(files)
+
+
+def json_name(track_id: str) -> str:
+    """Name of the pre-calc JSON of a track, stable so finished tracks are found again when a run is resumed"""
+    return os.path.splitext(track_id)[0].replace(os.sep, "__") + ".json"
+
+
+def write_file_atomic(path: str, data: bytes):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+
+
+def read_metadata(file_path: str) -> Tuple[str, str, str]:
+    """
+    :param file_path: Audio file
+    :return: Title, artist and album from the tags, falling back to the file and directory names
+    """
+    from essentia.standard import MetadataReader
+
+    try:
+        title, artist, album = MetadataReader(filename=file_path, failOnError=False)()[:3]
+    except RuntimeError:
+        title, artist, album = "", "", ""
+    title = title.strip() or os.path.splitext(os.path.basename(file_path))[0]
+    artist = artist.strip() or "Unknown Artist"
+    album = album.strip() or os.path.basename(os.path.dirname(os.path.abspath(file_path))) or "Unknown Album"
+    return title, artist, album
+
+
+def find_artwork(file_path: str, artwork_path: str) -> str:
+    """
+    Copy the cover image next to a track (cover.jpg, folder.png, ...) to the artwork directory
+    :param file_path: Audio file
+    :param artwork_path: PRE_CALC_ALBUM_ART_PATH
+    :return: Name of the image in the artwork directory, content addressed so an album is stored once
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    images = sorted(n for n in os.listdir(directory) if n.lower().endswith(ARTWORK_EXTENSIONS))
+    preferred = [n for n in images if os.path.splitext(n)[0].lower() in ARTWORK_NAMES]
+    candidates = preferred or images
+    if not candidates:
+        return PLACEHOLDER_ARTWORK
+
+    source = os.path.join(directory, candidates[0])
+    with open(source, "rb") as file:
+        digest = hashlib.sha256(file.read()).hexdigest()[:32]
+    name = digest + os.path.splitext(source)[1].lower()
+    target = os.path.join(artwork_path, name)
+    if not os.path.exists(target):
+        fd, tmp_path = tempfile.mkstemp(dir=artwork_path, suffix=".tmp")
+        os.close(fd)
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, target)
+    return name
+
+
+def ensure_placeholder_artwork(artwork_path: str):
+    """Grey image used for tracks without any cover, add_pre_calculated_songs needs an image for every album"""
+    from PIL import Image
+
+    path = os.path.join(artwork_path, PLACEHOLDER_ARTWORK)
+    if not os.path.exists(path):
+        Image.new("RGB", (300, 300), (128, 128, 128)).save(path)
+
+
+def init_worker(output_path: str, artwork_path: str):
+    """
+    Process pool initializer: one single threaded extraction stack per core, so N workers do not fight over the cores.
+    Imports (and loads the models of) the extractor once per worker.
+    """
+    global _output_path, _artwork_path
+    _output_path, _artwork_path = output_path, artwork_path
+
+    os.environ["OMP_NUM_THREADS"] = "1"
+    os.environ["TF_NUM_INTRAOP_THREADS"] = "1"
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+    # the workers are the parallelism, no nested GMBI process pools
+    os.environ["GMBI_FRAME_WORKERS"] = "0"
+
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(1)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(1)
+
+    from .feature_extraction import song_info_extractor  # noqa: F401
+
+
+def extract_song_json(file_path: str, track_id: str, artwork_path: str) -> dict:
+    """
+    Extract a song in the format of the PRE_CALC_JSON_PATH files, see methods.convert_song_to_db_format
+    :param file_path: Audio file
+    :param track_id: Path of the file relative to PRE_CALC_AUDIO_PATH
+    :param artwork_path: PRE_CALC_ALBUM_ART_PATH
+    :return: Pre-calc dictionary
+    """
+    from .feature_extraction.song_info_extractor import SongInfoExtractor
+    from .timeline import collect_timeline
+
+    title, artist, album = read_metadata(file_path)
+    extractor = SongInfoExtractor(file_path)
+    results = extractor.run_stages(["duration_s", "dl_features", "gmbi_frames", "genres", "song_structure"])
+    gmbi, dl = results["gmbi_frames"]["mean"], results["dl_features"]["mean"]
+
+    features = {key: gmbi[key] for key in ["valence", "arousal", "authenticity", "timeliness", "complexity"]}
+    features.update({key: dl[key] for key in ["danceability", "tonal", "voice", "bpm"]})
+    features["genres"] = {
+        "all_genres": results["genres"]["all_genres"],
+        "top3_genres": results["genres"]["top3_genres"],
+    }
+    return {
+        "title": title,
+        "artist": artist,
+        "album": album,
+        "duration_s": results["duration_s"],
+        "features": features,
+        "timeline": collect_timeline(results),
+        "ids": {"track_id": track_id, "artwork_id": find_artwork(file_path, artwork_path)},
+    }
+
+
+def process_track(task: Tuple[str, str]) -> Tuple[str, float, Optional[str]]:
+    """
+    Pool task: extract one track and write its JSON
+    :param task: Tuple of the audio directory and the track id
+    :return: Tuple of the track id, the time it took and the error message if it failed
+    """
+    source, track_id = task
+    start = time.perf_counter()
+    try:
+        song = extract_song_json(os.path.join(source, track_id), track_id, _artwork_path)
+        data = json.dumps(song, ensure_ascii=False, indent=2, default=float).encode("utf-8")
+        write_file_atomic(os.path.join(_output_path, json_name(track_id)), data)
+        return track_id, time.perf_counter() - start, None
+    except Exception as e:
+        return track_id, time.perf_counter() - start, f"{type(e).__name__}: {e}"
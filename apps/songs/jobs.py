@@ -0,0 +1,174 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from apps.core.models import ExtractionJob, Song, SongFeatures, SongGenres
+
+from .consts import EXTRACTION_WORKERS
+from .feature_extraction.pipeline import Pipeline
+from .feature_extraction.stage_cache import file_sha256
+from .renditions import enqueue_renditions
+from .timeline import timeline_file
+
+extraction_executor = ThreadPoolExecutor(max_workers=max(1, EXTRACTION_WORKERS), thread_name_prefix="extraction")
+
+
+class _StageProgress:
+    """Writes the state of every extraction stage of a job to the database, stages of one job run in parallel."""
+
+    def __init__(self, job: ExtractionJob):
+        self.job_id = job.id
+        self.stages = dict(job.stages)
+        self._lock = threading.Lock()
+
+    def _save(self, name: str, state: dict):
+        with self._lock:
+            self.stages[name] = state
+            ExtractionJob.objects.filter(id=self.job_id).update(stages=dict(self.stages))
+
+    def on_stage_start(self, name: str):
+        self._save(name, {"status": "running"})
+
+    def on_stage_end(self, report):
+        self._save(
+            report.name,
+            {"status": "failed" if report.error else "done", "time_s": round(report.time_s, 3), "cached": report.cached},
+        )
+
+
+def run_extraction_job(job_id):
+    """
+    Extract the features of the upload of a job and create its song
+    :param job_id: ExtractionJob id
+    """
+    # imported here, the extraction stack loads its models on import
+    from .feature_extraction.song_info_extractor import SongInfoExtractor
+    from .methods import EXTRACTION_OUTPUTS, extract_genres_and_features
+
+    close_old_connections()
+    progress = None
+    try:
+        # claim the job, so a job enqueued twice (e.g. recovered while the server already runs it) runs once
+        if not ExtractionJob.objects.filter(id=job_id, status=ExtractionJob.STATUS_QUEUED).update(
+            status=ExtractionJob.STATUS_RUNNING
+        ):
+            return
+        job = ExtractionJob.objects.get(id=job_id)
+        # the extractor only decodes the audio when a stage needs it
+        stages = Pipeline(SongInfoExtractor(job.audio_file.path).stages()).required_stages(EXTRACTION_OUTPUTS)
+        job.stages = {name: {"status": "pending"} for name in stages}
+        job.save(update_fields=["stages", "updated_at"])
+
+        progress = _StageProgress(job)
+        genres, features, duration_s, timeline = extract_genres_and_features(
+            job.audio_file.path, progress.on_stage_start, progress.on_stage_end
+        )
+
+        # the song only becomes visible to the recommender with complete features
+        audio_sha256 = file_sha256(job.audio_file.path)
+        upload_name = job.audio_file.name
+        stored = []
+        try:
+            with transaction.atomic():
+                # the same file was uploaded again while this job ran, the job resolves to that song
+                job.song = Song.objects.filter(audio_sha256=audio_sha256).first()
+                if job.song is None:
+                    # the song gets a copy in Audio/, Uploads/ is not served as media
+                    stored.append(_copy_to_song_audio(job.audio_file))
+                    stored.append(_save_timeline(timeline))
+                    job.song = Song.objects.create(
+                        title=job.title,
+                        artist=job.artist,
+                        duration_s=duration_s,
+                        features=SongFeatures.objects.create(**features.model_dump()),
+                        genres=SongGenres.objects.create(**genres.model_dump()),
+                        audio_file=stored[0],
+                        audio_sha256=audio_sha256,
+                        album=job.album,
+                        timeline_file=stored[1],
+                    )
+                    enqueue_renditions(job.song)
+                    job.audio_file = job.song.audio_file.name
+                else:
+                    job.audio_file = ""
+                job.stages = progress.stages
+                job.status = ExtractionJob.STATUS_DONE
+                job.save(update_fields=["song", "audio_file", "stages", "status", "updated_at"])
+        except Exception:
+            # no song refers to the files written for it
+            for name in stored:
+                _delete_file(name)
+            raise
+        _delete_file(upload_name)
+    except Exception as e:
+        print(f"Extraction job {job_id} failed: {e}", flush=True)
+        _fail_job(job_id, f"{type(e).__name__}: {e}", progress.stages if progress is not None else None)
+    finally:
+        close_old_connections()
+
+
+def _save_timeline(timeline: dict) -> str:
+    """:return: Storage name of the timeline file in the directory of Song.timeline_file"""
+    content = timeline_file(timeline)
+    return default_storage.save(Song._meta.get_field("timeline_file").generate_filename(None, content.name), content)
+
+
+def _delete_file(name: str):
+    try:
+        default_storage.delete(name)
+    except OSError as e:
+        print(f"Could not delete {name}: {e}", flush=True)
+
+
+def _copy_to_song_audio(upload) -> str:
+    """
+    :param upload: ExtractionJob.audio_file
+    :return: Storage name of a copy in the directory of Song.audio_file
+    """
+    name = Song._meta.get_field("audio_file").generate_filename(None, os.path.basename(upload.name))
+    with upload.open("rb"):
+        return upload.storage.save(name, upload)
+
+
+def _fail_job(job_id, error: str, stages: dict = None):
+    """Mark a job as failed and delete its upload, no song refers to the audio file of a failed job."""
+    job = ExtractionJob.objects.filter(id=job_id).first()
+    if job is not None and job.audio_file:
+        _delete_file(job.audio_file.name)
+    ExtractionJob.objects.filter(id=job_id).update(
+        status=ExtractionJob.STATUS_FAILED,
+        error=error,
+        audio_file="",
+        updated_at=timezone.now(),
+        **({"stages": stages} if stages is not None else {}),
+    )
+
+
+def enqueue_extraction(job: ExtractionJob):
+    """Run the extraction of a saved job in the background once the current transaction is committed."""
+    transaction.on_commit(lambda: extraction_executor.submit(run_extraction_job, job.id))
+
+
+def recover_extraction_jobs(fail_queued: bool = False) -> Tuple[int, List]:
+    """
+    Recover the jobs of a stopped server, called by the recover_extraction_jobs command before the server starts.
+    The executor only lives in memory, so no process works on them anymore: running jobs were interrupted and are
+    marked as failed, queued jobs are returned to be run again.
+    Must not run while a server is up, its running jobs would be failed as well.
+    :param fail_queued: Mark the queued jobs as failed too
+    :return: Tuple of the number of failed jobs and the ids of the queued jobs to run
+    """
+    failed = list(ExtractionJob.objects.filter(status=ExtractionJob.STATUS_RUNNING).values_list("id", flat=True))
+    for job_id in failed:
+        _fail_job(job_id, "Interrupted by a restart of the server, please upload the song again.")
+    queued = list(ExtractionJob.objects.filter(status=ExtractionJob.STATUS_QUEUED).values_list("id", flat=True))
+    if fail_queued:
+        for job_id in queued:
+            _fail_job(job_id, "Not run after a restart of the server, please upload the song again.")
+        return len(failed) + len(queued), []
+    return len(failed), queued
@@ -0,0 +1,433 @@
+"""
+The original loop implementations of the MSA kernels (from libfmp), which were replaced by vectorized versions.
+Only used by the equivalence checks of the benchmark_msa management command, kept out of the runtime MSA package.
+The leading underscore keeps Django from listing this module as a command.
+"""
+import numpy as np
+import scipy.cluster.vq as vq
+from scipy.ndimage import filters
+from scipy.spatial import distance
+from sklearn.cluster import KMeans
+
+from apps.songs.feature_extraction.msa import xmeans
+from apps.songs.feature_extraction.msa.msa_utils import compute_gaussian_krnl, compute_kernel_checkerboard_gaussian
+
+
+def normalize_feature_sequence(X, norm='2', threshold=0.0001, v=None):
+    """Normalizes the columns of a feature sequence
+
+    Notebook: C3/C3S1_FeatureNormalization.ipynb
+
+    Args:
+        X (np.ndarray): Feature sequence
+        norm (str): The norm to be applied. '1', '2', 'max' or 'z' (Default value = '2')
+        threshold (float): An threshold below which the vector ``v`` used instead of normalization
+            (Default value = 0.0001)
+        v (float): Used instead of normalization below ``threshold``. If None, uses unit vector for given norm
+            (Default value = None)
+
+    Returns:
+        X_norm (np.ndarray): Normalized feature sequence
+    """
+    assert norm in ['1', '2', 'max', 'z']
+
+    K, N = X.shape
+    X_norm = np.zeros((K, N))
+
+    if norm == '1':
+        if v is None:
+            v = np.ones(K, dtype=np.float64) / K
+        for n in range(N):
+            s = np.sum(np.abs(X[:, n]))
+            if s > threshold:
+                X_norm[:, n] = X[:, n] / s
+            else:
+                X_norm[:, n] = v
+
+    if norm == '2':
+        if v is None:
+            v = np.ones(K, dtype=np.float64) / np.sqrt(K)
+        for n in range(N):
+            s = np.sqrt(np.sum(X[:, n] ** 2))
+            if s > threshold:
+                X_norm[:, n] = X[:, n] / s
+            else:
+                X_norm[:, n] = v
+
+    if norm == 'max':
+        if v is None:
+            v = np.ones(K, dtype=np.float64)
+        for n in range(N):
+            s = np.max(np.abs(X[:, n]))
+            if s > threshold:
+                X_norm[:, n] = X[:, n] / s
+            else:
+                X_norm[:, n] = v
+
+    if norm == 'z':
+        if v is None:
+            v = np.zeros(K, dtype=np.float64)
+        for n in range(N):
+            mu = np.sum(X[:, n]) / K
+            sigma = np.sqrt(np.sum((X[:, n] - mu) ** 2) / (K - 1))
+            if sigma > threshold:
+                X_norm[:, n] = (X[:, n] - mu) / sigma
+            else:
+                X_norm[:, n] = v
+
+    return X_norm
+
+
+def filter_diag_mult_sm(S, L=1, tempo_rel_set=np.asarray([1]), direction=0):
+    """Path smoothing of similarity matrix by filtering in forward or backward direction
+    along various directions around main diagonal.
+    Note: Directions are simulated by resampling one axis using relative tempo values
+
+    Notebook: C4/C4S2_SSM-PathEnhancement.ipynb
+
+    Args:
+        S (np.ndarray): Self-similarity matrix (SSM)
+        L (int): Length of filter (Default value = 1)
+        tempo_rel_set (np.ndarray): Set of relative tempo values (Default value = np.asarray([1]))
+        direction (int): Direction of smoothing (0: forward; 1: backward) (Default value = 0)
+
+    Returns:
+        S_L_final (np.ndarray): Smoothed SM
+    """
+    N = S.shape[0]
+    M = S.shape[1]
+    num = len(tempo_rel_set)
+    S_L_final = np.zeros((N, M))
+
+    for s in range(0, num):
+        M_ceil = int(np.ceil(M / tempo_rel_set[s]))
+        resample = np.multiply(np.divide(np.arange(1, M_ceil+1), M_ceil), M)
+        np.around(resample, 0, resample)
+        resample = resample - 1
+        index_resample = np.maximum(resample, np.zeros(len(resample))).astype(np.int64)
+        S_resample = S[:, index_resample]
+
+        S_L = np.zeros((N, M_ceil))
+        S_extend_L = np.zeros((N + L, M_ceil + L))
+
+        # Forward direction
+        if direction == 0:
+            S_extend_L[0:N, 0:M_ceil] = S_resample
+            for pos in range(0, L):
+                S_L = S_L + S_extend_L[pos:(N + pos), pos:(M_ceil + pos)]
+
+        # Backward direction
+        if direction == 1:
+            S_extend_L[L:(N+L), L:(M_ceil+L)] = S_resample
+            for pos in range(0, L):
+                S_L = S_L + S_extend_L[(L-pos):(N + L - pos), (L-pos):(M_ceil + L - pos)]
+
+        S_L = S_L / L
+        resample = np.multiply(np.divide(np.arange(1, M+1), M), M_ceil)
+        np.around(resample, 0, resample)
+        resample = resample - 1
+        index_resample = np.maximum(resample, np.zeros(len(resample))).astype(np.int64)
+
+        S_resample_inv = S_L[:, index_resample]
+        S_L_final = np.maximum(S_L_final, S_resample_inv)
+
+    return S_L_final
+
+
+def threshold_matrix(S, thresh, strategy='absolute', scale=False, penalty=0.0, binarize=False):
+    """Treshold matrix in a relative fashion
+
+    Notebook: C4/C4S2_SSM-Thresholding.ipynb
+
+    Args:
+        S (np.ndarray): Input matrix
+        thresh (float or list): Treshold (meaning depends on strategy)
+        strategy (str): Thresholding strategy ('absolute', 'relative', 'local') (Default value = 'absolute')
+        scale (bool): If scale=True, then scaling of positive values to range [0,1] (Default value = False)
+        penalty (float): Set values below treshold to value specified (Default value = 0.0)
+        binarize (bool): Binarizes final matrix (positive: 1; otherwise: 0) (Default value = False)
+
+    Returns:
+        S_thresh (np.ndarray): Thresholded matrix
+    """
+    if np.min(S) < 0:
+        raise Exception('All entries of the input matrix must be nonnegative')
+
+    S_thresh = np.copy(S)
+    N, M = S.shape
+    num_cells = N * M
+
+    if strategy == 'absolute':
+        thresh_abs = thresh
+        S_thresh[S_thresh < thresh] = 0
+
+    if strategy == 'relative':
+        thresh_rel = thresh
+        num_cells_below_thresh = int(np.round(S_thresh.size*(1-thresh_rel)))
+        if num_cells_below_thresh < num_cells:
+            values_sorted = np.sort(S_thresh.flatten('F'))
+            thresh_abs = values_sorted[num_cells_below_thresh]
+            S_thresh[S_thresh < thresh_abs] = 0
+        else:
+            S_thresh = np.zeros([N, M])
+
+    if strategy == 'local':
+        thresh_rel_row = thresh[0]
+        thresh_rel_col = thresh[1]
+        S_binary_row = np.zeros([N, M])
+        num_cells_row_below_thresh = int(np.round(M * (1-thresh_rel_row)))
+        for n in range(N):
+            row = S[n, :]
+            values_sorted = np.sort(row)
+            if num_cells_row_below_thresh < M:
+                thresh_abs = values_sorted[num_cells_row_below_thresh]
+                S_binary_row[n, :] = (row >= thresh_abs)
+        S_binary_col = np.zeros([N, M])
+        num_cells_col_below_thresh = int(np.round(N * (1-thresh_rel_col)))
+        for m in range(M):
+            col = S[:, m]
+            values_sorted = np.sort(col)
+            if num_cells_col_below_thresh < N:
+                thresh_abs = values_sorted[num_cells_col_below_thresh]
+                S_binary_col[:, m] = (col >= thresh_abs)
+        S_thresh = S * S_binary_row * S_binary_col
+
+    if scale:
+        cell_val_zero = np.where(S_thresh == 0)
+        cell_val_pos = np.where(S_thresh > 0)
+        if len(cell_val_pos[0]) == 0:
+            min_value = 0
+        else:
+            min_value = np.min(S_thresh[cell_val_pos])
+        max_value = np.max(S_thresh)
+        # print('min_value = ', min_value, ', max_value = ', max_value)
+        if max_value > min_value:
+            S_thresh = np.divide((S_thresh - min_value), (max_value - min_value))
+            if len(cell_val_zero[0]) > 0:
+                S_thresh[cell_val_zero] = penalty
+        else:
+            print('Condition max_value > min_value is voliated: output zero matrix')
+
+    if binarize:
+        S_thresh[S_thresh > 0] = 1
+        S_thresh[S_thresh < 0] = 0
+    return S_thresh
+
+
+def compute_novelty_ssm(S, kernel=None, L=5, var=0.5, exclude=False):
+    if kernel is None:
+        kernel = compute_kernel_checkerboard_gaussian(L=L, var=var)
+    N = S.shape[0]
+    M = 2*L + 1
+    nov = np.zeros(N)
+    # np.pad does not work with numba/jit
+    S_padded = np.pad(S, L, mode='constant')
+
+    for n in range(N):
+        # Does not work with numba/jit
+        nov[n] = np.sum(S_padded[n:n+M, n:n+M] * kernel)
+    if exclude:
+        right = np.min([L, N])
+        left = np.max([0, N-L])
+        nov[0:right] = 0
+        nov[left:N] = 0
+    
+    return nov
+
+
+def compute_nc(X, kernel=None):
+    """Computes the novelty curve from the self-similarity matrix X and
+        the gaussian kernel G."""
+    if kernel is None:
+        kernel = compute_gaussian_krnl(66)
+    G = kernel
+    N = X.shape[0]
+    M = G.shape[0]
+    nc = np.zeros(N)
+
+    for i in range(M // 2, N - M // 2 + 1):
+        nc[i] = np.sum(X[i - M // 2:i + M // 2, i - M // 2:i + M // 2] * G)
+
+    # Normalize
+    nc += nc.min()
+    nc /= nc.max()
+    return nc
+
+
+def pick_peaks(nc, L=16, mean=8):
+    """Obtain peaks from a novelty curve using an adaptive threshold."""
+    offset = nc.mean() / float(mean) ##200
+
+    nc = filters.gaussian_filter1d(nc, sigma=1)  # Smooth out nc
+
+    th = filters.median_filter(nc, size=L) + offset
+    #th = filters.gaussian_filter(nc, sigma=L/2., mode="nearest") + offset
+
+    peaks = []
+    for i in range(1, nc.shape[0] - 1):
+        # is it a peak?
+        if nc[i - 1] < nc[i] and nc[i] > nc[i + 1]:
+            # is it above the threshold?
+            if nc[i] > th[i]:
+                peaks.append(i)
+    
+    return peaks
+
+
+def compute_time_lag_representation(S, circular=True):
+    """Computation of (circular) time-lag representation
+
+    Notebook: C4/C4S4_StructureFeature.ipynb
+
+    Args:
+        S (np.ndarray): Self-similarity matrix
+        circular (bool): Computes circular version (Default value = True)
+
+    Returns:
+        L (np.ndarray): (Circular) time-lag representation of S
+    """
+    N = S.shape[0]
+    if circular:
+        L = np.zeros((N, N))
+        for n in range(N):
+            L[:, n] = np.roll(S[:, n], -n)
+    else:
+        L = np.zeros((2*N-1, N))
+        for n in range(N):
+            L[((N-1)-n):((2*N)-1-n), n] = S[:, n]
+    return L
+
+
+def novelty_structure_feature(L, padding=True):
+    """Computation of the novelty function from a circular time-lag representation
+
+    Notebook: C4/C4S4_StructureFeature.ipynb
+
+    Args:
+        L (np.ndarray): Circular time-lag representation
+        padding (bool): Padding the result with the value zero (Default value = True)
+
+    Returns:
+        nov (np.ndarray): Novelty function
+    """
+    N = L.shape[0]
+    if padding:
+        nov = np.zeros(N)
+    else:
+        nov = np.zeros(N-1)
+    for n in range(N-1):
+        nov[n] = np.linalg.norm(L[:, n+1] - L[:, n])
+    return nov
+
+
+class XMeans(xmeans.XMeans):
+    """X-means whitening the data in every k-means run and BIC, with the BIC summed point by point"""
+
+    def estimate_K_knee(self, th=.015, maxK=12):
+        """Estimates the K using K-means and BIC, by sweeping various K and
+            choosing the optimal BIC."""
+        # Sweep K-means
+        if self.X.shape[0] < maxK:
+            maxK = self.X.shape[0]
+        if maxK < 2:
+            maxK = 2
+        K = np.arange(1, maxK)
+        bics = []
+        for k in K:
+            means, labels = self.run_kmeans(self.X, k)
+            bic = self.compute_bic(self.X, means, labels, K=k,
+                                   R=self.X.shape[0])
+            bics.append(bic)
+        diff_bics = np.diff(bics)
+        finalK = K[-1]
+
+        if len(bics) == 1:
+            finalK = 2
+        else:
+            # Normalize
+            bics = np.asarray(bics)
+            bics -= bics.min()
+            #bics /= bics.max()
+            diff_bics -= diff_bics.min()
+            #diff_bics /= diff_bics.max()
+
+            #print bics, diff_bics
+
+            # Find optimum K
+            for i in range(len(K[:-1])):
+                #if bics[i] > diff_bics[i]:
+                if diff_bics[i] < th and K[i] != 1:
+                    finalK = K[i]
+                    break
+
+        return finalK
+
+    def run_kmeans(self, X, K):
+        """Runs k-means and returns the labels assigned to the data."""
+        wX = vq.whiten(X)
+        means, dist = vq.kmeans(wX, K, iter=100)
+        labels, dist = vq.vq(wX, means)
+        return means, labels
+
+    def compute_bic(self, D, means, labels, K, R):
+        """Computes the Bayesian Information Criterion."""
+        D = vq.whiten(D)
+        Rn = D.shape[0]
+        M = D.shape[1]
+
+        if R == K:
+            return 1
+
+        # Maximum likelihood estimate (MLE)
+        mle_var = 0
+        for k in range(len(means)):
+            X = D[np.argwhere(labels == k)]
+            X = X.reshape((X.shape[0], X.shape[-1]))
+            for x in X:
+                mle_var += distance.euclidean(x, means[k])
+                #print x, means[k], mle_var
+        mle_var /= float(R - K)
+
+        # Log-likelihood of the data
+        l_D = - Rn/2. * np.log(2*np.pi) - (Rn * M)/2. * np.log(mle_var) - \
+            (Rn - K) / 2. + Rn * np.log(Rn) - Rn * np.log(R)
+
+        # Params of BIC
+        p = (K-1) + M * K + mle_var
+
+        #print "BIC:", l_D, p, R, K
+
+        # Return the bic
+        return l_D - p / 2. * np.log(R)
+
+
+def compute_labels_kmeans(fmcs, k):
+    # Removing the higher frequencies seem to yield better results
+    fmcs = fmcs[:, fmcs.shape[1] // 2:]
+
+    # Pre-process
+    fmcs = np.log1p(fmcs)
+    wfmcs = vq.whiten(fmcs)
+
+    # Make sure we are not using more clusters than existing segments
+    if k > fmcs.shape[0]:
+        k = fmcs.shape[0]
+
+    # K-means
+    kmeans = KMeans(n_clusters=k, n_init=200)
+    kmeans.fit(wfmcs)
+
+    # store labels and indices
+    idxs_labels = {'label' + str(i): np.where(kmeans.labels_ == i)[0] for i in range(k)}
+
+    dist_to_centroid = kmeans.transform(wfmcs)**2
+    
+    return kmeans.labels_, idxs_labels, dist_to_centroid
+
+
+def compute_labels_xmeans_kmeans(fmcs):
+    """Segment labelling of compute_similarity(xmeans=True) with the loop X-means: X-means on the 2D-FMCs
+    to estimate K, then k-means with 200 restarts on the labelling features"""
+    xm = XMeans(fmcs, plot=False)
+    k = xm.estimate_K_knee(th=0.01, maxK=8)
+    return compute_labels_kmeans(fmcs, k=k)
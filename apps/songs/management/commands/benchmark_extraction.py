@@ -0,0 +1,214 @@
+import copy
+import json
+import math
+import os
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from essentia.standard import Extractor, PoolAggregator, TempoCNN, TensorflowPredictMusiCNN, YamlOutput
+
+from ...feature_extraction.chunk_features import compute_chunk_descriptors
+from ...feature_extraction.consts import ML_MODELS
+from ...feature_extraction.predictors import predictor_registry
+from ...feature_extraction.song_info_extractor import (
+    GMBI_RF_MODELS,
+    GmbiFeatureSchema,
+    SongInfoExtractor,
+    create_gmbi_df,
+    gmbi_feature_schema,
+    pool_to_dict,
+    random_forest,
+)
+
+BENCHMARKS = ["pool", "schema", "gmbi", "models"]
+
+
+def pool_to_dict_via_file(pool) -> dict:
+    """Reference implementation: the YamlOutput file round trip pool_to_dict replaces."""
+    fd, path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    try:
+        YamlOutput(filename=path, format="json", writeVersion=False)(pool)
+        with open(path) as file:
+            return json.load(file)
+    finally:
+        os.remove(path)
+
+
+def gmbi_frames_serial(extractor: SongInfoExtractor, dl_frames: dict) -> dict:
+    """Reference implementation: one Extractor, one DataFrame and five predict calls per frame, in one process."""
+    frames = {key: [] for key in GMBI_RF_MODELS.keys()}
+    num_samples_pro_prediction = int(math.ceil(len(extractor.audio) / len(dl_frames["voice"])))
+    for i, start in enumerate(range(0, len(extractor.audio), num_samples_pro_prediction)):
+        audio_chunk = extractor.audio[start : start + num_samples_pro_prediction]
+        features = pool_to_dict(
+            PoolAggregator(defaultStats=["min", "max", "median", "mean", "stdev"])(Extractor()(audio_chunk))
+        )
+        dl_dict = {key: values[i] for key, values in dl_frames.items() if key != "bpm"}
+        data = np.array(create_gmbi_df(features, dl_dict)).reshape(1, -1)
+        for key in GMBI_RF_MODELS.keys():
+            frames[key].append(round(random_forest[key].predict(data)[0], 8))
+    return frames
+
+
+def max_difference(a, b, path="") -> float:
+    """
+    Largest relative difference between two nested feature dictionaries.
+    :raises CommandError: If the structure differs
+    """
+    if isinstance(a, dict) and isinstance(b, dict):
+        if a.keys() != b.keys():
+            raise CommandError(f"Different keys at '{path}': {sorted(set(a) ^ set(b))}")
+        return max([max_difference(a[k], b[k], f"{path}.{k}") for k in a] or [0.0])
+    if isinstance(a, str) or isinstance(b, str):
+        if a != b:
+            raise CommandError(f"Different values at '{path}': {a} != {b}")
+        return 0.0
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    if a.shape != b.shape:
+        raise CommandError(f"Different shapes at '{path}': {a.shape} != {b.shape}")
+    if a.size == 0:
+        return 0.0
+    return float(np.max(np.abs(a - b) / np.maximum(np.abs(b), 1e-6)))
+
+
+class Command(BaseCommand):
+    help = "Benchmarks stages of the song feature extraction on the given audio files and checks result parity."
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("audio", nargs="+", help="Audio files.")
+        parser.add_argument("--benchmark", choices=BENCHMARKS, action="append", help="Benchmarks to run (default: all).")
+        parser.add_argument("--chunks", type=int, default=32, help="Audio chunks for the per-chunk benchmarks.")
+        parser.add_argument("--tolerance", type=float, default=1e-5, help="Allowed relative difference.")
+
+    def handle(self, *args, **options):
+        for file_path in options["audio"]:
+            if not os.path.isfile(file_path):
+                raise CommandError(f"File not found: {file_path}")
+            self.stdout.write(f"== {file_path}")
+            extractor = SongInfoExtractor(file_path)
+            for name in options["benchmark"] or BENCHMARKS:
+                getattr(self, f"benchmark_{name}")(extractor, options)
+
+    def _chunks(self, extractor: SongInfoExtractor, count: int):
+        chunk_length = int(np.ceil(len(extractor.audio) / count))
+        return [extractor.audio[i : i + chunk_length] for i in range(0, len(extractor.audio), chunk_length)]
+
+    def benchmark_pool(self, extractor: SongInfoExtractor, options):
+        """In-memory pool conversion against the YamlOutput temp file, as done once per GMBI chunk."""
+        pools = [
+            PoolAggregator(defaultStats=["min", "max", "median", "mean", "stdev"])(Extractor()(chunk))
+            for chunk in self._chunks(extractor, options["chunks"])
+        ]
+        ml_features = {"voice": 0.5, "female": 0.5, "danceability": 0.5, "tonal": 0.5}
+
+        start = time.perf_counter()
+        via_file = [pool_to_dict_via_file(pool) for pool in pools]
+        file_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        in_memory = [pool_to_dict(pool) for pool in pools]
+        memory_s = time.perf_counter() - start
+
+        difference = max(max_difference(m, f) for m, f in zip(in_memory, via_file))
+        df_difference = 0.0
+        for m, f in zip(in_memory, via_file):
+            df_m = create_gmbi_df(copy.deepcopy(m), ml_features)
+            df_f = create_gmbi_df(copy.deepcopy(f), ml_features)
+            if list(df_m.columns) != list(df_f.columns):
+                raise CommandError("create_gmbi_df produces different columns for the in-memory conversion")
+            df_difference = max(df_difference, max_difference(df_m.to_numpy(float), df_f.to_numpy(float)))
+
+        self.stdout.write(
+            f"pool: {len(pools)} pools, file {file_s / len(pools) * 1000:.2f} ms/pool, "
+            f"in-memory {memory_s / len(pools) * 1000:.2f} ms/pool ({file_s / max(memory_s, 1e-9):.1f}x), "
+            f"max rel. diff {difference:.2e} (gmbi df {df_difference:.2e})"
+        )
+        if max(difference, df_difference) > options["tolerance"]:
+            raise CommandError("In-memory pool conversion differs from the file based conversion")
+
+    def benchmark_gmbi(self, extractor: SongInfoExtractor, options):
+        """GMBI frame features: serial per frame reference against the process pool and batched predict."""
+        dl_features = extractor.extract_essentia_dl_features(gmbi_inference=True)
+
+        start = time.perf_counter()
+        serial = gmbi_frames_serial(extractor, dl_features["frames"])
+        serial_s = time.perf_counter() - start
+
+        # first call starts the worker processes, which happens once per server process
+        extractor.extract_gmbi_features_frames(essentia_dl_features=dl_features)
+        start = time.perf_counter()
+        batched = extractor.extract_gmbi_features_frames(essentia_dl_features=dl_features)["frames"]
+        batched_s = time.perf_counter() - start
+
+        difference = max_difference(batched, serial)
+        self.stdout.write(
+            f"gmbi: {len(serial['valence'])} frames, serial {60 / serial_s:.2f} songs/min, "
+            f"batched {60 / batched_s:.2f} songs/min ({serial_s / batched_s:.1f}x), max rel. diff {difference:.2e}"
+        )
+        if difference > options["tolerance"]:
+            raise CommandError("Batched GMBI frame features differ from the serial computation")
+
+    def benchmark_schema(self, extractor: SongInfoExtractor, options):
+        """Flattening through the compiled feature schema against the create_gmbi_df DataFrame."""
+        chunks = [compute_chunk_descriptors(chunk) for chunk in self._chunks(extractor, options["chunks"])]
+        ml_features = {"voice": 0.5, "female": 0.5, "danceability": 0.5, "tonal": 0.5}
+        copies = [copy.deepcopy(chunk) for chunk in chunks]
+
+        start = time.perf_counter()
+        frames = [create_gmbi_df(chunk, ml_features) for chunk in copies]
+        df_s = time.perf_counter() - start
+
+        schema = gmbi_feature_schema
+        if schema is None:
+            self.stdout.write("schema: the forests have no feature names, using the DataFrame columns")
+            schema = GmbiFeatureSchema(frames[0].columns)
+        elif list(frames[0].columns) != schema.columns:
+            raise CommandError("create_gmbi_df columns are not in the order the forests were fitted with")
+
+        start = time.perf_counter()
+        rows = [schema.flatten(chunk, ml_features) for chunk in chunks]
+        schema_s = time.perf_counter() - start
+
+        difference = max(max_difference(row, df.to_numpy(float).reshape(-1)) for row, df in zip(rows, frames))
+        self.stdout.write(
+            f"schema: {len(chunks)} frames x {len(schema.columns)} columns, "
+            f"DataFrame {df_s / len(chunks) * 1000:.2f} ms/frame, schema {schema_s / len(chunks) * 1000:.3f} ms/frame "
+            f"({df_s / max(schema_s, 1e-9):.0f}x), max rel. diff {difference:.2e}"
+        )
+        if difference > options["tolerance"]:
+            raise CommandError("Schema flattening differs from create_gmbi_df")
+
+    def benchmark_models(self, extractor: SongInfoExtractor, options):
+        """ML models: graph loaded per song and run one after another against the registry running them in parallel."""
+        audio = {11025: extractor.audio_context.get(11025), 16000: extractor.audio_context.get(16000)}
+
+        start = time.perf_counter()
+        reference = {}
+        for model in ML_MODELS:
+            algorithm = TempoCNN if model == "bpm" else TensorflowPredictMusiCNN
+            reference[model] = algorithm(graphFilename=ML_MODELS[model])(audio[11025 if model == "bpm" else 16000])
+        reference_s = time.perf_counter() - start
+
+        # load the graphs once, as the first song of a server process does
+        SongInfoExtractor(extractor.file_path, audio_context=extractor.audio_context).predict_models(list(ML_MODELS))
+        cached = SongInfoExtractor(extractor.file_path, audio_context=extractor.audio_context)
+        start = time.perf_counter()
+        predictions = cached.predict_models(list(ML_MODELS))
+        cached_s = time.perf_counter() - start
+
+        # TempoCNN returns the global tempo first
+        output = lambda result, model: np.asarray(result[model][0] if model == "bpm" else result[model])
+        difference = max(max_difference(output(predictions, m), output(reference, m)) for m in ML_MODELS)
+        timings = ", ".join(f"{model} {seconds:.2f}s" for model, seconds in cached.model_timings.items())
+        loads = ", ".join(f"{model} {seconds:.2f}s" for model, seconds in predictor_registry.load_time_s.items())
+        self.stdout.write(
+            f"models: loaded per song and serial {reference_s:.2f}s, cached and parallel {cached_s:.2f}s "
+            f"({reference_s / cached_s:.1f}x), max rel. diff {difference:.2e}\n"
+            f"  inference: {timings}\n  graph loading (once per process): {loads}"
+        )
+        if difference > options["tolerance"]:
+            raise CommandError("Cached predictors give different predictions")
@@ -0,0 +1,341 @@
+import os
+import time
+import tracemalloc
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from scipy import ndimage
+
+from ...feature_extraction.consts import MSA_KMEANS_N_INIT, MSA_KMEANS_SEED, MSA_MAX_LAG_S
+from ...feature_extraction.msa import msa_utils, ssm
+from . import _msa_reference as reference
+
+# track lengths of the synthetic benchmark, the structure analysis runs at 1 feature per second
+MINUTES = [3, 5, 10, 15, 20]
+# track lengths of the banded benchmark, up to DJ mixes and live recordings
+BANDED_MINUTES = [10, 30, 60, 120, 240]
+# section labels of the synthetic tracks, a typical pop form repeated until the track is long enough
+FORM = "ABABCABDAB"
+
+
+def synthetic_sections(seconds: int, seed: int = 0):
+    """
+    Chroma like feature sequence (1 Hz) with repeated sections, so the SSM has the path and block structure of music
+    :param seconds: Length of the track
+    :param seed: Random seed
+    :return: Tuple of the non negative features of shape (12, seconds), the section boundaries (with 0 and seconds)
+        and the section labels
+    """
+    rng = np.random.default_rng(seed)
+    templates = {label: rng.random((12, 16)) for label in sorted(set(FORM))}
+    sections, labels, boundaries = [], [], [0]
+    while boundaries[-1] < seconds:
+        labels.append(FORM[len(sections) % len(FORM)])
+        sections.append(np.tile(templates[labels[-1]], int(rng.integers(1, 3))))
+        boundaries.append(min(seconds, boundaries[-1] + sections[-1].shape[1]))
+    X = np.concatenate(sections, axis=1)[:, :seconds]
+    return np.abs(X + 0.1 * rng.normal(size=X.shape)), np.asarray(boundaries), labels
+
+
+def synthetic_features(seconds: int, seed: int = 0) -> np.ndarray:
+    """
+    :return: The features of synthetic_sections
+    """
+    return synthetic_sections(seconds, seed)[0]
+
+
+def audio_features(file_path: str) -> np.ndarray:
+    """Features of an audio file as computed by MusicStructureAnalysis.compute_ssm (chroma at 10 Hz, downsampled to 1 Hz)"""
+    import librosa
+
+    audio, sr = librosa.load(file_path, sr=22050)
+    chroma = librosa.feature.chroma_stft(y=audio, sr=sr, tuning=0, norm=2, hop_length=2205, n_fft=4410)
+    X, _ = ssm.smooth_downsample_feature_sequence(chroma, sr / 2205, filt_len=40, down_sampling=10)
+    return X
+
+
+def structure_novelty(X: np.ndarray, max_lag=None, dtype=np.float64) -> np.ndarray:
+    """
+    Novelty function as computed by MusicStructureAnalysis (compute_ssm, compute_time_lag_representation
+    and compute_novelty_function) from the features
+    :param X: Features (1 Hz)
+    :param max_lag: Largest lag of the banded mode, None computes the dense SSM
+    :param dtype: Data type of the SSM
+    :return: Novelty function
+    """
+    X = ssm.normalize_feature_sequence(X, norm="2", threshold=0.001, dtype=dtype)
+    if max_lag is None:
+        S, _ = ssm.compute_sm_ti(X, X, L=4, direction=2, dtype=dtype)
+        S = ssm.threshold_matrix(S, thresh=0.15, strategy="relative", scale=True)
+        L = msa_utils.compute_time_lag_representation(S)
+    else:
+        B, _ = ssm.compute_sm_ti_band(X, X, max_lag, L=4, direction=2, dtype=dtype)
+        B = ssm.threshold_band(B, thresh=0.15, strategy="relative", scale=True)
+        L = msa_utils.compute_time_lag_representation_band(B)
+    L = ndimage.median_filter(L, (2, 15))
+    L = ndimage.gaussian_filter(L, 2)
+    return msa_utils.novelty_structure_feature(L)
+
+
+def measure(fn):
+    """
+    :return: Tuple of the result of fn, its time and its peak of traced (numpy) memory in bytes
+    """
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        result = fn()
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+def max_difference(a, b) -> float:
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    if a.shape != b.shape:
+        raise CommandError(f"Different shapes: {a.shape} != {b.shape}")
+    return float(np.max(np.abs(a - b), initial=0))
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the vectorized MSA kernels (ssm.py, msa_utils.py) against their loop implementations "
+        "(_msa_reference.py) on synthetic tracks of 3 to 20 minutes or on audio files, and checks that the results "
+        "are equal."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("audio", nargs="*", help="Audio files (default: synthetic tracks).")
+        parser.add_argument("--minutes", type=int, nargs="+", help="Lengths of the synthetic tracks.")
+        parser.add_argument("--kernel", choices=self.available_kernels(), action="append", help="Kernels (default: all).")
+        parser.add_argument("--float32", action="store_true", help="Run the vectorized kernels in float32.")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per kernel, the fastest counts.")
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            help="Allowed absolute difference (default: 1e-9, 1e-4 with --float32).",
+        )
+        parser.add_argument(
+            "--banded",
+            action="store_true",
+            help="Compare the banded structure analysis of long recordings with the dense one instead of the kernels.",
+        )
+        parser.add_argument("--max-lag", type=float, default=MSA_MAX_LAG_S, help="Largest lag of --banded (seconds).")
+        parser.add_argument(
+            "--dense-max-minutes",
+            type=int,
+            default=60,
+            help="Longest track --banded also analyses dense (the dense SSM grows quadratically).",
+        )
+        parser.add_argument(
+            "--labelling",
+            action="store_true",
+            help="Compare the segment labelling (whitened and vectorized X-means sweep, seeded k-means) with the "
+            "loop implementation (synthetic tracks only).",
+        )
+
+    @classmethod
+    def available_kernels(cls):
+        return [name[len("kernel_") :] for name in dir(cls) if name.startswith("kernel_")]
+
+    def handle(self, *args, **options):
+        dtype = np.float32 if options["float32"] else np.float64
+        tolerance = options["tolerance"]
+        if tolerance is None:
+            tolerance = 1e-4 if options["float32"] else 1e-9
+
+        if options["labelling"]:
+            if options["audio"]:
+                raise CommandError("--labelling needs the sections of the synthetic tracks")
+            self.benchmark_labelling(options["minutes"] or MINUTES, options["repeat"])
+            return
+
+        if options["audio"]:
+            tracks = []
+            for file_path in options["audio"]:
+                if not os.path.isfile(file_path):
+                    raise CommandError(f"File not found: {file_path}")
+                tracks.append((os.path.basename(file_path), audio_features(file_path)))
+        else:
+            minutes = options["minutes"] or (BANDED_MINUTES if options["banded"] else MINUTES)
+            tracks = [(f"{m} min", synthetic_features(m * 60)) for m in minutes]
+
+        if options["banded"]:
+            self.benchmark_banded(tracks, options)
+            return
+
+        failed = []
+        for track, X in tracks:
+            self.stdout.write(f"== {track} (N={X.shape[1]}, {np.dtype(dtype).name})")
+            for name in options["kernel"] or self.available_kernels():
+                vectorized, loop = getattr(self, f"kernel_{name}")(X, dtype)
+                result, vectorized_s = self._time(vectorized, options["repeat"])
+                expected, loop_s = self._time(loop, options["repeat"])
+                difference = max_difference(result, expected)
+                self.stdout.write(
+                    f"  {name}: loop {loop_s * 1000:.1f} ms, vectorized {vectorized_s * 1000:.1f} ms "
+                    f"({loop_s / max(vectorized_s, 1e-9):.1f}x), max diff {difference:.1e}"
+                )
+                if difference > tolerance:
+                    failed.append(f"{name} ({track})")
+        if failed:
+            raise CommandError(f"Vectorized kernels differ from the loop implementations: {', '.join(failed)}")
+
+    def benchmark_banded(self, tracks, options):
+        """Time, peak memory and boundaries of the banded structure analysis against the dense one"""
+        # with a band covering every lag the banded analysis has to reproduce the dense one
+        _, X = min(tracks, key=lambda track: track[1].shape[1])
+        difference = max_difference(structure_novelty(X, X.shape[1] - 1), structure_novelty(X))
+        self.stdout.write(f"full band against dense: max novelty diff {difference:.1e}")
+        if difference > (options["tolerance"] or 1e-9):
+            raise CommandError("The banded structure analysis with a full band differs from the dense one")
+
+        for track, X in tracks:
+            N = X.shape[1]
+            max_lag = int(min(N - 1, round(options["max_lag"])))
+            novelty, banded_s, banded_peak = measure(lambda: structure_novelty(X, max_lag, np.float32))
+            line = (
+                f"{track} (N={N}): banded (max lag {max_lag}) {banded_s:.2f}s, "
+                f"peak {banded_peak / 2**20:.0f} MiB"
+            )
+            if N <= options["dense_max_minutes"] * 60:
+                dense, dense_s, dense_peak = measure(lambda: structure_novelty(X))
+                peaks = msa_utils.pick_peaks(novelty, 10, 200)
+                dense_peaks = msa_utils.pick_peaks(dense, 10, 200)
+                # boundaries of the dense analysis the banded one finds within 3 seconds
+                found = sum(any(abs(p - q) <= 3 for q in peaks) for p in dense_peaks)
+                line += (
+                    f" | dense {dense_s:.2f}s, peak {dense_peak / 2**20:.0f} MiB | "
+                    f"{found}/{len(dense_peaks)} dense boundaries found, {len(peaks)} banded boundaries"
+                )
+            self.stdout.write(line)
+
+    def benchmark_labelling(self, minutes, repeat: int):
+        """Time, K and agreement of the segment labelling of compute_similarity(xmeans=True) with the loop
+        implementation of the K sweep"""
+        from sklearn.metrics import adjusted_rand_score
+
+        from ...feature_extraction.msa import similarity_kmean
+
+        for m in minutes:
+            X, boundaries, labels = synthetic_sections(m * 60)
+            # only sections with the same label and length have the same 2D-FMC
+            labels = [f"{label}{length}" for label, length in zip(labels, np.diff(boundaries))]
+            # the 10 Hz chroma of MusicStructureAnalysis.labelElements as (frames, 12)
+            rng = np.random.default_rng(1)
+            F = np.repeat(X, 10, axis=1).T
+            F = np.abs(F + 0.05 * rng.normal(size=F.shape))
+            segments = similarity_kmean.get_feat_segments(F, boundaries * 10)
+            fmcs = similarity_kmean.feat_segments_to_2dfmc_max(segments, offset=4)
+
+            (before, _, _), before_s = self._time(lambda: reference.compute_labels_xmeans_kmeans(fmcs), repeat)
+            (after, _, _), after_s = self._time(
+                lambda: similarity_kmean.compute_labels_xmeans(
+                    fmcs, th=0.01, maxK=8, n_init=MSA_KMEANS_N_INIT, seed=MSA_KMEANS_SEED
+                ),
+                repeat,
+            )
+            self.stdout.write(
+                f"{m} min ({len(labels)} segments): before {before_s * 1000:.0f} ms (K={len(set(before))}), "
+                f"after {after_s * 1000:.0f} ms (K={len(set(after))}, {before_s / max(after_s, 1e-9):.1f}x) | "
+                f"ARI after/before {adjusted_rand_score(before, after):.2f}, "
+                f"against the sections: before {adjusted_rand_score(labels, before):.2f}, "
+                f"after {adjusted_rand_score(labels, after):.2f}"
+            )
+
+    @staticmethod
+    def _time(fn, repeat: int):
+        best, result = None, None
+        for _ in range(max(1, repeat)):
+            start = time.perf_counter()
+            result = fn()
+            seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+        return result, best
+
+    @staticmethod
+    def _ssm(X, dtype):
+        X = ssm.normalize_feature_sequence(X, norm="2", threshold=0.001, dtype=dtype)
+        return ssm.compute_sm_dot(X, X)
+
+    def _thresholded_ssm(self, X, dtype):
+        """The SSM MusicStructureAnalysis.compute_ssm passes on to the time-lag representation"""
+        X = ssm.normalize_feature_sequence(X, norm="2", threshold=0.001, dtype=dtype)
+        S, _ = ssm.compute_sm_ti(X, X, L=4, direction=2, dtype=dtype)
+        return ssm.threshold_matrix(S, thresh=0.15, strategy="relative", scale=True)
+
+    # every kernel returns the vectorized and the loop implementation on the same inputs
+
+    def kernel_normalize(self, X, dtype):
+        return (
+            lambda: ssm.normalize_feature_sequence(X, norm="2", threshold=0.001, dtype=dtype),
+            lambda: reference.normalize_feature_sequence(X, norm="2", threshold=0.001),
+        )
+
+    def _smoothing(self, X, dtype, L):
+        """Forward and backward path smoothing with several relative tempi, as compute_sm_ti(direction=2)"""
+        S = self._ssm(X, np.float64)
+        tempo_rel_set = np.array([0.66, 0.81, 1, 1.22, 1.5])
+
+        def smooth(module, **kwargs):
+            return np.maximum(
+                module.filter_diag_mult_sm(S, L, tempo_rel_set, direction=0, **kwargs),
+                module.filter_diag_mult_sm(S, L, tempo_rel_set, direction=1, **kwargs),
+            )
+
+        return lambda: smooth(ssm, dtype=dtype), lambda: smooth(reference)
+
+    def kernel_smoothing(self, X, dtype):
+        # filter length of MusicStructureAnalysis
+        return self._smoothing(X, dtype, 4)
+
+    def kernel_smoothing_long(self, X, dtype):
+        # filter length of ssm.compute_ssm
+        return self._smoothing(X, dtype, 16)
+
+    def kernel_threshold_relative(self, X, dtype):
+        S = self._ssm(X, dtype)
+        return (
+            lambda: ssm.threshold_matrix(S, thresh=0.15, strategy="relative", scale=True),
+            lambda: reference.threshold_matrix(S, thresh=0.15, strategy="relative", scale=True),
+        )
+
+    def kernel_threshold_local(self, X, dtype):
+        S = self._ssm(X, dtype)
+        return (
+            lambda: ssm.threshold_matrix(S, thresh=[0.3, 0.3], strategy="local", scale=True),
+            lambda: reference.threshold_matrix(S, thresh=[0.3, 0.3], strategy="local", scale=True),
+        )
+
+    def kernel_time_lag(self, X, dtype):
+        S = self._thresholded_ssm(X, dtype)
+        return (
+            lambda: msa_utils.compute_time_lag_representation(S, circular=True),
+            lambda: reference.compute_time_lag_representation(S, circular=True),
+        )
+
+    def kernel_novelty_structure(self, X, dtype):
+        L = msa_utils.compute_time_lag_representation(self._thresholded_ssm(X, dtype))
+        return lambda: msa_utils.novelty_structure_feature(L), lambda: reference.novelty_structure_feature(L)
+
+    def kernel_novelty_ssm(self, X, dtype):
+        S = self._thresholded_ssm(X, dtype)
+        kernel = msa_utils.compute_kernel_checkerboard_gaussian(L=10)
+        return (
+            lambda: msa_utils.compute_novelty_ssm(S, kernel=kernel, L=10, exclude=True),
+            lambda: reference.compute_novelty_ssm(S, kernel=kernel, L=10, exclude=True),
+        )
+
+    def kernel_novelty_nc(self, X, dtype):
+        S = self._thresholded_ssm(X, dtype)
+        kernel = msa_utils.compute_gaussian_krnl(66)
+        return lambda: msa_utils.compute_nc(S, kernel=kernel), lambda: reference.compute_nc(S, kernel=kernel)
+
+    def kernel_pick_peaks(self, X, dtype):
+        """Peaks of the novelty function as in MusicStructureAnalysis.pick_peaks_from_noveltyFunction"""
+        L = msa_utils.compute_time_lag_representation(self._thresholded_ssm(X, dtype))
+        novelty = msa_utils.novelty_structure_feature(L)
+        return lambda: msa_utils.pick_peaks(novelty, 10, 200), lambda: reference.pick_peaks(novelty, 10, 200)
@@ -0,0 +1,83 @@
+import multiprocessing
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...ingestion import collect_audio_files, ensure_placeholder_artwork, init_worker, json_name, process_track
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Extracts the features of every audio file below a directory in a process pool and writes one pre-calc JSON "
+        "per track, in the format add_pre_calculated_songs reads. Tracks with a JSON are skipped, so an interrupted "
+        "run continues where it stopped."
+    )
+    # the workers load the extraction models, the main process does not need the URLs (and the SER model)
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", default=os.getenv("PRE_CALC_AUDIO_PATH"), help="Audio directory.")
+        parser.add_argument("--output", default=os.getenv("PRE_CALC_JSON_PATH"), help="JSON directory.")
+        parser.add_argument("--artwork", default=os.getenv("PRE_CALC_ALBUM_ART_PATH"), help="Album art directory.")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes.")
+        parser.add_argument(
+            "--max-tasks-per-child",
+            type=int,
+            default=25,
+            help="Tracks per worker before it is replaced, bounds the memory growth of the TensorFlow workers.",
+        )
+        parser.add_argument("--limit", type=int, help="Only process this many (new) tracks.")
+
+    def handle(self, *args, **options):
+        source, output, artwork = options["source"], options["output"], options["artwork"]
+        if not source or not output or not artwork:
+            raise CommandError("Set PRE_CALC_AUDIO_PATH, PRE_CALC_JSON_PATH and PRE_CALC_ALBUM_ART_PATH or pass them")
+        if not os.path.isdir(source):
+            raise CommandError(f"Audio directory not found: {source}")
+        os.makedirs(output, exist_ok=True)
+        os.makedirs(artwork, exist_ok=True)
+        ensure_placeholder_artwork(artwork)
+
+        tracks = collect_audio_files(source)
+        todo = [t for t in tracks if not os.path.exists(os.path.join(output, json_name(t)))]
+        if options["limit"]:
+            todo = todo[: options["limit"]]
+        self.stdout.write(f"{len(tracks)} tracks, {len(tracks) - len(todo)} done before, {len(todo)} to extract")
+        if not todo:
+            return
+
+        workers = max(1, min(options["workers"], len(todo)))
+        # spawn, every worker initializes its own TensorFlow instead of inheriting a forked one
+        context = multiprocessing.get_context("spawn")
+        failed = 0
+        start = time.perf_counter()
+        with context.Pool(
+            workers,
+            initializer=init_worker,
+            initargs=(output, artwork),
+            maxtasksperchild=options["max_tasks_per_child"],
+        ) as pool:
+            tasks = ((source, track_id) for track_id in todo)
+            for done, (track_id, seconds, error) in enumerate(pool.imap_unordered(process_track, tasks), 1):
+                if error:
+                    failed += 1
+                    self.stderr.write(f"{track_id}: {error}")
+                elapsed = time.perf_counter() - start
+                rate = done / elapsed
+                self.stdout.write(
+                    f"[{done}/{len(todo)}] {track_id} {seconds:.1f}s | {rate * 60:.1f} songs/min, "
+                    f"ETA {_format_duration((len(todo) - done) / rate)}, {failed} failed"
+                )
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"Extracted {len(todo) - failed} tracks in {_format_duration(elapsed)} "
+            f"({(len(todo) - failed) / elapsed * 60:.1f} songs/min with {workers} workers), {failed} failed. "
+            "Failed tracks are retried on the next run."
+        )
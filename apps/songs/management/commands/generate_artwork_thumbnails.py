@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from apps.core.models import Album
+
+from ...artwork import add_artwork_thumbnails
+from ...consts import ARTWORK_THUMBNAIL_SIZES
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates the artwork thumbnails of the albums that have none, or of all albums with --all (after changing "
+        "ARTWORK_THUMBNAIL_SIZES). Thumbnails are named by the image hash, existing ones are reused."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Also albums that already have thumbnails.")
+
+    def handle(self, *args, **options):
+        albums = Album.objects.exclude(artwork_file="")
+        if not options["all"]:
+            albums = albums.filter(artwork_thumbnails={})
+
+        done = failed = 0
+        for album in albums.iterator():
+            add_artwork_thumbnails(album)
+            if album.artwork_thumbnails and all(
+                str(size) in sizes for size in ARTWORK_THUMBNAIL_SIZES for sizes in album.artwork_thumbnails.values()
+            ):
+                done += 1
+            else:
+                failed += 1
+        self.stdout.write(f"Generated the thumbnails of {done} albums, {failed} failed")
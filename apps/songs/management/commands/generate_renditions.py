@@ -0,0 +1,44 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.models import Song
+
+from ...consts import AUDIO_RENDITIONS, RENDITION_PRESETS, RENDITION_WORKERS
+from ...renditions import create_renditions
+
+
+class Command(BaseCommand):
+    help = "Generates the missing streaming renditions (AUDIO_RENDITIONS) of all songs with ffmpeg."
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rendition",
+            choices=list(RENDITION_PRESETS),
+            action="append",
+            help="Renditions (default: AUDIO_RENDITIONS).",
+        )
+        parser.add_argument("--workers", type=int, default=RENDITION_WORKERS, help="ffmpeg processes at once.")
+
+    def handle(self, *args, **options):
+        renditions = options["rendition"] or AUDIO_RENDITIONS
+        if not renditions:
+            raise CommandError("No renditions, set AUDIO_RENDITIONS or pass --rendition")
+
+        song_ids = [
+            song.id
+            for song in Song.objects.exclude(audio_file="").only("id", "renditions")
+            if any(rendition not in song.renditions for rendition in renditions)
+        ]
+        self.stdout.write(f"{len(song_ids)} songs without all of {', '.join(renditions)}")
+
+        start = time.perf_counter()
+        failed = 0
+        with ThreadPoolExecutor(max_workers=max(1, options["workers"])) as executor:
+            results = executor.map(lambda song_id: create_renditions(song_id, renditions), song_ids)
+            for done, stored in enumerate(results, 1):
+                if any(rendition not in stored for rendition in renditions):
+                    failed += 1
+                self.stdout.write(f"[{done}/{len(song_ids)}] {time.perf_counter() - start:.0f}s, {failed} failed")
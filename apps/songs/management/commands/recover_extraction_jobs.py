@@ -0,0 +1,30 @@
+import time
+from concurrent.futures import wait
+
+from django.core.management.base import BaseCommand
+
+from ...jobs import extraction_executor, recover_extraction_jobs, run_extraction_job
+
+
+class Command(BaseCommand):
+    help = (
+        "Recovers the background extraction jobs of a stopped server: running jobs are marked as failed, queued jobs "
+        "are run (or failed with --fail-queued). Run it before the server starts (runserver.sh does), never while "
+        "a server is up."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fail-queued", action="store_true", help="Mark the queued jobs as failed instead of running them."
+        )
+
+    def handle(self, *args, **options):
+        failed, queued = recover_extraction_jobs(fail_queued=options["fail_queued"])
+        self.stdout.write(f"{failed} jobs marked as failed, {len(queued)} queued jobs to run.")
+        if not queued:
+            return
+
+        start = time.perf_counter()
+        wait([extraction_executor.submit(run_extraction_job, job_id) for job_id in queued])
+        self.stdout.write(f"Ran {len(queued)} queued jobs in {time.perf_counter() - start:.1f}s.")
@@ -1,15 +1,33 @@
+import hashlib
 import json
 import os
 import tempfile
 from typing import Tuple
 
 from django.core.files import File
+from django.core.files.storage import default_storage
 from ninja.files import UploadedFile
 
 from apps.core.models import Album, Song, SongFeatures, SongGenres
 from apps.core.schemas import SongFeaturesSchema, SongGenresSchema
 
+from .artwork import add_artwork_thumbnails
 from .feature_extraction.song_info_extractor import SongInfoExtractor
+from .feature_extraction.stage_cache import file_sha256
+from .renditions import enqueue_renditions
+from .timeline import collect_timeline, timeline_file
+
+# outputs of the extraction pipeline a song upload needs
+EXTRACTION_OUTPUTS = ["duration_s", "genres", "gmbi_frames", "dl_features", "song_structure"]
+
+
+def upload_sha256(audio_file: UploadedFile) -> str:
+    """SHA-256 of an uploaded file, the same as Song.audio_sha256 of the stored file"""
+    sha = hashlib.sha256()
+    for chunk in audio_file.chunks():
+        sha.update(chunk)
+    audio_file.seek(0)
+    return sha.hexdigest()
 
 
 def read_json(name: str) -> dict:
@@ -54,6 +72,7 @@ def add_album_to_db(name: str, album_name: str = None, artist: str = None) -> st
     if not artwork_file:
         with open(path, "rb") as f:
             artwork_file = Album.objects.create(artwork_file=File(f, name=name), album_name=album_name, artist=artist)
+        add_artwork_thumbnails(artwork_file)
     return artwork_file.id
 
 
@@ -89,9 +108,13 @@ def add_json_to_db(name: str) -> str:
                 features=SongFeatures.objects.create(**db_song["features"]),
                 genres=SongGenres.objects.create(**db_song["genres"]),
                 audio_file=audio_file,
+                audio_sha256=file_sha256(song_path),
                 album=album,
+                # JSON files written before the timelines were stored have none
+                timeline_file=timeline_file(raw_data["timeline"]) if "timeline" in raw_data else "",
             )
             print(f"Added {song.title} from {song.artist} to db!")
+            enqueue_renditions(song)
             return song.id
 
     except FileNotFoundError as e:
@@ -118,35 +141,98 @@ def check_and_add_pre_calculated_songs_to_db() -> None:
         add_json_to_db(json_file)
 
 
-def calculate_genres_and_features(audio_file: UploadedFile) -> Tuple[SongGenresSchema, SongFeaturesSchema, float]:
-    with tempfile.NamedTemporaryFile(delete=True, suffix=os.path.splitext(audio_file.name)[1]) as tmp_file:
-        # Write uploaded file content to temporary file
-        tmp_file.write(audio_file.file.read())
-        tmp_path = tmp_file.name
-
-        song_info_extractor = SongInfoExtractor(tmp_path)
-        duration_s = song_info_extractor.get_duration()
-
-        essentia_genre_features = song_info_extractor.extract_essentia_genre_features()
-
-        genres = SongGenresSchema(
-            all_genres=essentia_genre_features["all_genres"], top3_genres=essentia_genre_features["top3_genres"]
-        )
+def extract_genres_and_features(
+    file_path: str, on_stage_start=None, on_stage_end=None
+) -> Tuple[SongGenresSchema, SongFeaturesSchema, float, dict]:
+    """
+    Run the feature extraction of an audio file
+    :param file_path: Audio file
+    :param on_stage_start: Called with the stage name when an extraction stage starts
+    :param on_stage_end: Called with the StageReport when an extraction stage is done
+    :return: Tuple of genres, features, duration in seconds and the frame timeline (see timeline.collect_timeline)
+    """
+    song_info_extractor = SongInfoExtractor(file_path)
+
+    # genre and DL stages run in parallel, GMBI waits for the DL frames it needs.
+    # Stages of a song that was extracted before come from the stage cache, the audio is not even decoded then
+    results = song_info_extractor.run_stages(
+        EXTRACTION_OUTPUTS, on_stage_start=on_stage_start, on_stage_end=on_stage_end
+    )
+    duration_s = results["duration_s"]
+
+    essentia_genre_features = results["genres"]
+
+    genres = SongGenresSchema(
+        all_genres=essentia_genre_features["all_genres"], top3_genres=essentia_genre_features["top3_genres"]
+    )
+
+    gmbi_features_frames = results["gmbi_frames"]
+
+    essentia_dl_features = results["dl_features"]
+
+    features = SongFeaturesSchema(
+        valence=gmbi_features_frames["mean"]["valence"],
+        arousal=gmbi_features_frames["mean"]["arousal"],
+        authenticity=gmbi_features_frames["mean"]["authenticity"],
+        timeliness=gmbi_features_frames["mean"]["timeliness"],
+        complexity=gmbi_features_frames["mean"]["complexity"],
+        danceability=essentia_dl_features["mean"]["danceability"],
+        tonal=essentia_dl_features["mean"]["tonal"],
+        voice=essentia_dl_features["mean"]["voice"],
+        bpm=essentia_dl_features["mean"]["bpm"],
+    )
+
+    audio_report = song_info_extractor.audio_context.report()
+    print(
+        f"decoded audio in {audio_report['decode_time_s']:.2f}s, "
+        f"saved {audio_report['saved_s']:.2f}s of decoding and resampling",
+        flush=True,
+    )
+    print(
+        "model inference: "
+        + ", ".join(f"{model} {seconds:.2f}s" for model, seconds in song_info_extractor.model_timings.items()),
+        flush=True,
+    )
+
+    return genres, features, duration_s, collect_timeline(results)
+
+
+def calculate_genres_and_features(
+    audio_file: UploadedFile,
+) -> Tuple[SongGenresSchema, SongFeaturesSchema, float, dict]:
+    # Django already spooled large uploads to disk, extract from that file instead of writing the bytes again
+    if hasattr(audio_file, "temporary_file_path"):
+        return extract_genres_and_features(audio_file.temporary_file_path())
 
-        gmbi_features_frames = song_info_extractor.extract_gmbi_features_frames()
+    with tempfile.NamedTemporaryFile(delete=True, suffix=os.path.splitext(audio_file.name)[1]) as tmp_file:
+        # Stream the uploaded file to a temporary file, in chunks so memory use does not depend on the file size
+        for chunk in audio_file.chunks():
+            tmp_file.write(chunk)
+        tmp_file.flush()
 
-        essentia_dl_features = song_info_extractor.extract_essentia_dl_features()
+        return extract_genres_and_features(tmp_file.name)
 
-        features = SongFeaturesSchema(
-            valence=gmbi_features_frames["mean"]["valence"],
-            arousal=gmbi_features_frames["mean"]["arousal"],
-            authenticity=gmbi_features_frames["mean"]["authenticity"],
-            timeliness=gmbi_features_frames["mean"]["timeliness"],
-            complexity=gmbi_features_frames["mean"]["complexity"],
-            danceability=essentia_dl_features["mean"]["danceability"],
-            tonal=essentia_dl_features["mean"]["tonal"],
-            voice=essentia_dl_features["mean"]["voice"],
-            bpm=essentia_dl_features["mean"]["bpm"],
-        )
 
-    return genres, features, duration_s
+def store_upload_and_calculate_genres_and_features(
+    audio_file: UploadedFile,
+) -> Tuple[str, SongGenresSchema, SongFeaturesSchema, float, dict]:
+    """
+    Save an uploaded song to the media storage first and extract its features from the stored file.
+    A spooled upload is moved into MEDIA_ROOT, a small in-memory one written once; the bytes are never copied again.
+    :param audio_file: Uploaded audio file
+    :return: Tuple of the stored file name (for Song.audio_file), genres, features, duration in seconds and timeline
+    """
+    name = default_storage.save(Song._meta.get_field("audio_file").generate_filename(None, audio_file.name), audio_file)
+    try:
+        path = default_storage.path(name)
+    except NotImplementedError:
+        # remote storage without local paths, extract from the upload instead
+        path = None
+    try:
+        if path is None:
+            audio_file.seek(0)
+            return (name, *calculate_genres_and_features(audio_file))
+        return (name, *extract_genres_and_features(path))
+    except Exception:
+        default_storage.delete(name)
+        raise
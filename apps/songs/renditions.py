@@ -0,0 +1,69 @@
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files import File
+from django.db import close_old_connections, transaction
+
+from apps.core.models import Song
+
+from .consts import AUDIO_RENDITIONS, FFMPEG_PATH, RENDITION_PRESETS, RENDITION_WORKERS
+
+rendition_executor = ThreadPoolExecutor(max_workers=max(1, RENDITION_WORKERS), thread_name_prefix="rendition")
+
+
+def transcode(source: str, target: str, preset: dict):
+    """
+    Transcode an audio file with ffmpeg, without video streams (embedded cover art)
+    :param source: Audio file
+    :param target: Output file, its extension selects the container
+    :param preset: Entry of RENDITION_PRESETS
+    """
+    from ffmpeg import FFmpeg
+
+    FFmpeg(executable=FFMPEG_PATH).option("y").input(source).output(
+        target, {"codec:a": preset["codec"], "b:a": preset["bitrate"]}, vn=None
+    ).execute()
+
+
+def rendition_name(audio_name: str, rendition: str) -> str:
+    """Storage name of a rendition, next to the original: Audio/track.mp3 -> Audio/track.opus_64.opus"""
+    return f"{os.path.splitext(audio_name)[0]}.{rendition}.{RENDITION_PRESETS[rendition]['extension']}"
+
+
+def create_renditions(song_id, renditions=None) -> dict:
+    """
+    Generate the missing streaming renditions of a song and store them in Song.renditions
+    :param song_id: Song id
+    :param renditions: Names in RENDITION_PRESETS, AUDIO_RENDITIONS by default
+    :return: Rendition name -> storage name of the renditions the song has (the generated ones if one failed)
+    """
+    close_old_connections()
+    stored = {}
+    try:
+        song = Song.objects.get(id=song_id)
+        storage = song.audio_file.storage
+        stored = dict(song.renditions)
+        for rendition in renditions if renditions is not None else AUDIO_RENDITIONS:
+            if rendition in stored:
+                continue
+            name = rendition_name(song.audio_file.name, rendition)
+            with tempfile.TemporaryDirectory() as directory:
+                target = os.path.join(directory, os.path.basename(name))
+                transcode(song.audio_file.path, target, RENDITION_PRESETS[rendition])
+                with open(target, "rb") as file:
+                    stored[rendition] = storage.save(name, File(file))
+            # written after every rendition, clients can use the first one while the next is transcoded
+            Song.objects.filter(id=song_id).update(renditions=stored)
+        return stored
+    except Exception as e:
+        print(f"Renditions of song {song_id} failed: {type(e).__name__}: {e}", flush=True)
+        return stored
+    finally:
+        close_old_connections()
+
+
+def enqueue_renditions(song: Song):
+    """Generate the renditions of a saved song in the background once the current transaction is committed."""
+    if AUDIO_RENDITIONS:
+        transaction.on_commit(lambda: rendition_executor.submit(create_renditions, song.id))
@@ -1,5 +1,65 @@
-from typing import Optional
+from datetime import datetime
+from typing import Dict, List, Optional
+from uuid import UUID
+
+from ninja import Field, Schema
+
 from apps.core.schemas import SongSchema, AlbumSchema
 
 class AlbumDetailSchema(AlbumSchema):
     songs: Optional[list[SongSchema]] = None
+
+
+class ExtractionStageSchema(Schema):
+    status: str
+    time_s: Optional[float] = None
+    cached: Optional[bool] = None
+
+
+class ExtractionJobSchema(Schema):
+    id: UUID
+    status: str
+    title: str
+    artist: str
+    stages: Dict[str, ExtractionStageSchema]
+    error: str
+    song: Optional[SongSchema] = None
+    created_at: datetime
+    updated_at: datetime
+
+
+class SongUploadSchema(SongSchema):
+    # the same file was uploaded before: this is that song, the title, artist and album of the upload are not applied
+    existing: bool = False
+
+
+class JobAcceptedSchema(Schema):
+    job_id: UUID = Field(..., alias="id")
+    status: str
+    status_url: str
+    # the same file is already being extracted: this is that job, the title, artist and album of the upload are not
+    # applied
+    existing: bool = False
+
+    @staticmethod
+    def resolve_status_url(obj, context) -> str:
+        return f"{context['request'].path.rstrip('/')}/jobs/{obj.id}"
+
+
+class TimelineColumnSchema(Schema):
+    # seconds per frame and start of the first returned frame
+    frame_s: float
+    start_s: float
+    values: List[float]
+
+
+class SongStructureSchema(Schema):
+    # segment boundaries in seconds (with 0 and the duration) and one label per segment
+    boundaries: List[float]
+    labels: List[int]
+
+
+class SongTimelineSchema(Schema):
+    duration_s: float
+    columns: Dict[str, TimelineColumnSchema]
+    structure: Optional[SongStructureSchema] = None
@@ -0,0 +1,123 @@
+import json
+import math
+import struct
+import uuid
+from typing import Dict, List, Optional
+
+import numpy as np
+from django.core.files.base import ContentFile
+
+# Frame timeline file: header, JSON index, then every column as float16 values one after the other.
+# The index holds the offset (in values), length and frame duration of every column and the song structure,
+# so a time range of a column is read through a memory map without loading the file.
+TIMELINE_MAGIC = b"RMTL"
+TIMELINE_VERSION = 1
+TIMELINE_DTYPE = np.dtype("<f2")
+# magic, version, length of the JSON index in bytes
+_HEADER = struct.Struct("<4sHI")
+# the columns start at a multiple of this
+_DATA_ALIGNMENT = 64
+# prefix of the top 3 genre columns, e.g. "genre:rock"
+GENRE_COLUMN_PREFIX = "genre:"
+
+
+def collect_timeline(results: dict) -> dict:
+    """
+    Frame level features of the extraction stages, in the format of the "timeline" of the pre-calc JSON files
+    :param results: Stage results with duration_s, gmbi_frames, dl_features, genres and song_structure
+    :return: Dictionary with the duration, the columns (name -> frame values) and the song structure
+    """
+    columns = dict(results["gmbi_frames"]["frames"])
+    columns.update(results["dl_features"]["frames"])
+    for genre, frames in results["genres"]["top3_genres_frames"].items():
+        columns[GENRE_COLUMN_PREFIX + genre] = frames
+    boundaries, labels = results["song_structure"]
+    return {
+        "duration_s": results["duration_s"],
+        "columns": columns,
+        "structure": {"boundaries": list(boundaries), "labels": list(labels)},
+    }
+
+
+def encode_timeline(timeline: dict) -> bytes:
+    """
+    :param timeline: Timeline as returned by collect_timeline
+    :return: Content of the timeline file
+    """
+    duration_s = float(timeline["duration_s"])
+    columns, offset = {}, 0
+    arrays = []
+    for name, frames in timeline["columns"].items():
+        values = np.asarray(frames, dtype=TIMELINE_DTYPE)
+        columns[name] = {
+            "offset": offset,
+            "length": len(values),
+            "frame_s": duration_s / len(values) if len(values) else 0.0,
+        }
+        arrays.append(values)
+        offset += len(values)
+
+    index = json.dumps(
+        {"duration_s": duration_s, "columns": columns, "structure": timeline.get("structure")},
+        default=float,
+    ).encode("utf-8")
+    data_offset = _data_offset(len(index))
+    header = _HEADER.pack(TIMELINE_MAGIC, TIMELINE_VERSION, len(index)) + index
+    return header + b"\0" * (data_offset - len(header)) + b"".join(values.tobytes() for values in arrays)
+
+
+def timeline_file(timeline: dict) -> ContentFile:
+    """Timeline file for Song.timeline_file, with a unique name"""
+    return ContentFile(encode_timeline(timeline), name=f"{uuid.uuid4().hex}.timeline")
+
+
+def _data_offset(index_length: int) -> int:
+    return -(-(_HEADER.size + index_length) // _DATA_ALIGNMENT) * _DATA_ALIGNMENT
+
+
+def read_timeline_index(path: str) -> dict:
+    """
+    :param path: Timeline file
+    :return: Index of the file, with the offset of the column data in data_offset
+    """
+    with open(path, "rb") as file:
+        magic, version, index_length = _HEADER.unpack(file.read(_HEADER.size))
+        if magic != TIMELINE_MAGIC or version != TIMELINE_VERSION:
+            raise ValueError(f"Not a timeline file (version {TIMELINE_VERSION}): {path}")
+        index = json.loads(file.read(index_length).decode("utf-8"))
+    index["data_offset"] = _data_offset(index_length)
+    return index
+
+
+def read_timeline(path: str, names: Optional[List[str]] = None, start_s: float = 0.0, end_s: float = None) -> dict:
+    """
+    Read a time range of the columns of a timeline file, only the pages of the range are loaded
+    :param path: Timeline file
+    :param names: Columns, None reads all
+    :param start_s: Start of the range in seconds
+    :param end_s: End of the range in seconds, None reads until the end
+    :return: Dictionary with the duration, the columns (name -> frame_s, start_s and values) and the song structure
+    """
+    index = read_timeline_index(path)
+    if names is None:
+        names = list(index["columns"])
+    unknown = [name for name in names if name not in index["columns"]]
+    if unknown:
+        raise KeyError(f"Unknown timeline columns: {', '.join(unknown)}")
+    if end_s is None:
+        end_s = index["duration_s"]
+
+    columns: Dict[str, dict] = {}
+    total = sum(column["length"] for column in index["columns"].values())
+    data = np.memmap(path, dtype=TIMELINE_DTYPE, mode="r", offset=index["data_offset"], shape=(total,)) if total else None
+    for name in names:
+        column = index["columns"][name]
+        frame_s = column["frame_s"]
+        first, last = 0, 0
+        if frame_s > 0:
+            # frames overlapping the range
+            first = min(column["length"], max(0, math.floor(start_s / frame_s)))
+            last = min(column["length"], max(first, math.ceil(end_s / frame_s)))
+        values = data[column["offset"] + first : column["offset"] + last] if last > first else np.empty(0)
+        columns[name] = {"frame_s": frame_s, "start_s": first * frame_s, "values": values.astype(float).tolist()}
+    return {"duration_s": index["duration_s"], "columns": columns, "structure": index["structure"]}
@@ -101,6 +101,24 @@ if not MEDIA_URL or not MEDIA_ROOT:
         "MEDIA_URL and MEDIA_ROOT environment variables must be set. Please provide values for MEDIA_URL and MEDIA_ROOT."
     )
 
+# Large uploads are spooled here and moved into MEDIA_ROOT when saved. On the same filesystem as MEDIA_ROOT that move
+# is a rename instead of a copy. Defaults to the system temp directory.
+FILE_UPLOAD_TEMP_DIR = os.getenv("FILE_UPLOAD_TEMP_DIR") or None
+
+# Directories below MEDIA_ROOT that serve_media serves (audio with its renditions, album art with its thumbnails and
+# the timelines). Anything else, e.g. FILE_UPLOAD_TEMP_DIR or the uploads of running extraction jobs, is a 404.
+MEDIA_PUBLIC_PREFIXES = ("Audio/", "Album_Art/", "Timelines/")
+# Media files (audio, artwork) are served by apps.core.views.serve_media. Clients may cache them this long (seconds),
+# a stored file never changes under its name.
+MEDIA_CACHE_MAX_AGE = int(os.getenv("MEDIA_CACHE_MAX_AGE", "31536000"))
+# "x-accel-redirect" (nginx) or "x-sendfile" (Apache, lighttpd) hands the file to the front proxy instead of streaming
+# it from the Python workers, empty serves it from Django.
+MEDIA_FRONT_PROXY = os.getenv("MEDIA_FRONT_PROXY", "").lower()
+if MEDIA_FRONT_PROXY not in ("", "x-accel-redirect", "x-sendfile"):
+    raise RuntimeError("MEDIA_FRONT_PROXY must be empty, x-accel-redirect or x-sendfile.")
+# internal nginx location aliased to MEDIA_ROOT, for x-accel-redirect
+MEDIA_X_ACCEL_PREFIX = os.getenv("MEDIA_X_ACCEL_PREFIX", "/protected-media/")
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
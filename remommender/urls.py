@@ -15,12 +15,16 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
+import re
+from urllib.parse import urlsplit
+
 from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import path
+from django.urls import path, re_path
 from ninja import NinjaAPI
 
+from apps.core.views import serve_media
+from apps.recommendations.admission import ClientDisconnected, ServiceOverloaded
 from apps.recommendations.api import router as recommendations_router
 from apps.session.api import router as session_router
 from apps.songs.api import songs_router, albums_router
@@ -31,6 +35,20 @@ api = NinjaAPI(
     description="Thanks for reading the documentation!",
 )
 
+
+@api.exception_handler(ServiceOverloaded)
+def service_overloaded(request, exc: ServiceOverloaded):
+    response = api.create_response(request, {"detail": str(exc)}, status=503)
+    response["Retry-After"] = str(exc.retry_after_s)
+    return response
+
+
+@api.exception_handler(ClientDisconnected)
+def client_disconnected(request, exc: ClientDisconnected):
+    # nobody reads this response, 499 only marks the request in the logs
+    return api.create_response(request, {"detail": "Client closed the request."}, status=499)
+
+
 api.add_router("/recommend/", recommendations_router)
 api.add_router("/session/", session_router)
 api.add_router("/songs/", songs_router)
@@ -39,4 +57,8 @@ api.add_router("/albums/", albums_router)
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("", api.urls),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
+
+# media on another host (a CDN) is not served from here
+if not urlsplit(settings.MEDIA_URL).netloc:
+    urlpatterns.append(re_path(r"^%s(?P<path>.*)$" % re.escape(settings.MEDIA_URL.lstrip("/")), serve_media))
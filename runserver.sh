@@ -39,6 +39,9 @@ echo "<< Updating the database schema >>"
 # python manage.py makemigrations --no-input
 python manage.py migrate --no-input
 
+echo "<< Recover the extraction jobs of the last run >>"
+python manage.py recover_extraction_jobs
+
 echo "<< Check pre calculated data >>"
 
 if [[ -n "$PRE_CALC_JSON_PATH" && -n "$PRE_CALC_AUDIO_PATH" && -n "$PRE_CALC_ALBUM_ART_PATH" ]]; then